@@ -7,10 +7,71 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hydro.settings')
+# Every ASGI request queries from a new thread with a connection of its own,
+# persistent connections would only pile up. Pool them with PgBouncer instead.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+
+class ConcurrencyLimit:
+    """Hold back HTTP requests beyond `limit` until a running one has finished.
+
+    Async views still run their queries in a thread of the request, each with
+    a database connection of its own, so a thousand concurrent requests would
+    open a thousand connections. A slot is given back with the last part of
+    the body, streamed exports keep reading from the database until then.
+    Only event streams give it back once their headers are sent, they would
+    hold it for minutes otherwise.
+    """
+
+    def __init__(self, app, limit: int):
+        self.app = app
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        await self.semaphore.acquire()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.semaphore.release()
+
+        async def send_and_release(message):
+            await send(message)
+            if message["type"] == "http.response.start":
+                if any(
+                    name.lower() == b"content-type"
+                    and value.startswith(b"text/event-stream")
+                    for name, value in message["headers"]
+                ):
+                    release()
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                release()
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            release()
+
+
+application = django_application
+if settings.ASGI_MAX_CONCURRENT_REQUESTS:
+    application = ConcurrencyLimit(
+        django_application, settings.ASGI_MAX_CONCURRENT_REQUESTS
+    )
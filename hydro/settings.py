@@ -84,13 +84,27 @@ WSGI_APPLICATION = "hydro.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
-        "NAME": "hydro",
-        "USER": "postgres",
+        "NAME": os.environ.get("DB_NAME", "hydro"),
+        "USER": os.environ.get("DB_USER", "postgres"),
         "HOST": os.environ.get("DB_HOST", "localhost"),
-        "PASSWORD": "hydro",
-        "PORT": "5432",
+        "PASSWORD": os.environ.get("DB_PASSWORD", "hydro"),
+        "PORT": os.environ.get("DB_PORT", "5432"),
+        # Seconds a connection is reused across requests, 0 closes it after
+        # every request. hydro.asgi defaults it to 0, see there.
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        # Check a reused connection before the first query of a request, so a
+        # database restart costs a reconnect instead of a failed request.
+        "CONN_HEALTH_CHECKS": os.environ.get("DB_CONN_HEALTH_CHECKS", "1") == "1",
+        # PgBouncer in transaction mode can't keep cursors open between
+        # transactions. Streamed exports then hold their whole result in memory.
+        "DISABLE_SERVER_SIDE_CURSORS": os.environ.get("DB_PGBOUNCER") == "1",
+        "OPTIONS": {"connect_timeout": int(os.environ.get("DB_CONNECT_TIMEOUT", 5))},
     },
 }
+if os.environ.get("DB_PGBOUNCER") == "1":
+    # Prepared statements belong to a server connection, and the next
+    # transaction may run on another one.
+    DATABASES["default"]["OPTIONS"]["prepare_threshold"] = None
 
 
 # Password validation
@@ -142,6 +156,25 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
 }
 
+# Cache
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+RESPONSE_CACHE_TIMEOUT = 300
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
@@ -156,3 +189,71 @@ AUTH_USER_MODEL = "users.User"
 
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
+
+# Measurements ingestion
+
+MEASUREMENT_BULK_MAX_SIZE = 10000
+MEASUREMENT_BULK_BATCH_SIZE = 1000
+MEASUREMENT_PAGE_MAX_SIZE = 10000
+MEASUREMENT_STREAM_CHUNK_SIZE = 2000
+MEASUREMENT_AGGREGATE_MAX_BUCKETS = 50000
+MEASUREMENT_AGGREGATE_MAX_POINTS = 10000
+MEASUREMENT_ROLLUP_BATCH_SIZE = 100000
+MEASUREMENT_ROLLUP_OVERLAP = 10000
+MEASUREMENT_PARTITION_MONTHS = 1
+MEASUREMENT_PARTITIONS_AHEAD = 3
+MEASUREMENT_RETENTION_BATCH_SIZE = 10000
+MEASUREMENT_IMPORT_CHUNK_SIZE = 50000
+
+SYSTEM_DETAIL_MAX_MEASUREMENTS = 100
+
+# Measurement events
+
+MEASUREMENT_EVENTS_REDIS_URL = os.environ.get("MEASUREMENT_EVENTS_REDIS_URL")
+MEASUREMENT_EVENTS_QUEUE_SIZE = 100
+MEASUREMENT_EVENTS_KEEPALIVE = 15
+MEASUREMENT_EVENTS_MAX_AGE = 300
+
+# Ingestion queue
+
+# Accept readings with 202 and leave writing them to drain_measurement_queue.
+MEASUREMENT_QUEUE_ENABLED = os.environ.get("MEASUREMENT_QUEUE_ENABLED") == "1"
+# A Redis stream when set, otherwise an append-only log in MEASUREMENT_QUEUE_PATH.
+MEASUREMENT_QUEUE_REDIS_URL = os.environ.get("MEASUREMENT_QUEUE_REDIS_URL")
+MEASUREMENT_QUEUE_PATH = Path(
+    os.environ.get("MEASUREMENT_QUEUE_PATH", BASE_DIR / "queue")
+)
+MEASUREMENT_QUEUE_FSYNC = True
+MEASUREMENT_QUEUE_BATCH_SIZE = 10000
+MEASUREMENT_QUEUE_POLL_INTERVAL = 0.5
+
+# Serialization
+
+# Build hot listings straight from database rows instead of DRF serializers.
+FAST_SERIALIZATION = True
+
+# Gateway keys
+
+# Seconds a verified key is trusted without a query, the longest a revocation
+# takes to reach other processes.
+GATEWAY_KEY_CACHE_TTL = 60
+
+# Rate limits
+
+# Token buckets as (requests per second, burst) of every user and of every
+# system, which the gateway keys of the system share. Requests over budget get
+# 429 with Retry-After. RATE_LIMITS_ENABLED=0 turns them off.
+RATE_LIMITS = {
+    "ingest": {"user": (100, 1000), "system": (20, 200)},
+    "read": {"user": (20, 200)},
+}
+if os.environ.get("RATE_LIMITS_ENABLED", "1") != "1":
+    RATE_LIMITS = {}
+# Buckets shared through Redis when set, otherwise every process keeps its own.
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL")
+
+# ASGI
+
+# Requests served at once by one ASGI worker, keep workers times this below the
+# max_connections of the database. 0 disables the limit.
+ASGI_MAX_CONCURRENT_REQUESTS = int(os.environ.get("ASGI_MAX_CONCURRENT_REQUESTS", 50))
@@ -0,0 +1,90 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from hydro.asgi import ConcurrencyLimit
+
+HTTP_SCOPE = {"type": "http", "method": "GET", "path": "/"}
+
+
+def response_start(content_type: bytes) -> dict:
+    return {
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"Content-Type", content_type)],
+    }
+
+
+class ConcurrencyLimitTest(SimpleTestCase):
+    async def receive(self):
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(self, message):
+        pass
+
+    async def test_slot_is_released_after_last_body_part(self):
+        locked = []
+
+        async def app(scope, receive, send):
+            await send(response_start(b"application/x-ndjson"))
+            locked.append(limit.semaphore.locked())
+            await send({"type": "http.response.body", "body": b"1", "more_body": True})
+            locked.append(limit.semaphore.locked())
+            await send({"type": "http.response.body", "body": b"2"})
+            locked.append(limit.semaphore.locked())
+
+        limit = ConcurrencyLimit(app, 1)
+        await limit(HTTP_SCOPE, self.receive, self.send)
+
+        assert locked == [True, True, False]
+
+    async def test_event_stream_releases_slot_after_headers(self):
+        locked = []
+
+        async def app(scope, receive, send):
+            await send(response_start(b"text/event-stream; charset=utf-8"))
+            locked.append(limit.semaphore.locked())
+            await send({"type": "http.response.body", "body": b"", "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        limit = ConcurrencyLimit(app, 1)
+        await limit(HTTP_SCOPE, self.receive, self.send)
+
+        assert locked == [False]
+        assert not limit.semaphore.locked()
+
+    async def test_slot_is_released_when_app_raises(self):
+        async def app(scope, receive, send):
+            await send(response_start(b"application/json"))
+            raise RuntimeError("view failed")
+
+        limit = ConcurrencyLimit(app, 1)
+        with self.assertRaises(RuntimeError):
+            await limit(HTTP_SCOPE, self.receive, self.send)
+
+        assert not limit.semaphore.locked()
+
+    async def test_requests_beyond_limit_wait(self):
+        started = []
+        finish = asyncio.Event()
+
+        async def app(scope, receive, send):
+            started.append(scope["path"])
+            await finish.wait()
+            await send(response_start(b"application/json"))
+            await send({"type": "http.response.body", "body": b"{}"})
+
+        limit = ConcurrencyLimit(app, 2)
+        requests = [
+            asyncio.create_task(
+                limit({**HTTP_SCOPE, "path": f"/{index}"}, self.receive, self.send)
+            )
+            for index in range(3)
+        ]
+        await asyncio.sleep(0)
+        assert started == ["/0", "/1"]
+
+        finish.set()
+        await asyncio.gather(*requests)
+        assert started == ["/0", "/1", "/2"]
+        assert not limit.semaphore.locked()
@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import Count, DateTimeField, Func, Max, Min, QuerySet, Sum, Value
+
+INTERVALS = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+BUCKET_ORIGIN = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+# Resolutions of MeasurementRollup, coarsest first.
+ROLLUP_RESOLUTIONS = ["1d", "1h"]
+
+
+class DateBin(Func):
+    """Start of the `stride` long bucket containing the timestamp (Postgres 14+)."""
+
+    function = "DATE_BIN"
+    output_field = DateTimeField()
+
+    def __init__(self, stride: timedelta, expression, **extra):
+        super().__init__(Value(stride), expression, Value(BUCKET_ORIGIN), **extra)
+
+
+class Last(Func):
+    """Value of the newest row in the group."""
+
+    template = "(%(expressions)s)[1]"
+
+    def __init__(self, expression, ordering: str = "-measured_at", **extra):
+        super().__init__(ArrayAgg(expression, ordering=ordering), **extra)
+
+    def _resolve_output_field(self):
+        return self.source_expressions[0].output_field.base_field
+
+
+def aggregate_measurements(measurements: QuerySet, interval: str) -> QuerySet:
+    """Group measurements into per-sensor time buckets, computed by the database."""
+    return (
+        measurements.annotate(bucket_start=DateBin(INTERVALS[interval], "measured_at"))
+        .values("sensor_id", "bucket_start")
+        .annotate(
+            min=Min("value"),
+            max=Max("value"),
+            sum=Sum("value"),
+            count=Count("value"),
+            last=Last("value"),
+            last_measured_at=Max("measured_at"),
+        )
+        .order_by("sensor_id", "bucket_start")
+    )
+
+
+def aggregate_rollups(rollups: QuerySet, interval: str) -> QuerySet:
+    """Group rollup rows into per-sensor buckets of an interval they divide."""
+    return (
+        rollups.annotate(bucket_start=DateBin(INTERVALS[interval], "bucket"))
+        .values("sensor_id", "bucket_start")
+        .annotate(
+            min=Min("min"),
+            max=Max("max"),
+            sum=Sum("sum"),
+            count=Sum("count"),
+            last=Last("last", ordering="-last_measured_at"),
+            last_measured_at=Max("last_measured_at"),
+        )
+        .order_by("sensor_id", "bucket_start")
+    )
+
+
+def select_rollup(
+    interval: str, since: datetime | None, until: datetime | None
+) -> str | None:
+    """Return the coarsest rollup resolution able to answer the query exactly.
+
+    Its buckets have to divide the requested interval and the time range must
+    start and end on bucket boundaries, otherwise raw measurements are used.
+    """
+    stride = INTERVALS[interval]
+    for resolution in ROLLUP_RESOLUTIONS:
+        resolution_stride = INTERVALS[resolution]
+        if stride % resolution_stride:
+            continue
+        if any(
+            bound and (bound - BUCKET_ORIGIN) % resolution_stride
+            for bound in (since, until)
+        ):
+            continue
+        return resolution
+    return None
+
+
+def merge_buckets(*bucket_lists) -> list[dict]:
+    """Combine partial aggregates of the same sensor and bucket, adding averages."""
+    merged = {}
+    for buckets in bucket_lists:
+        for bucket in buckets:
+            key = (bucket["sensor_id"], bucket["bucket_start"])
+            current = merged.get(key)
+            if not current or not current["count"]:
+                merged[key] = dict(bucket)
+                continue
+            if not bucket["count"]:
+                continue
+
+            current["min"] = min(current["min"], bucket["min"])
+            current["max"] = max(current["max"], bucket["max"])
+            current["sum"] += bucket["sum"]
+            current["count"] += bucket["count"]
+            if bucket["last_measured_at"] > current["last_measured_at"]:
+                current["last"] = bucket["last"]
+                current["last_measured_at"] = bucket["last_measured_at"]
+
+    buckets = [merged[key] for key in sorted(merged)]
+    for bucket in buckets:
+        bucket["avg"] = bucket["sum"] / bucket["count"] if bucket["count"] else None
+    return buckets
+
+
+def lttb(points: list[tuple], threshold: int) -> list[tuple]:
+    """Downsample (datetime, value) points with Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last point and, from every bucket in between, the point
+    forming the largest triangle with the previously kept point and the average
+    of the next bucket, which preserves the visual shape of the series.
+    """
+    if threshold >= len(points) or threshold < 3:
+        return points
+
+    xs = [point[0].timestamp() for point in points]
+    ys = [float(point[1]) if point[1] is not None else 0.0 for point in points]
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, len(points))
+        next_count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / next_count
+        avg_y = sum(ys[next_start:next_end]) / next_count
+
+        largest_area = -1
+        selected = start
+        for index in range(start, end):
+            area = abs(
+                (xs[previous] - avg_x) * (ys[index] - ys[previous])
+                - (xs[previous] - xs[index]) * (avg_y - ys[previous])
+            )
+            if area > largest_area:
+                largest_area = area
+                selected = index
+
+        sampled.append(points[selected])
+        previous = selected
+
+    sampled.append(points[-1])
+    return sampled
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class SensorsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "sensors"
+
+    def ready(self):
+        from .events import publish_measurements
+        from .signals import measurements_ingested
+
+        measurements_ingested.connect(publish_measurements)
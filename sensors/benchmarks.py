@@ -0,0 +1,248 @@
+"""Benchmark scenarios of measurement ingestion, storage and reads.
+
+Run by `manage.py benchmark`, which passes itself as `command` with the
+benchmark system, its sensors and the reporting helpers.
+"""
+
+import asyncio
+import random
+import time
+from datetime import timedelta
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .aggregation import aggregate_measurements, aggregate_rollups
+from .events import get_broker, system_topic
+from .models import Measurement, MeasurementRollup, Sensor
+from .queue import get_queue
+from .renderers import (
+    ColumnarJSONRenderer,
+    CSVRenderer,
+    MessagePackRenderer,
+    ORJSONRenderer,
+)
+from .rows import measurement_columns, measurement_dicts, measurement_rows
+from .serializers import MeasurementSerializer
+from .views import MeasurementBulkCreateView, MeasurementCreateView
+
+
+def benchmark_ingest(command, rows: int):
+    payload = [
+        {
+            "sensor_id": random.choice(command.sensors).id,
+            "value": round(random.uniform(0, 14), 2),
+        }
+        for _ in range(rows)
+    ]
+
+    view = MeasurementCreateView.as_view()
+    start = time.perf_counter()
+    for row in payload:
+        command.call_view(view, "/sensors/measurement/", row, id=command.system.id)
+    command.report("Single-row endpoint", rows, time.perf_counter() - start)
+
+    view = MeasurementBulkCreateView.as_view()
+    start = time.perf_counter()
+    command.call_view(view, "/sensors/measurement/bulk/", {"measurements": payload})
+    command.report("Bulk endpoint", rows, time.perf_counter() - start)
+
+
+def benchmark_queue(command, rows: int):
+    payload = [
+        {
+            "sensor_id": random.choice(command.sensors).id,
+            "value": round(random.uniform(0, 14), 2),
+        }
+        for _ in range(rows)
+    ]
+    view = MeasurementCreateView.as_view()
+    start = time.perf_counter()
+    for row in payload:
+        command.call_view(view, "/sensors/measurement/", row, id=command.system.id)
+    command.report("Direct writes", rows, time.perf_counter() - start)
+
+    # An isolated log, the benchmark readings never reach a shared queue.
+    with TemporaryDirectory() as directory, override_settings(
+        MEASUREMENT_QUEUE_ENABLED=True,
+        MEASUREMENT_QUEUE_REDIS_URL=None,
+        MEASUREMENT_QUEUE_PATH=directory,
+    ):
+        get_queue.cache_clear()
+        try:
+            start = time.perf_counter()
+            for row in payload:
+                command.call_view(
+                    view, "/sensors/measurement/", row, id=command.system.id
+                )
+            command.report("Queued writes", rows, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            call_command("drain_measurement_queue", "--once", stdout=StringIO())
+            command.report("Queue drain", rows, time.perf_counter() - start)
+        finally:
+            get_queue.cache_clear()
+
+
+def benchmark_rollup(command, rows: int):
+    command.create_history(rows)
+    measurements = Measurement.objects.filter(sensor__system=command.system)
+    rollups = MeasurementRollup.objects.filter(sensor__system=command.system)
+
+    start = time.perf_counter()
+    call_command("rollup_measurements", stdout=command.stdout)
+    command.report("Rollup refresh", rows, time.perf_counter() - start)
+
+    for interval in ["1h", "1d"]:
+        start = time.perf_counter()
+        buckets = list(aggregate_measurements(measurements, interval))
+        raw_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        list(aggregate_rollups(rollups.filter(resolution=interval), interval))
+        rollup_elapsed = time.perf_counter() - start
+        command.stdout.write(
+            f"{len(buckets)} {interval} buckets: raw {raw_elapsed * 1000:.1f}ms, "
+            f"rollup {rollup_elapsed * 1000:.1f}ms"
+        )
+
+
+def benchmark_storage(command, rows: int):
+    command.create_history(rows)
+    measurements = Measurement.objects.filter(sensor__system=command.system)
+    table = Measurement._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT AVG(pg_column_size(measurement.value)),
+                AVG(pg_column_size(measurement.*))
+            FROM {table} measurement
+            JOIN {Sensor._meta.db_table} sensor ON sensor.id = measurement.sensor_id
+            WHERE sensor.system_id = %s
+            """,
+            [command.system.id],
+        )
+        value_size, row_size = cursor.fetchone()
+        # Whole table including other data, partitions are summed up.
+        cursor.execute(
+            "SELECT SUM(pg_table_size(relid)), SUM(pg_indexes_size(relid)) "
+            "FROM pg_partition_tree(%s::regclass)",
+            [table],
+        )
+        table_size, index_size = cursor.fetchone()
+    command.stdout.write(
+        f"Average value {value_size:.1f} bytes, row {row_size:.1f} bytes"
+    )
+    command.stdout.write(
+        f"Measurements table {table_size / 2**20:.1f}MB, "
+        f"indexes {index_size / 2**20:.1f}MB"
+    )
+
+    start = time.perf_counter()
+    JSONRenderer().render(MeasurementSerializer(measurements, many=True).data)
+    command.report("JSON serialization", rows, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    list(aggregate_measurements(measurements, "1h"))
+    command.report("Hourly aggregation", rows, time.perf_counter() - start)
+
+
+def benchmark_serialization(command, rows: int):
+    command.create_history(rows)
+    measurements = Measurement.objects.filter(sensor__system=command.system).order_by(
+        "measured_at", "id"
+    )
+    for size in [1000, 10000, 100000]:
+        if size > rows:
+            break
+        # Rows are fetched up front, only building and rendering is timed.
+        instances = list(measurements[:size])
+        tuples = list(measurement_rows(measurements[:size]))
+
+        start = time.perf_counter()
+        JSONRenderer().render(MeasurementSerializer(instances, many=True).data)
+        serializer = time.perf_counter() - start
+        command.report(f"Serializer {size}", size, serializer)
+
+        start = time.perf_counter()
+        ORJSONRenderer().render(list(measurement_dicts(tuples)))
+        fast = time.perf_counter() - start
+        command.report(f"Fast path {size}", size, fast)
+        command.stdout.write(f"Fast path speedup {size}: {serializer / fast:.1f}x")
+
+        columns = measurement_columns(tuples)
+        for renderer in [
+            ColumnarJSONRenderer(),
+            CSVRenderer(),
+            MessagePackRenderer(),
+        ]:
+            start = time.perf_counter()
+            content = renderer.render({"next": None, "columns": columns})
+            elapsed = time.perf_counter() - start
+            command.stdout.write(
+                f"{renderer.format} {size}: {len(content) / size:.1f} bytes per row, "
+                f"rendered in {elapsed * 1000:.1f}ms"
+            )
+        content = ORJSONRenderer().render(list(measurement_dicts(tuples)))
+        command.stdout.write(f"json {size}: {len(content) / size:.1f} bytes per row")
+
+
+def benchmark_events(command, rows: int, batch_size: int = 100):
+    asyncio.run(fan_out(command, rows, batch_size))
+
+
+async def fan_out(command, rows: int, batch_size: int):
+    broker = get_broker()
+    topic = system_topic(command.system.id)
+    subscriptions = [broker.subscribe(topic) for _ in range(command.subscribers)]
+    batches = -(-rows // batch_size)
+
+    async def consume(subscription):
+        for _ in range(batches):
+            if await subscription.queue.get() is None:
+                return
+
+    # Every tenth subscriber is a stalled client that never reads.
+    consumers = [
+        asyncio.create_task(consume(subscription))
+        for index, subscription in enumerate(subscriptions)
+        if index % 10
+    ]
+
+    start = time.perf_counter()
+    await asyncio.to_thread(ingest_batches, command, rows, batch_size)
+    command.report("Ingest with publishing", rows, time.perf_counter() - start)
+    await asyncio.gather(*consumers)
+    elapsed = time.perf_counter() - start
+
+    for subscription in subscriptions:
+        broker.unsubscribe(subscription)
+    dropped = sum(subscription.dropped for subscription in subscriptions)
+    command.stdout.write(
+        f"{batches} events to {command.subscribers} subscribers delivered in "
+        f"{elapsed:.3f}s ({len(consumers) * batches / elapsed:.0f} events/s), "
+        f"{dropped} slow subscribers dropped"
+    )
+
+
+def ingest_batches(command, rows: int, batch_size: int):
+    now = timezone.now()
+    try:
+        for start in range(0, rows, batch_size):
+            Measurement.objects.ingest(
+                [
+                    Measurement(
+                        sensor=command.sensors[index % len(command.sensors)],
+                        value=round(random.uniform(0, 14), 2),
+                        measured_at=now + timedelta(seconds=index),
+                    )
+                    for index in range(start, min(start + batch_size, rows))
+                ]
+            )
+    finally:
+        connections.close_all()
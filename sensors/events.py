@@ -0,0 +1,159 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import cache
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import Measurement, Sensor
+
+REDIS_CHANNEL = "hydro:measurements"
+
+value_field = serializers.DecimalField(max_digits=9, decimal_places=2)
+measured_at_field = serializers.DateTimeField()
+
+
+class Subscription:
+    """Bounded queue of messages for one client, owned by its event loop."""
+
+    def __init__(self, topic: str, size: int):
+        self.topic = topic
+        self.queue = asyncio.Queue(size)
+        self.loop = asyncio.get_running_loop()
+        self.dropped = False
+
+    def put(self, message: str):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client that can't keep up is disconnected instead of buffering
+            # without limit or slowing down everybody else.
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class Broker:
+    """Fan out messages to the subscriptions of this process.
+
+    Publishing never blocks, messages are handed over to the event loop of every
+    subscription, so it is safe to publish from the synchronous request threads.
+    """
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, topic: str) -> Subscription:
+        """Subscribe to a topic, must be called from a running event loop."""
+        subscription = Subscription(topic, settings.MEASUREMENT_EVENTS_QUEUE_SIZE)
+        with self.lock:
+            self.subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            subscriptions = self.subscriptions[subscription.topic]
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.topic]
+
+    def publish(self, messages: dict[str, str]):
+        """Send every topic its message."""
+        self.dispatch(messages)
+
+    def dispatch(self, messages: dict[str, str]):
+        with self.lock:
+            deliveries = [
+                (subscription, message)
+                for topic, message in messages.items()
+                for subscription in self.subscriptions.get(topic, ())
+            ]
+        for subscription, message in deliveries:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # The event loop of the subscription is already closed.
+                self.unsubscribe(subscription)
+
+
+class RedisBroker(Broker):
+    """Broker publishing through Redis pub/sub to the subscriptions of all processes.
+
+    Every process listens on one channel and fans the messages out locally.
+    """
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.listener = None
+
+    def subscribe(self, topic: str) -> Subscription:
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+        return super().subscribe(topic)
+
+    def publish(self, messages: dict[str, str]):
+        self.client.publish(REDIS_CHANNEL, json.dumps(messages))
+
+    async def listen(self):
+        pubsub = redis.asyncio.Redis.from_url(self.url).pubsub(
+            ignore_subscribe_messages=True
+        )
+        await pubsub.subscribe(REDIS_CHANNEL)
+        async for message in pubsub.listen():
+            self.dispatch(json.loads(message["data"]))
+
+
+@cache
+def get_broker() -> Broker:
+    if settings.MEASUREMENT_EVENTS_REDIS_URL:
+        return RedisBroker(settings.MEASUREMENT_EVENTS_REDIS_URL)
+    return Broker()
+
+
+def system_topic(system_id: int) -> str:
+    return f"system:{system_id}"
+
+
+def sensor_topic(sensor_id: int) -> str:
+    return f"sensor:{sensor_id}"
+
+
+def publish_measurements(sender, measurements: list[Measurement], **kwargs):
+    """Push new readings to the subscribers of their sensors and systems.
+
+    Readings of one write are sent as a single JSON array per topic.
+    """
+    systems = dict(
+        Sensor.objects.filter(
+            id__in={measurement.sensor_id for measurement in measurements}
+        ).values_list("id", "system_id")
+    )
+    events = defaultdict(list)
+    for measurement in measurements:
+        system_id = systems[measurement.sensor_id]
+        event = {
+            "sensor": measurement.sensor_id,
+            "system": system_id,
+            "value": (
+                value_field.to_representation(measurement.value)
+                if measurement.value is not None
+                else None
+            ),
+            "measured_at": measured_at_field.to_representation(measurement.measured_at),
+        }
+        events[sensor_topic(measurement.sensor_id)].append(event)
+        events[system_topic(system_id)].append(event)
+
+    get_broker().publish(
+        {topic: json.dumps(readings) for topic, readings in events.items()}
+    )
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.11 on 2026-10-18 12:51
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sensors", "0003_alter_measurement_measured_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="measurement",
+            name="measured_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(
+            sql="""
+                DELETE FROM sensors_measurement duplicate
+                USING sensors_measurement original
+                WHERE duplicate.sensor_id = original.sensor_id
+                    AND duplicate.measured_at = original.measured_at
+                    AND duplicate.id > original.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name="measurement",
+            constraint=models.UniqueConstraint(
+                fields=("sensor", "measured_at"), name="unique_sensor_measured_at"
+            ),
+        ),
+    ]
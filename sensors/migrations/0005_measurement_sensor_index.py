@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 12:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sensors", "0004_measurement_client_timestamp"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="measurement",
+            name="sensor",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="measurement",
+                to="sensors.sensor",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.11 on 2026-10-18 12:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("systems", "0001_initial"),
+        ("sensors", "0005_measurement_sensor_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SensorLatest",
+            fields=[
+                (
+                    "sensor",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="latest",
+                        serialize=False,
+                        to="sensors.sensor",
+                    ),
+                ),
+                (
+                    "value",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=5, null=True
+                    ),
+                ),
+                ("measured_at", models.DateTimeField()),
+                (
+                    "system",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="latest_measurements",
+                        to="systems.hydrosystem",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO sensors_sensorlatest (sensor_id, system_id, value, measured_at)
+                SELECT DISTINCT ON (measurement.sensor_id)
+                    measurement.sensor_id, sensor.system_id,
+                    measurement.value, measurement.measured_at
+                FROM sensors_measurement measurement
+                JOIN sensors_sensor sensor ON sensor.id = measurement.sensor_id
+                ORDER BY measurement.sensor_id, measurement.measured_at DESC
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sensors", "0006_sensorlatest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("measurement_id", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="MeasurementRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("1h", "Hour"), ("1d", "Day")], max_length=2
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("min", models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ("max", models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                (
+                    "sum",
+                    models.DecimalField(decimal_places=2, max_digits=15, null=True),
+                ),
+                ("count", models.IntegerField()),
+                (
+                    "last",
+                    models.DecimalField(decimal_places=2, max_digits=5, null=True),
+                ),
+                ("last_measured_at", models.DateTimeField()),
+                (
+                    "sensor",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to="sensors.sensor",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="measurementrollup",
+            constraint=models.UniqueConstraint(
+                fields=("sensor", "resolution", "bucket"),
+                name="unique_sensor_rollup_bucket",
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sensors", "0007_measurementrollup"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="measurement",
+            name="value",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=9, null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="measurementrollup",
+            name="last",
+            field=models.DecimalField(decimal_places=2, max_digits=9, null=True),
+        ),
+        migrations.AlterField(
+            model_name="measurementrollup",
+            name="max",
+            field=models.DecimalField(decimal_places=2, max_digits=9, null=True),
+        ),
+        migrations.AlterField(
+            model_name="measurementrollup",
+            name="min",
+            field=models.DecimalField(decimal_places=2, max_digits=9, null=True),
+        ),
+        migrations.AlterField(
+            model_name="measurementrollup",
+            name="sum",
+            field=models.DecimalField(decimal_places=2, max_digits=18, null=True),
+        ),
+        migrations.AlterField(
+            model_name="sensorlatest",
+            name="value",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=9, null=True
+            ),
+        ),
+    ]
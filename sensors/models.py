@@ -1,4 +1,13 @@
-from django.db import models
+from datetime import datetime
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models.query import RawQuerySet
+from django.utils import timezone
+
+from .aggregation import BUCKET_ORIGIN, INTERVALS
+from .signals import measurements_ingested
 
 
 class SensorTypes(models.TextChoices):
@@ -18,9 +27,451 @@ class Sensor(models.Model):
         return f"{self.sensor_type} sensor with ID {self.id} in system {self.system.id}"
 
 
+class MeasurementManager(models.Manager):
+    def ingest(self, measurements: list["Measurement"]) -> list["Measurement"]:
+        """Write measurements in chunks of MEASUREMENT_BULK_BATCH_SIZE rows.
+
+        Readings already stored for the same sensor and time are skipped with
+        ON CONFLICT DO NOTHING, so gateways can safely retry uploads. Only the
+        inserted readings are returned, refresh the latest readings and are
+        sent with measurements_ingested after the transaction commits.
+        """
+        batch_size = settings.MEASUREMENT_BULK_BATCH_SIZE
+        created = []
+        with transaction.atomic():
+            for start in range(0, len(measurements), batch_size):
+                created += self.insert_new(measurements[start : start + batch_size])
+            SensorLatest.objects.refresh(created)
+            transaction.on_commit(
+                partial(
+                    measurements_ingested.send_robust,
+                    sender=self.model,
+                    measurements=created,
+                )
+            )
+        return created
+
+    def insert_new(self, measurements: list["Measurement"]) -> list["Measurement"]:
+        """INSERT the measurements, return the ones that were new with their ids.
+
+        bulk_create cannot tell which rows ON CONFLICT skipped, RETURNING can.
+        Of several new readings for the same sensor and time the first is kept.
+        """
+        fields = [
+            field for field in self.model._meta.concrete_fields if not field.primary_key
+        ]
+        row = "({})".format(", ".join(["%s"] * len(fields)))
+        params = [
+            field.get_db_prep_save(getattr(measurement, field.attname), connection)
+            for measurement in measurements
+            for field in fields
+        ]
+        by_key = {}
+        for measurement in measurements:
+            by_key.setdefault(
+                (measurement.sensor_id, measurement.measured_at), measurement
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.model._meta.db_table}
+                    ({", ".join(field.column for field in fields)})
+                VALUES {", ".join([row] * len(measurements))}
+                ON CONFLICT (sensor_id, measured_at) DO NOTHING
+                RETURNING id, sensor_id, measured_at
+                """,
+                params,
+            )
+            rows = cursor.fetchall()
+
+        created = []
+        for measurement_id, sensor_id, measured_at in rows:
+            measurement = by_key[(sensor_id, measured_at)]
+            measurement.id = measurement_id
+            measurement._state.adding = False
+            measurement._state.db = self.db
+            created.append(measurement)
+        return created
+
+    def copy(self, measurements: list["Measurement"]) -> int:
+        """Load many measurements with COPY, return the number of new rows.
+
+        Anything with sensor_id, value and measured_at attributes can be passed.
+
+        Rows are copied into a temporary table first and moved over with
+        INSERT ... ON CONFLICT DO NOTHING, so repeated loads of the same rows
+        are harmless. Meant for imports of history: the latest readings are
+        refreshed from the new rows, but measurements_ingested is not sent.
+        """
+        value_field = self.model._meta.get_field("value")
+        value_type = value_field.db_type(connection)
+        table = self.model._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TEMPORARY TABLE IF NOT EXISTS {table}_copy (
+                    sensor_id bigint, value {value_type}, measured_at timestamptz
+                )
+                """
+            )
+            with cursor.copy(
+                f"COPY {table}_copy (sensor_id, value, measured_at) FROM STDIN"
+            ) as copy:
+                for measurement in measurements:
+                    copy.write_row(
+                        (
+                            measurement.sensor_id,
+                            value_field.get_db_prep_value(
+                                measurement.value, connection
+                            ),
+                            measurement.measured_at,
+                        )
+                    )
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (sensor_id, value, measured_at)
+                SELECT sensor_id, value, measured_at FROM {table}_copy
+                ON CONFLICT (sensor_id, measured_at) DO NOTHING
+                RETURNING sensor_id, value, measured_at
+                """
+            )
+            created = [
+                self.model(sensor_id=sensor_id, value=value, measured_at=measured_at)
+                for sensor_id, value, measured_at in cursor.fetchall()
+            ]
+            cursor.execute(f"TRUNCATE {table}_copy")
+            SensorLatest.objects.refresh(created)
+        return len(created)
+
+    def newest_per_system(
+        self, system_ids: list[int], limit: int = 10, per_sensor: int | None = None
+    ) -> dict[int, list["Measurement"]]:
+        """Return the newest `limit` readings, or `per_sensor` of each sensor, by system.
+
+        Every sensor contributes its newest rows through a LATERAL LIMIT served by
+        the (sensor, measured_at) index, and ROW_NUMBER over each system keeps the
+        newest `limit` of them, so all systems are fetched in one query whose cost
+        does not grow with the length of the history.
+        """
+        by_system = {system_id: [] for system_id in system_ids}
+        for measurement in self.newest_query(system_ids, limit, per_sensor):
+            by_system[measurement.system_id].append(measurement)
+        return by_system
+
+    async def anewest_per_system(
+        self, system_ids: list[int], limit: int = 10, per_sensor: int | None = None
+    ) -> dict[int, list["Measurement"]]:
+        by_system = {system_id: [] for system_id in system_ids}
+        async for measurement in self.newest_query(system_ids, limit, per_sensor):
+            by_system[measurement.system_id].append(measurement)
+        return by_system
+
+    def newest_query(
+        self, system_ids: list[int], limit: int, per_sensor: int | None
+    ) -> RawQuerySet:
+        sensor_limit = per_sensor or limit
+        row_limit = "" if per_sensor else "WHERE newest.row_number <= %s"
+        table = self.model._meta.db_table
+        return self.raw(
+            f"""
+            SELECT newest.*
+            FROM (
+                SELECT
+                    measurement.*,
+                    sensor.system_id,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY sensor.system_id
+                        ORDER BY measurement.measured_at DESC, measurement.id DESC
+                    ) AS row_number
+                FROM {Sensor._meta.db_table} sensor
+                CROSS JOIN LATERAL (
+                    SELECT *
+                    FROM {table}
+                    WHERE {table}.sensor_id = sensor.id
+                    ORDER BY {table}.measured_at DESC
+                    LIMIT %s
+                ) measurement
+                WHERE sensor.system_id = ANY(%s)
+            ) newest
+            {row_limit}
+            ORDER BY newest.system_id, newest.row_number
+            """,
+            [sensor_limit, list(system_ids)] + ([] if per_sensor else [limit]),
+        )
+
+
 class Measurement(models.Model):
+    # Lookups by sensor are served by the (sensor, measured_at) unique index.
     sensor = models.ForeignKey(
-        "sensors.Sensor", on_delete=models.CASCADE, related_name="measurement"
+        "sensors.Sensor",
+        on_delete=models.CASCADE,
+        related_name="measurement",
+        db_index=False,
     )
-    value = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
-    measured_at = models.DateTimeField(auto_now_add=True)
+    value = models.DecimalField(max_digits=9, decimal_places=2, blank=True, null=True)
+    measured_at = models.DateTimeField(default=timezone.now)
+
+    objects = MeasurementManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["sensor", "measured_at"], name="unique_sensor_measured_at"
+            )
+        ]
+
+
+class SensorLatestManager(models.Manager):
+    def refresh(self, measurements: list[Measurement]):
+        """Upsert the newest of the given readings of every sensor.
+
+        Readings older than the stored snapshot, e.g. late uploads from a gateway
+        buffer, leave it untouched.
+        """
+        latest = {}
+        for measurement in measurements:
+            current = latest.get(measurement.sensor_id)
+            if not current or current.measured_at < measurement.measured_at:
+                latest[measurement.sensor_id] = measurement
+
+        if not latest:
+            return
+
+        value_field = self.model._meta.get_field("value")
+        value_type = value_field.db_type(connection)
+        rows = ", ".join(
+            [f"(%s::bigint, %s::{value_type}, %s::timestamptz)"] * len(latest)
+        )
+        params = [
+            param
+            for measurement in latest.values()
+            for param in (
+                measurement.sensor_id,
+                value_field.get_db_prep_value(measurement.value, connection),
+                measurement.measured_at,
+            )
+        ]
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (sensor_id, system_id, value, measured_at)
+                SELECT sensor.id, sensor.system_id, latest.value, latest.measured_at
+                FROM (VALUES {rows}) AS latest (sensor_id, value, measured_at)
+                JOIN {Sensor._meta.db_table} sensor ON sensor.id = latest.sensor_id
+                ON CONFLICT (sensor_id) DO UPDATE
+                SET value = EXCLUDED.value, measured_at = EXCLUDED.measured_at
+                WHERE {table}.measured_at < EXCLUDED.measured_at
+                """,
+                params,
+            )
+
+
+class SensorLatest(models.Model):
+    """Newest reading of every sensor, maintained by Measurement.objects.ingest."""
+
+    sensor = models.OneToOneField(
+        "sensors.Sensor",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="latest",
+    )
+    system = models.ForeignKey(
+        "systems.HydroSystem",
+        on_delete=models.CASCADE,
+        related_name="latest_measurements",
+    )
+    value = models.DecimalField(max_digits=9, decimal_places=2, blank=True, null=True)
+    measured_at = models.DateTimeField()
+
+    objects = SensorLatestManager()
+
+
+class RollupResolutions(models.TextChoices):
+    HOUR = "1h"
+    DAY = "1d"
+
+
+class MeasurementRollupManager(models.Manager):
+    def refresh(
+        self,
+        start_id: int,
+        end_id: int,
+        raw_cutoffs: dict[int, datetime] | None = None,
+        hourly_cutoffs: dict[int, datetime] | None = None,
+    ):
+        """Recompute every rollup bucket touched by measurements in (start_id, end_id].
+
+        Buckets are rebuilt from all of their raw rows up to end_id, so late
+        readings and repeated runs over the same range are handled correctly.
+        Daily buckets are rebuilt from the hourly ones.
+
+        Retention may already have removed part of the rows an existing bucket
+        was built from, so existing hourly buckets starting before the sensor's
+        raw cutoff and daily ones before its hourly cutoff are left as they are.
+        """
+        table = self.model._meta.db_table
+        measurement_table = Measurement._meta.db_table
+        upsert = """
+            ON CONFLICT (sensor_id, resolution, bucket) DO UPDATE SET
+                min = EXCLUDED.min,
+                max = EXCLUDED.max,
+                sum = EXCLUDED.sum,
+                count = EXCLUDED.count,
+                last = EXCLUDED.last,
+                last_measured_at = EXCLUDED.last_measured_at
+        """
+        params = {
+            "start_id": start_id,
+            "end_id": end_id,
+            "origin": BUCKET_ORIGIN,
+            "hour": INTERVALS[RollupResolutions.HOUR],
+            "day": INTERVALS[RollupResolutions.DAY],
+            "raw_sensors": list(raw_cutoffs or {}),
+            "raw_cutoffs": list((raw_cutoffs or {}).values()),
+            "hourly_sensors": list(hourly_cutoffs or {}),
+            "hourly_cutoffs": list((hourly_cutoffs or {}).values()),
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH touched AS (
+                    SELECT DISTINCT
+                        sensor_id, DATE_BIN(%(hour)s, measured_at, %(origin)s) AS bucket
+                    FROM {measurement_table}
+                    WHERE id > %(start_id)s AND id <= %(end_id)s
+                ),
+                cutoff AS (
+                    SELECT * FROM UNNEST(
+                        %(raw_sensors)s::bigint[], %(raw_cutoffs)s::timestamptz[]
+                    ) AS cutoff (sensor_id, time)
+                ),
+                affected AS (
+                    SELECT touched.*
+                    FROM touched
+                    LEFT JOIN cutoff USING (sensor_id)
+                    WHERE cutoff.time IS NULL
+                        OR touched.bucket >= cutoff.time
+                        OR NOT EXISTS (
+                            SELECT FROM {table}
+                            WHERE sensor_id = touched.sensor_id
+                                AND resolution = '{RollupResolutions.HOUR}'
+                                AND bucket = touched.bucket
+                        )
+                )
+                INSERT INTO {table} (
+                    sensor_id, resolution, bucket,
+                    min, max, sum, count, last, last_measured_at
+                )
+                SELECT
+                    affected.sensor_id, '{RollupResolutions.HOUR}', affected.bucket,
+                    MIN(measurement.value), MAX(measurement.value),
+                    SUM(measurement.value), COUNT(measurement.value),
+                    (ARRAY_AGG(measurement.value ORDER BY measurement.measured_at DESC))[1],
+                    MAX(measurement.measured_at)
+                FROM affected
+                -- OFFSET 0 keeps the subquery from being flattened, so every
+                -- bucket is read with a (sensor, measured_at) index range scan.
+                CROSS JOIN LATERAL (
+                    SELECT value, measured_at
+                    FROM {measurement_table}
+                    WHERE sensor_id = affected.sensor_id
+                        AND measured_at >= affected.bucket
+                        AND measured_at < affected.bucket + %(hour)s
+                        AND id <= %(end_id)s
+                    OFFSET 0
+                ) measurement
+                GROUP BY affected.sensor_id, affected.bucket
+                {upsert}
+                """,
+                params,
+            )
+            cursor.execute(
+                f"""
+                WITH touched AS (
+                    SELECT DISTINCT
+                        sensor_id, DATE_BIN(%(day)s, measured_at, %(origin)s) AS bucket
+                    FROM {measurement_table}
+                    WHERE id > %(start_id)s AND id <= %(end_id)s
+                ),
+                cutoff AS (
+                    SELECT * FROM UNNEST(
+                        %(hourly_sensors)s::bigint[], %(hourly_cutoffs)s::timestamptz[]
+                    ) AS cutoff (sensor_id, time)
+                ),
+                affected AS (
+                    SELECT touched.*
+                    FROM touched
+                    LEFT JOIN cutoff USING (sensor_id)
+                    WHERE cutoff.time IS NULL
+                        OR touched.bucket >= cutoff.time
+                        OR NOT EXISTS (
+                            SELECT FROM {table}
+                            WHERE sensor_id = touched.sensor_id
+                                AND resolution = '{RollupResolutions.DAY}'
+                                AND bucket = touched.bucket
+                        )
+                )
+                INSERT INTO {table} (
+                    sensor_id, resolution, bucket,
+                    min, max, sum, count, last, last_measured_at
+                )
+                SELECT
+                    affected.sensor_id, '{RollupResolutions.DAY}', affected.bucket,
+                    MIN(hourly.min), MAX(hourly.max), SUM(hourly.sum), SUM(hourly.count),
+                    (ARRAY_AGG(hourly.last ORDER BY hourly.last_measured_at DESC))[1],
+                    MAX(hourly.last_measured_at)
+                FROM affected
+                CROSS JOIN LATERAL (
+                    SELECT min, max, sum, count, last, last_measured_at
+                    FROM {table}
+                    WHERE sensor_id = affected.sensor_id
+                        AND resolution = '{RollupResolutions.HOUR}'
+                        AND bucket >= affected.bucket
+                        AND bucket < affected.bucket + %(day)s
+                    OFFSET 0
+                ) hourly
+                GROUP BY affected.sensor_id, affected.bucket
+                {upsert}
+                """,
+                params,
+            )
+
+
+class MeasurementRollup(models.Model):
+    """Pre-aggregated measurements of one sensor in one hourly or daily bucket."""
+
+    sensor = models.ForeignKey(
+        "sensors.Sensor",
+        on_delete=models.CASCADE,
+        related_name="rollups",
+        db_index=False,
+    )
+    resolution = models.CharField(max_length=2, choices=RollupResolutions.choices)
+    bucket = models.DateTimeField()
+    min = models.DecimalField(max_digits=9, decimal_places=2, null=True)
+    max = models.DecimalField(max_digits=9, decimal_places=2, null=True)
+    sum = models.DecimalField(max_digits=18, decimal_places=2, null=True)
+    count = models.IntegerField()
+    last = models.DecimalField(max_digits=9, decimal_places=2, null=True)
+    last_measured_at = models.DateTimeField()
+
+    objects = MeasurementRollupManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["sensor", "resolution", "bucket"],
+                name="unique_sensor_rollup_bucket",
+            )
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Id of the newest measurement already included in the rollups."""
+
+    MEASUREMENTS = "measurements"
+
+    name = models.CharField(max_length=50, primary_key=True)
+    measurement_id = models.BigIntegerField(default=0)
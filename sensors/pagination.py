@@ -0,0 +1,79 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q, QuerySet
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class MeasurementKeysetPagination(BasePagination):
+    """Paginate measurements by (measured_at, id) instead of OFFSET.
+
+    The cursor holds the position of the last returned row, so every page is a
+    bounded range scan no matter how deep into the history it is.
+    """
+
+    cursor_query_param = "cursor"
+    ordering = ("measured_at", "id")
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+
+    @staticmethod
+    def encode_cursor(measured_at: datetime, id: int) -> str:
+        position = f"{measured_at.isoformat()}|{id}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> (datetime, int):
+        """Raise ValueError for cursors that were not produced by encode_cursor."""
+        position = base64.urlsafe_b64decode(cursor.encode()).decode()
+        measured_at, _, id = position.partition("|")
+        return datetime.fromisoformat(measured_at), int(id)
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request, view=None, position=None
+    ) -> list:
+        self.request = request
+        return self.set_page(list(self.get_page_queryset(queryset, position)))
+
+    async def apaginate_queryset(
+        self, queryset: QuerySet, request, view=None, position=None
+    ) -> list:
+        self.request = request
+        page_queryset = self.get_page_queryset(queryset, position)
+        return self.set_page([row async for row in page_queryset])
+
+    def get_page_queryset(self, queryset: QuerySet, position) -> QuerySet:
+        """Select the page after `position` and one more row to tell if there is a next."""
+        if position:
+            measured_at, id = position
+            queryset = queryset.filter(measured_at__gte=measured_at).filter(
+                Q(measured_at__gt=measured_at) | Q(id__gt=id)
+            )
+        return queryset.order_by(*self.ordering)[: self.page_size + 1]
+
+    def set_page(self, page: list) -> list:
+        self.has_next = len(page) > self.page_size
+        page = page[: self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.last.measured_at, self.last.id)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_columnar_response(self, columns: dict[str, list]) -> Response:
+        """Page of parallel columns, the next link is also sent in the Link header."""
+        next_link = self.get_next_link()
+        response = Response({"next": next_link, "columns": columns})
+        if next_link:
+            response["Link"] = f'<{next_link}>; rel="next"'
+        return response
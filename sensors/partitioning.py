@@ -0,0 +1,195 @@
+import re
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Measurement
+
+TABLE = Measurement._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+BOUNDS_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    index = moment.year * 12 + moment.month - 1 + months
+    return moment.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_start(moment: datetime) -> datetime:
+    """Start of the MEASUREMENT_PARTITION_MONTHS long partition containing `moment`."""
+    months = settings.MEASUREMENT_PARTITION_MONTHS
+    index = (moment.year * 12 + moment.month - 1) // months * months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def is_partitioned() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions() -> dict[str, tuple[datetime, datetime]]:
+    """Return the (start, end) range of every partition except the default one."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT partition.relname, pg_get_expr(partition.relpartbound, partition.oid)
+            FROM pg_inherits
+            JOIN pg_class partition ON partition.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [TABLE],
+        )
+        partitions = {}
+        for name, bound in cursor.fetchall():
+            match = BOUNDS_RE.search(bound)
+            if match:
+                start, end = match.groups()
+                partitions[name] = (
+                    datetime.fromisoformat(start),
+                    datetime.fromisoformat(end),
+                )
+        return partitions
+
+
+def create_partition(start: datetime, end: datetime) -> str:
+    """Attach a partition for [start, end).
+
+    Readings of that range which already landed in the default partition are
+    moved into the new one, otherwise Postgres would refuse to attach it.
+    """
+    name = f"{TABLE}_p{start:%Y_%m}"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM "{DEFAULT_PARTITION}"
+                WHERE measured_at >= %s AND measured_at < %s
+                RETURNING *
+            )
+            INSERT INTO "{name}" SELECT * FROM moved
+            """,
+            [start, end],
+        )
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+    return name
+
+
+def create_partitions(ahead: int, since: datetime | None = None) -> list[str]:
+    """Make sure partitions exist from the current one up to `ahead` partitions ahead.
+
+    With `since`, partitions are created from the one containing it instead,
+    e.g. before loading history.
+    """
+    months = settings.MEASUREMENT_PARTITION_MONTHS
+    existing = get_partitions().values()
+    created = []
+    start = partition_start(since or timezone.now())
+    until = add_months(partition_start(timezone.now()), months * (ahead + 1))
+    while start < until:
+        end = add_months(start, months)
+        if not any(
+            start < taken_end and taken_start < end
+            for taken_start, taken_end in existing
+        ):
+            created.append(create_partition(start, end))
+        start = end
+    return created
+
+
+def drop_partitions(before: datetime) -> list[str]:
+    """Detach and drop every partition holding only readings older than `before`."""
+    dropped = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, (_, end) in sorted(get_partitions().items()):
+            if end <= before:
+                cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+                cursor.execute(f'DROP TABLE "{name}"')
+                dropped.append(name)
+    return dropped
+
+
+def convert_to_partitioned(ahead: int) -> list[str]:
+    """Rebuild the measurements table range partitioned by measured_at.
+
+    The data is copied in a single transaction holding an exclusive lock on the
+    table, so run it in a maintenance window. Constraint and index names are
+    kept, only the primary key becomes (id, measured_at) because Postgres
+    requires unique keys of a partitioned table to contain the partition key.
+    """
+    legacy = f"{TABLE}_unpartitioned"
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Deferred foreign key checks of rows written earlier in the transaction
+        # would keep the old table from being dropped.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f'LOCK TABLE "{TABLE}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+            [TABLE, TABLE],
+        )
+        indexes = [indexdef for (indexdef,) in cursor.fetchall()]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        (sequence,) = cursor.fetchone()
+
+        # Free the names of the old table and its sequence for the new ones.
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{legacy}"')
+        cursor.execute(f'ALTER SEQUENCE {sequence} RENAME TO "{legacy}_id_seq"')
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            "PARTITION BY RANGE (measured_at)"
+        )
+        # Readings with timestamps outside of every partition, e.g. from devices
+        # with a wrong clock, end up here instead of failing the whole upload.
+        cursor.execute(
+            f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT'
+        )
+
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', measured_at) FROM \"{legacy}\""
+        )
+        starts = {partition_start(month) for (month,) in cursor.fetchall()}
+        created = [
+            create_partition(
+                start, add_months(start, settings.MEASUREMENT_PARTITION_MONTHS)
+            )
+            for start in sorted(starts)
+        ]
+        created += create_partitions(ahead)
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{legacy}"')
+        # Continue the old sequence, ids must keep growing for the rollup watermark.
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence(%s, 'id'), nextval(%s), false)",
+            [TABLE, f"{legacy}_id_seq"],
+        )
+        cursor.execute(f'DROP TABLE "{legacy}"')
+
+        # Constraints are added after the copy, building indexes in bulk is faster.
+        for name, type, definition in constraints:
+            if type == "p":
+                definition = "PRIMARY KEY (id, measured_at)"
+            cursor.execute(
+                f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {definition}'
+            )
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+    return created
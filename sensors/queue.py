@@ -0,0 +1,246 @@
+import fcntl
+import json
+import os
+import socket
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+from functools import cache
+from pathlib import Path
+
+import orjson
+import redis
+from django.conf import settings
+
+from .models import Measurement
+
+REDIS_STREAM = "hydro:measurement-queue"
+REDIS_GROUP = "writers"
+REDIS_STATS = "hydro:measurement-queue:stats"
+
+# A validated reading waiting to be written, enqueued_at is a Unix timestamp.
+QueuedReading = namedtuple(
+    "QueuedReading", ["sensor_id", "value", "measured_at", "enqueued_at"]
+)
+
+
+def encode(measurement: Measurement, enqueued_at: float) -> bytes:
+    value = measurement.value
+    return orjson.dumps(
+        [
+            measurement.sensor_id,
+            str(value) if value is not None else None,
+            measurement.measured_at.isoformat(),
+            enqueued_at,
+        ]
+    )
+
+
+def decode(data: bytes) -> QueuedReading:
+    sensor_id, value, measured_at, enqueued_at = orjson.loads(data)
+    return QueuedReading(
+        sensor_id,
+        Decimal(value) if value is not None else None,
+        datetime.fromisoformat(measured_at),
+        enqueued_at,
+    )
+
+
+class MeasurementQueue(ABC):
+    """Durable queue between the ingestion endpoints and the database.
+
+    Readings are delivered at least once: a worker that dies after writing a
+    batch but before acknowledging it gets the batch again, which the unique
+    (sensor, measured_at) constraint turns into a no-op.
+    """
+
+    @abstractmethod
+    def put(self, measurements: list[Measurement]):
+        """Append validated readings, they are stored durably once this returns."""
+
+    @abstractmethod
+    def read(self, count: int) -> tuple[list[QueuedReading], object]:
+        """Return up to `count` of the oldest unacknowledged readings and a cursor."""
+
+    @abstractmethod
+    def ack(self, cursor, rows: int, seconds: float):
+        """Drop the readings up to `cursor` after `rows` of them were written."""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Return depth, lag in seconds and flushed rows and seconds so far."""
+
+
+class FileQueue(MeasurementQueue):
+    """Append-only log of one JSON reading per line, for a single worker.
+
+    Web processes append whole batches with one write under a shared lock. The
+    worker keeps its read offset and flush totals in a state file, which is
+    replaced atomically, and truncates the log under an exclusive lock once
+    everything was written.
+    """
+
+    def __init__(self, path: Path, fsync: bool = True):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.log = self.path / "measurements.log"
+        self.state = self.path / "state.json"
+        self.fsync = fsync
+
+    def put(self, measurements: list[Measurement]):
+        enqueued_at = time.time()
+        data = b"".join(
+            encode(measurement, enqueued_at) + b"\n" for measurement in measurements
+        )
+        fd = os.open(self.log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            os.write(fd, data)
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def read(self, count: int) -> tuple[list[QueuedReading], int]:
+        offset = self.load_state()["offset"]
+        readings = []
+        with self.open_log() as log:
+            log.seek(offset)
+            while len(readings) < count:
+                line = log.readline()
+                # A line without a newline is still being written.
+                if not line.endswith(b"\n"):
+                    break
+                readings.append(decode(line))
+                offset += len(line)
+        return readings, offset
+
+    def ack(self, cursor: int, rows: int, seconds: float):
+        state = self.load_state()
+        state["offset"] = cursor
+        state["flushed"] += rows
+        state["flush_seconds"] += seconds
+        self.save_state(state)
+
+        with self.open_log() as log:
+            fcntl.flock(log, fcntl.LOCK_EX)
+            if os.fstat(log.fileno()).st_size == cursor:
+                # Reset the offset first, a crash in between only repeats rows.
+                state["offset"] = 0
+                self.save_state(state)
+                os.ftruncate(log.fileno(), 0)
+
+    def stats(self) -> dict:
+        state = self.load_state()
+        with self.open_log() as log:
+            log.seek(state["offset"])
+            first = log.readline()
+            depth = first.count(b"\n")
+            while chunk := log.read(1 << 20):
+                depth += chunk.count(b"\n")
+        lag = time.time() - decode(first).enqueued_at if depth else 0
+        return {
+            "depth": depth,
+            "lag": lag,
+            "flushed": state["flushed"],
+            "flush_seconds": state["flush_seconds"],
+        }
+
+    def open_log(self):
+        return open(os.open(self.log, os.O_RDWR | os.O_CREAT, 0o644), "rb")
+
+    def load_state(self) -> dict:
+        state = {"offset": 0, "flushed": 0, "flush_seconds": 0.0}
+        if self.state.exists():
+            state.update(json.loads(self.state.read_text()))
+        # The log was truncated after the state was saved, start over.
+        size = self.log.stat().st_size if self.log.exists() else 0
+        if state["offset"] > size:
+            state["offset"] = 0
+        return state
+
+    def save_state(self, state: dict):
+        temporary = self.state.with_suffix(".tmp")
+        with open(temporary, "w") as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.state)
+
+
+class RedisQueue(MeasurementQueue):
+    """Redis stream read through a consumer group, so several workers can drain it.
+
+    Every worker reads its own unacknowledged entries first, those of a worker
+    that crashed are picked up again when it restarts under the same name.
+    Durability depends on the Redis persistence settings, use appendfsync.
+    """
+
+    def __init__(self, url: str, consumer: str | None = None):
+        self.client = redis.Redis.from_url(url)
+        self.consumer = consumer or socket.gethostname()
+        self.group_created = False
+
+    def put(self, measurements: list[Measurement]):
+        enqueued_at = time.time()
+        pipeline = self.client.pipeline(transaction=False)
+        for measurement in measurements:
+            pipeline.xadd(REDIS_STREAM, {"reading": encode(measurement, enqueued_at)})
+        pipeline.execute()
+
+    def read(self, count: int) -> tuple[list[QueuedReading], list[bytes]]:
+        if not self.group_created:
+            try:
+                self.client.xgroup_create(
+                    REDIS_STREAM, REDIS_GROUP, id="0", mkstream=True
+                )
+            except redis.ResponseError as exc:
+                if "BUSYGROUP" not in str(exc):
+                    raise
+            self.group_created = True
+
+        for start in ["0", ">"]:
+            response = self.client.xreadgroup(
+                REDIS_GROUP, self.consumer, {REDIS_STREAM: start}, count=count
+            )
+            entries = response[0][1] if response else []
+            if entries:
+                return [decode(fields[b"reading"]) for _, fields in entries], [
+                    id for id, _ in entries
+                ]
+        return [], []
+
+    def ack(self, cursor: list[bytes], rows: int, seconds: float):
+        pipeline = self.client.pipeline()
+        pipeline.xack(REDIS_STREAM, REDIS_GROUP, *cursor)
+        pipeline.xdel(REDIS_STREAM, *cursor)
+        pipeline.hincrby(REDIS_STATS, "flushed", rows)
+        pipeline.hincrbyfloat(REDIS_STATS, "flush_seconds", seconds)
+        pipeline.execute()
+
+    def stats(self) -> dict:
+        pipeline = self.client.pipeline()
+        pipeline.xlen(REDIS_STREAM)
+        pipeline.xrange(REDIS_STREAM, count=1)
+        pipeline.hgetall(REDIS_STATS)
+        depth, oldest, flushed = pipeline.execute()
+        lag = 0
+        if oldest:
+            # Entry ids start with the milliseconds they were added at.
+            added = int(oldest[0][0].split(b"-")[0]) / 1000
+            lag = max(time.time() - added, 0)
+        return {
+            "depth": depth,
+            "lag": lag,
+            "flushed": int(flushed.get(b"flushed", 0)),
+            "flush_seconds": float(flushed.get(b"flush_seconds", 0)),
+        }
+
+
+@cache
+def get_queue() -> MeasurementQueue:
+    if settings.MEASUREMENT_QUEUE_REDIS_URL:
+        return RedisQueue(settings.MEASUREMENT_QUEUE_REDIS_URL)
+    return FileQueue(settings.MEASUREMENT_QUEUE_PATH, settings.MEASUREMENT_QUEUE_FSYNC)
@@ -1,6 +1,11 @@
+from datetime import datetime
+
+from django.conf import settings
 from rest_framework import serializers
 
-from .models import Measurement, Sensor
+from .aggregation import INTERVALS
+from .models import Measurement, Sensor, SensorLatest, SensorTypes
+from .pagination import MeasurementKeysetPagination
 
 
 class SensorSerializer(serializers.ModelSerializer):
@@ -15,6 +20,14 @@ class MeasurementSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class SensorLatestSerializer(serializers.ModelSerializer):
+    sensor_type = serializers.CharField(source="sensor.sensor_type")
+
+    class Meta:
+        model = SensorLatest
+        fields = ["sensor", "system", "sensor_type", "value", "measured_at"]
+
+
 class AddSensorSerializer(serializers.Serializer):
     system_id = serializers.IntegerField()
     sensor_type = serializers.CharField()
@@ -23,4 +36,101 @@ class AddSensorSerializer(serializers.Serializer):
 
 class AddMeasurementSerializer(serializers.Serializer):
     sensor_id = serializers.IntegerField()
-    value = serializers.DecimalField(max_digits=5, decimal_places=2)
+    value = serializers.DecimalField(max_digits=9, decimal_places=2)
+    measured_at = serializers.DateTimeField(required=False)
+
+
+class AddMeasurementsSerializer(serializers.Serializer):
+    measurements = AddMeasurementSerializer(many=True)
+
+
+class MeasurementRowErrorSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    error = serializers.CharField()
+    errorMessage = serializers.CharField()
+
+
+class AddMeasurementsResponseSerializer(serializers.Serializer):
+    message = serializers.CharField()
+    # Rows inserted, duplicates of stored readings and queued rows are not.
+    created = serializers.IntegerField()
+    # Valid rows, whether they were inserted, duplicates or queued.
+    accepted = serializers.IntegerField()
+    errors = MeasurementRowErrorSerializer(many=True)
+
+
+class MeasurementQueueStatsSerializer(serializers.Serializer):
+    depth = serializers.IntegerField()
+    lag = serializers.FloatField()
+    flushed = serializers.IntegerField()
+    flush_seconds = serializers.FloatField()
+    rows_per_second = serializers.FloatField()
+
+
+class MeasurementFilterSerializer(serializers.Serializer):
+    sensor = serializers.IntegerField(required=False)
+    system = serializers.IntegerField(required=False)
+    type = serializers.ChoiceField(choices=SensorTypes.values, required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+
+class MeasurementQuerySerializer(MeasurementFilterSerializer):
+    limit = serializers.IntegerField(min_value=1, default=1000)
+    cursor = serializers.CharField(required=False)
+    stream = serializers.BooleanField(default=False)
+
+    def validate_limit(self, value: int) -> int:
+        if value > settings.MEASUREMENT_PAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Ensure this value is less than or equal to {settings.MEASUREMENT_PAGE_MAX_SIZE}."
+            )
+        return value
+
+    def validate_cursor(self, value: str) -> (datetime, int):
+        try:
+            return MeasurementKeysetPagination.decode_cursor(value)
+        except ValueError:
+            raise serializers.ValidationError("Invalid cursor.")
+
+
+class MeasurementPageSerializer(serializers.Serializer):
+    next = serializers.URLField(allow_null=True)
+    results = MeasurementSerializer(many=True)
+
+
+class MeasurementAggregateQuerySerializer(MeasurementFilterSerializer):
+    mode = serializers.ChoiceField(choices=["buckets", "lttb"], default="buckets")
+    interval = serializers.ChoiceField(choices=list(INTERVALS), default="1h")
+    points = serializers.IntegerField(min_value=3, default=500)
+
+    def validate_points(self, value: int) -> int:
+        if value > settings.MEASUREMENT_AGGREGATE_MAX_POINTS:
+            raise serializers.ValidationError(
+                f"Ensure this value is less than or equal to {settings.MEASUREMENT_AGGREGATE_MAX_POINTS}."
+            )
+        return value
+
+
+class MeasurementBucketSerializer(serializers.Serializer):
+    sensor = serializers.IntegerField(source="sensor_id")
+    bucket = serializers.DateTimeField(source="bucket_start")
+    min = serializers.DecimalField(max_digits=None, decimal_places=2)
+    max = serializers.DecimalField(max_digits=None, decimal_places=2)
+    avg = serializers.DecimalField(max_digits=None, decimal_places=2)
+    count = serializers.IntegerField()
+    last = serializers.DecimalField(max_digits=None, decimal_places=2)
+
+
+class MeasurementPointSerializer(serializers.Serializer):
+    sensor = serializers.IntegerField(source="sensor_id")
+    measured_at = serializers.DateTimeField()
+    value = serializers.DecimalField(max_digits=None, decimal_places=2)
+
+
+class MeasurementAggregateSerializer(serializers.Serializer):
+    mode = serializers.CharField()
+    interval = serializers.CharField(required=False)
+    source = serializers.CharField(required=False)
+    buckets = MeasurementBucketSerializer(many=True, required=False)
+    points = MeasurementPointSerializer(many=True, required=False)
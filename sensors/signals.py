@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent once the transaction saving measurements commits, with
+# measurements=list[Measurement].
+measurements_ingested = Signal()
@@ -0,0 +1,83 @@
+import math
+import random
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+
+from .models import SensorTypes
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+
+
+class SignalGenerator(ABC):
+    """Plausible readings of one sensor, reproducible from `seed`.
+
+    Every sensor gets its own random state, so the readings of a sensor do not
+    depend on how many other sensors are generated or in which order.
+    """
+
+    def __init__(self, seed: str):
+        self.random = random.Random(seed)
+
+    @abstractmethod
+    def values(self, start: float, step: float, count: int) -> Iterator[float]:
+        """Yield `count` readings taken every `step` seconds from the `start` timestamp."""
+
+
+class PHGenerator(SignalGenerator):
+    """Nutrient solution pH creeping up until a dosing pump brings it back down."""
+
+    def values(self, start: float, step: float, count: int) -> Iterator[float]:
+        gauss = self.random.gauss
+        target = self.random.uniform(5.8, 6.1)
+        drift = self.random.uniform(0.005, 0.02) * step / 3600
+        level = target
+        for _ in range(count):
+            level += drift
+            if level > target + 0.5:
+                level = target + gauss(0, 0.05)
+            yield min(max(level + gauss(0, 0.02), 0), 14)
+
+
+class TemperatureGenerator(SignalGenerator):
+    """Water temperature following the day, warmest in the afternoon."""
+
+    def values(self, start: float, step: float, count: int) -> Iterator[float]:
+        gauss = self.random.gauss
+        mean = self.random.uniform(19, 23)
+        amplitude = self.random.uniform(1, 3)
+        weather = 0.0
+        for index in range(count):
+            moment = start + index * step
+            # Slow random walk on top of the daily cycle, peaking at 15:00 UTC.
+            weather = min(max(weather + gauss(0, 0.02), -2), 2)
+            daily = math.cos(2 * math.pi * (moment - 15 * 3600) / DAY)
+            yield mean + amplitude * daily + weather + gauss(0, 0.1)
+
+
+class TDSGenerator(SignalGenerator):
+    """Dissolved solids in ppm, used up by the plants and topped up weekly."""
+
+    def values(self, start: float, step: float, count: int) -> Iterator[float]:
+        gauss = self.random.gauss
+        full = self.random.uniform(800, 1200)
+        uptake = self.random.uniform(0.0005, 0.002) * step / 3600
+        top_up = self.random.uniform(0, WEEK)
+        level = full * self.random.uniform(0.85, 1)
+        for index in range(count):
+            moment = start + index * step
+            if (moment - top_up) % WEEK < step:
+                level = full
+            level -= level * uptake
+            yield max(level + gauss(0, 5), 0)
+
+
+GENERATORS = {
+    SensorTypes.PH: PHGenerator,
+    SensorTypes.TEMPERATURE: TemperatureGenerator,
+    SensorTypes.TDS: TDSGenerator,
+}
+
+
+def get_generator(sensor_type: str, seed: str) -> SignalGenerator:
+    return GENERATORS[sensor_type](seed)
@@ -1,12 +1,32 @@
+import asyncio
+import csv
 import json
+import tracemalloc
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
+import msgpack
 import pytest
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
+from drf_spectacular.generators import SchemaGenerator
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
-from sensors.models import Sensor, SensorTypes
+from sensors.events import get_broker, sensor_topic
+from sensors.models import Measurement, Sensor, SensorTypes
+from sensors.partitioning import get_partitions
+from sensors.queue import FileQueue, get_queue
 from systems.models import HydroSystem
 
 
@@ -70,6 +90,67 @@ class SensorAddTest(APITestCase):
         assert response_data == expected_response
 
 
+@pytest.mark.django_db
+class SensorListTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+
+    def test_cache_is_invalidated_by_new_sensor(self):
+        url = reverse("list-sensors", kwargs={"id": self.system.id})
+        assert self.client.get(url).data == []
+        assert self.client.get(url)["X-Cache"] == "HIT"
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("add-sensor"),
+                data=json.dumps(
+                    {
+                        "system_id": self.system.id,
+                        "sensor_type": "ph",
+                        "description": "description",
+                    }
+                ),
+                content_type="application/json",
+            )
+        assert response.status_code == status.HTTP_201_CREATED
+
+        response = self.client.get(url)
+        assert response["X-Cache"] == "MISS"
+        assert [sensor["sensor_type"] for sensor in response.data] == ["ph"]
+
+    def test_fast_serialization_output_is_unchanged(self):
+        Sensor.objects.create(system=self.system, sensor_type=SensorTypes.PH)
+        Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.TDS, description="tank"
+        )
+        url = reverse("list-sensors", kwargs={"id": self.system.id})
+
+        with self.settings(FAST_SERIALIZATION=True):
+            fast = self.client.get(url)
+        cache.clear()
+        with self.settings(FAST_SERIALIZATION=False):
+            slow = self.client.get(url)
+
+        assert slow["X-Cache"] == "MISS"
+        assert fast.content == slow.content
+
+    def test_not_modified_request(self):
+        url = reverse("list-sensors", kwargs={"id": self.system.id})
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
 class SensorRemoveTest(APITestCase):
     def setUp(self):
         User = get_user_model()
@@ -115,3 +196,1264 @@ class SensorRemoveTest(APITestCase):
         }
 
         assert response_data == expected_response
+
+
+@pytest.mark.django_db
+class SensorQueryCountTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+
+    def test_list_request(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("list-sensors", kwargs={"id": self.system.id})
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_list_request_of_other_user(self):
+        other_user = get_user_model().objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        self.client.force_authenticate(user=other_user)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("list-sensors", kwargs={"id": self.system.id})
+            )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_create_request(self):
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                reverse("add-sensor"),
+                data=json.dumps({"system_id": self.system.id, "sensor_type": "ph"}),
+                content_type="application/json",
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_remove_request(self):
+        with self.assertNumQueries(1 + 5):
+            response = self.client.delete(
+                reverse("remove-sensor", kwargs={"id": self.sensor.id})
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_measurement_create_request(self):
+        with self.assertNumQueries(1 + 4):
+            response = self.client.post(
+                reverse("new-measurement", kwargs={"id": self.system.id}),
+                data=json.dumps({"sensor_id": self.sensor.id, "value": 6.5}),
+                content_type="application/json",
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+
+@pytest.mark.django_db
+class MeasurementBulkCreateTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        system = HydroSystem.objects.create(
+            owner=self.user, name="test_system", description="test_description"
+        )
+        self.ph_sensor = Sensor.objects.create(
+            system=system, sensor_type=SensorTypes.PH
+        )
+        self.tds_sensor = Sensor.objects.create(
+            system=system, sensor_type=SensorTypes.TDS
+        )
+
+    def test_correct_request(self):
+        request_body = {
+            "measurements": [
+                {"sensor_id": self.ph_sensor.id, "value": "6.50"},
+                {"sensor_id": self.tds_sensor.id, "value": 420},
+                {"sensor_id": self.ph_sensor.id, "value": 6.55},
+            ]
+        }
+
+        response = self.client.post(
+            reverse("new-measurements-bulk"),
+            data=json.dumps(request_body),
+            content_type="application/json",
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        expected_response = {
+            "message": "3 measurements added to the database.",
+            "created": 3,
+            "accepted": 3,
+            "errors": [],
+        }
+
+        assert response_data == expected_response
+        assert Measurement.objects.filter(sensor=self.ph_sensor).count() == 2
+        assert Measurement.objects.filter(sensor=self.tds_sensor).count() == 1
+
+    def test_partially_invalid_request(self):
+        other_user = get_user_model().objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        other_system = HydroSystem.objects.create(owner=other_user, name="other")
+        other_sensor = Sensor.objects.create(
+            system=other_system, sensor_type=SensorTypes.PH
+        )
+
+        request_body = {
+            "measurements": [
+                {"sensor_id": other_sensor.id, "value": 7},
+                {"sensor_id": self.ph_sensor.id, "value": "not a number"},
+                {"value": 7},
+                {"sensor_id": self.ph_sensor.id, "value": 7},
+            ]
+        }
+
+        response = self.client.post(
+            reverse("new-measurements-bulk"),
+            data=json.dumps(request_body),
+            content_type="application/json",
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        assert response_data["created"] == 1
+        assert response_data["accepted"] == 1
+        assert [error["index"] for error in response_data["errors"]] == [0, 1, 2]
+        assert [error["error"] for error in response_data["errors"]] == [
+            "INVALID_SENSOR_ID",
+            "INVALID_VALUE",
+            "MISSING_SENSOR_ID",
+        ]
+        assert not Measurement.objects.filter(sensor=other_sensor).exists()
+
+    def test_ownership_is_validated_with_single_query(self):
+        request_body = {
+            "measurements": [
+                {"sensor_id": sensor_id, "value": 7}
+                for sensor_id in [self.ph_sensor.id, self.tds_sensor.id] * 50
+            ]
+        }
+
+        # Ownership lookup, one INSERT and the latest reading upsert in a savepoint.
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                reverse("new-measurements-bulk"),
+                data=json.dumps(request_body),
+                content_type="application/json",
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_retried_request_is_deduplicated(self):
+        request_body = {
+            "measurements": [
+                {
+                    "sensor_id": self.ph_sensor.id,
+                    "value": 6.5,
+                    "measured_at": "2024-04-01T10:00:00Z",
+                },
+                {
+                    "sensor_id": self.ph_sensor.id,
+                    "value": 6.6,
+                    "measured_at": "2024-04-01T10:00:05Z",
+                },
+            ]
+        }
+
+        responses = []
+        for _ in range(2):
+            response = self.client.post(
+                reverse("new-measurements-bulk"),
+                data=json.dumps(request_body),
+                content_type="application/json",
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+            response_data = json.loads(response.content.decode("utf-8"))
+            responses.append(
+                (
+                    response_data["message"],
+                    response_data["created"],
+                    response_data["accepted"],
+                )
+            )
+
+        assert responses == [
+            ("2 measurements added to the database.", 2, 2),
+            ("0 measurements added to the database.", 0, 2),
+        ]
+        measured_at = Measurement.objects.filter(sensor=self.ph_sensor).values_list(
+            "measured_at", flat=True
+        )
+        assert sorted(value.isoformat() for value in measured_at) == [
+            "2024-04-01T10:00:00+00:00",
+            "2024-04-01T10:00:05+00:00",
+        ]
+
+    @override_settings(MEASUREMENT_BULK_MAX_SIZE=2)
+    def test_too_many_measurements_request(self):
+        request_body = {
+            "measurements": [{"sensor_id": self.ph_sensor.id, "value": 7}] * 3
+        }
+
+        response = self.client.post(
+            reverse("new-measurements-bulk"),
+            data=json.dumps(request_body),
+            content_type="application/json",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        expected_response = {
+            "error": "TOO_MANY_MEASUREMENTS",
+            "errorMessage": "Please provide at most 2 measurements per request.",
+        }
+
+        assert response_data == expected_response
+
+
+@pytest.mark.django_db
+class MeasurementCreateTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(
+            owner=self.user, name="test_system", description="test_description"
+        )
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+
+    def test_correct_request_with_device_timestamp(self):
+        request_body = {
+            "sensor_id": self.sensor.id,
+            "value": 6.5,
+            "measured_at": "2024-04-01T10:00:00Z",
+        }
+
+        for _ in range(2):
+            response = self.client.post(
+                reverse("new-measurement", kwargs={"id": self.system.id}),
+                data=json.dumps(request_body),
+                content_type="application/json",
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+
+        measurement = Measurement.objects.get(sensor=self.sensor)
+        assert measurement.measured_at.isoformat() == "2024-04-01T10:00:00+00:00"
+
+    def test_large_value_request(self):
+        tds_sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.TDS
+        )
+        request_body = {"sensor_id": tds_sensor.id, "value": "1250.55"}
+
+        response = self.client.post(
+            reverse("new-measurement", kwargs={"id": self.system.id}),
+            data=json.dumps(request_body),
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
+        # Values are stored with two decimal places and read back exactly.
+        measurement = Measurement.objects.get(value__gt="1250.54")
+        assert measurement.value == Decimal("1250.55")
+        response = self.client.get(
+            reverse("list-measurements"), {"sensor": tds_sensor.id}
+        )
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert response_data["results"][0]["value"] == "1250.55"
+
+    def test_invalid_measured_at_request(self):
+        request_body = {
+            "sensor_id": self.sensor.id,
+            "value": 6.5,
+            "measured_at": "yesterday",
+        }
+
+        response = self.client.post(
+            reverse("new-measurement", kwargs={"id": self.system.id}),
+            data=json.dumps(request_body),
+            content_type="application/json",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert response_data["error"] == "INVALID_MEASURED_AT"
+
+    def test_invalid_value_request(self):
+        request_body = {"sensor_id": self.sensor.id, "value": "high"}
+
+        response = self.client.post(
+            reverse("new-measurement", kwargs={"id": self.system.id}),
+            data=json.dumps(request_body),
+            content_type="application/json",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert response_data["error"] == "INVALID_VALUE"
+        assert not Measurement.objects.exists()
+
+
+@pytest.mark.django_db
+class MeasurementQueueTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+
+        directory = self.enterContext(TemporaryDirectory())
+        self.enterContext(
+            override_settings(
+                MEASUREMENT_QUEUE_ENABLED=True,
+                MEASUREMENT_QUEUE_REDIS_URL=None,
+                MEASUREMENT_QUEUE_PATH=directory,
+            )
+        )
+        get_queue.cache_clear()
+        self.addCleanup(get_queue.cache_clear)
+
+    def post_readings(self, count: int):
+        start = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+        measurements = [
+            {
+                "sensor_id": self.sensor.id,
+                "value": f"6.{minute:02d}",
+                "measured_at": (start + timedelta(minutes=minute)).isoformat(),
+            }
+            for minute in range(count)
+        ]
+        response = self.client.post(
+            reverse("new-measurements-bulk"),
+            data=json.dumps({"measurements": measurements}),
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert (response_data["created"], response_data["accepted"]) == (0, count)
+
+    def drain(self, *args):
+        call_command("drain_measurement_queue", "--once", *args, stdout=StringIO())
+
+    def test_readings_are_written_by_the_worker(self):
+        response = self.client.post(
+            reverse("new-measurement", kwargs={"id": self.system.id}),
+            data=json.dumps({"sensor_id": self.sensor.id, "value": "6.5"}),
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        self.post_readings(3)
+        assert not Measurement.objects.exists()
+
+        response = self.client.get(reverse("measurement-queue-stats"))
+        assert response.data["depth"] == 4
+        assert response.data["lag"] >= 0
+
+        self.drain()
+
+        assert Measurement.objects.count() == 4
+        latest = Measurement.objects.order_by("-measured_at").first()
+        assert latest.value == Decimal("6.5")
+        assert self.sensor.latest.value == Decimal("6.5")
+        response = self.client.get(reverse("measurement-queue-stats"))
+        assert response.data["depth"] == 0
+        assert response.data["lag"] == 0
+        assert response.data["flushed"] == 4
+        assert response.data["rows_per_second"] > 0
+
+    def test_nothing_lost_when_the_worker_restarts(self):
+        self.post_readings(25)
+        ingest = Measurement.objects.ingest
+        calls = 0
+
+        def crash_after_first_batch(measurements):
+            nonlocal calls
+            calls += 1
+            if calls > 1:
+                raise KeyboardInterrupt
+            return ingest(measurements)
+
+        with patch.object(Measurement.objects, "ingest", crash_after_first_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self.drain("--batch-size", "10")
+        assert Measurement.objects.count() == 10
+
+        # Killed after writing a batch but before acknowledging it.
+        with patch.object(FileQueue, "ack", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.drain("--batch-size", "10")
+        assert Measurement.objects.count() == 20
+        assert get_queue().stats()["depth"] == 15
+
+        self.drain("--batch-size", "10")
+
+        values = Measurement.objects.order_by("measured_at").values_list(
+            "value", flat=True
+        )
+        assert list(values) == [Decimal(f"6.{minute:02d}") for minute in range(25)]
+        assert get_queue().stats()["depth"] == 0
+
+    def test_readings_of_removed_sensors_are_dropped(self):
+        self.post_readings(2)
+        self.sensor.delete()
+
+        self.drain()
+
+        assert not Measurement.objects.exists()
+        assert get_queue().stats()["depth"] == 0
+
+    def test_stats_for_staff_only(self):
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.get(reverse("measurement-queue-stats"))
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class SensorLatestTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(
+            owner=self.user, name="test_system", description="test_description"
+        )
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+
+    def post_measurements(self, measurements: list[dict]):
+        response = self.client.post(
+            reverse("new-measurements-bulk"),
+            data=json.dumps({"measurements": measurements}),
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_latest_reading_is_kept_on_ingest(self):
+        self.post_measurements(
+            [
+                {
+                    "sensor_id": self.sensor.id,
+                    "value": 6.6,
+                    "measured_at": "2024-04-01T10:00:05Z",
+                },
+                {
+                    "sensor_id": self.sensor.id,
+                    "value": 6.5,
+                    "measured_at": "2024-04-01T10:00:00Z",
+                },
+            ]
+        )
+        # A late upload of an older reading must not replace the snapshot.
+        self.post_measurements(
+            [
+                {
+                    "sensor_id": self.sensor.id,
+                    "value": 6.4,
+                    "measured_at": "2024-04-01T09:59:00Z",
+                }
+            ]
+        )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("system-latest-measurements", kwargs={"id": self.system.id})
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        expected_response = [
+            {
+                "sensor": self.sensor.id,
+                "system": self.system.id,
+                "sensor_type": "ph",
+                "value": "6.60",
+                "measured_at": "2024-04-01T10:00:05Z",
+            }
+        ]
+
+        assert response_data == expected_response
+
+    def test_user_latest_readings_request(self):
+        other_system = HydroSystem.objects.create(owner=self.user, name="other")
+        other_sensor = Sensor.objects.create(
+            system=other_system, sensor_type=SensorTypes.TDS
+        )
+        self.post_measurements(
+            [
+                {"sensor_id": self.sensor.id, "value": 6.5},
+                {"sensor_id": other_sensor.id, "value": 420},
+            ]
+        )
+
+        response = self.client.get(reverse("latest-measurements"))
+
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert [row["value"] for row in response_data] == ["6.50", "420.00"]
+
+    def test_invalid_id_request(self):
+        other_user = get_user_model().objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        other_system = HydroSystem.objects.create(owner=other_user, name="other")
+
+        response = self.client.get(
+            reverse("system-latest-measurements", kwargs={"id": other_system.id})
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_schema_operation_ids_are_distinct(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+
+        operation_ids = [
+            schema["paths"][path]["get"]["operationId"]
+            for path in ["/sensors/latest/", "/sensors/latest/{id}/"]
+        ]
+        assert operation_ids == ["sensors_latest_list", "sensors_latest_system_list"]
+
+
+@pytest.mark.django_db
+class MeasurementListTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(
+            owner=self.user, name="test_system", description="test_description"
+        )
+        self.ph_sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+        self.tds_sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.TDS
+        )
+        start = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+        Measurement.objects.ingest(
+            [
+                Measurement(
+                    sensor=sensor,
+                    value=minute,
+                    measured_at=start + timedelta(minutes=minute),
+                )
+                for sensor in [self.ph_sensor, self.tds_sensor]
+                for minute in range(10)
+            ]
+        )
+
+    def test_keyset_pages_request(self):
+        url = reverse("list-measurements")
+        params = {"limit": 4}
+        measured_at = []
+        while url:
+            response = self.client.get(url, params)
+            assert response.status_code == status.HTTP_200_OK
+            response_data = json.loads(response.content.decode("utf-8"))
+            assert len(response_data["results"]) <= 4
+            measured_at += [row["measured_at"] for row in response_data["results"]]
+            url, params = response_data["next"], None
+
+        assert len(measured_at) == 20
+        assert measured_at == sorted(measured_at)
+
+    def test_filtered_request(self):
+        response = self.client.get(
+            reverse("list-measurements"),
+            {
+                "type": "tds",
+                "since": "2024-04-01T00:02:00Z",
+                "until": "2024-04-01T00:05:00Z",
+            },
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        expected_response = {
+            "next": None,
+            "results": [
+                {
+                    "id": measurement.id,
+                    "sensor": self.tds_sensor.id,
+                    "value": f"{minute}.00",
+                    "measured_at": f"2024-04-01T00:0{minute}:00Z",
+                }
+                for minute, measurement in zip(
+                    range(2, 5),
+                    Measurement.objects.filter(
+                        sensor=self.tds_sensor, value__in=range(2, 5)
+                    ).order_by("measured_at"),
+                )
+            ],
+        }
+
+        assert response_data == expected_response
+
+    def test_other_users_measurements_are_hidden(self):
+        other_user = get_user_model().objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        self.client.force_authenticate(user=other_user)
+
+        response = self.client.get(
+            reverse("list-measurements"), {"sensor": self.ph_sensor.id}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert response_data == {"next": None, "results": []}
+
+    def test_stream_request(self):
+        response = self.client.get(
+            reverse("list-measurements"),
+            {"sensor": self.ph_sensor.id, "stream": "true"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/x-ndjson"
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        assert [row["value"] for row in rows] == [
+            f"{minute}.00" for minute in range(10)
+        ]
+
+    async def test_stream_request_under_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        response = await self.async_client.get(
+            reverse("list-measurements"),
+            {"sensor": self.ph_sensor.id, "stream": "true"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.is_async
+        content = b"".join([part async for part in response.streaming_content])
+        assert [json.loads(line)["value"] for line in content.splitlines()] == [
+            f"{minute}.00" for minute in range(10)
+        ]
+
+    def test_fast_serialization_output_is_unchanged(self):
+        Measurement.objects.ingest(
+            [
+                Measurement(
+                    sensor=self.ph_sensor,
+                    value=value,
+                    measured_at=datetime(
+                        2024, 5, 1, 0, 0, second, 1500, dt_timezone.utc
+                    ),
+                )
+                for second, value in enumerate(
+                    [Decimal("-0.05"), Decimal("-12.3"), None]
+                )
+            ]
+        )
+        requests = [
+            {"limit": 5},
+            {"sensor": self.ph_sensor.id, "since": "2024-04-01T00:08:00Z"},
+            {"sensor": self.ph_sensor.id, "stream": "true"},
+        ]
+
+        for params in requests:
+            with self.settings(FAST_SERIALIZATION=True):
+                fast = self.client.get(reverse("list-measurements"), params)
+            with self.settings(FAST_SERIALIZATION=False):
+                slow = self.client.get(reverse("list-measurements"), params)
+
+            assert fast.status_code == status.HTTP_200_OK
+            # json.dumps puts spaces after separators of the streamed lines.
+            assert [json.loads(line) for line in fast.getvalue().splitlines()] == [
+                json.loads(line) for line in slow.getvalue().splitlines()
+            ]
+
+    def test_columnar_request(self):
+        params = {"sensor": self.ph_sensor.id, "limit": 4}
+        response = self.client.get(reverse("list-measurements"), params)
+        rows = json.loads(response.content)["results"]
+
+        response = self.client.get(
+            reverse("list-measurements"),
+            params,
+            headers={"Accept": "application/vnd.hydro.columnar+json"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/vnd.hydro.columnar+json"
+        response_data = json.loads(response.content)
+        assert response_data["next"] == response["Link"][1:].split(">")[0]
+        assert response_data["columns"] == {
+            field: [row[field] for row in rows]
+            for field in ["id", "value", "measured_at", "sensor"]
+        }
+
+    def test_csv_stream_request(self):
+        response = self.client.get(
+            reverse("list-measurements"),
+            {"sensor": self.ph_sensor.id, "stream": "true"},
+            headers={"Accept": "text/csv"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "text/csv"
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(StringIO(content)))
+        assert [row["value"] for row in rows] == [
+            f"{minute}.00" for minute in range(10)
+        ]
+        assert rows[1]["measured_at"] == "2024-04-01T00:01:00Z"
+        assert rows[1]["sensor"] == str(self.ph_sensor.id)
+
+    def test_csv_empty_stream_request(self):
+        response = self.client.get(
+            reverse("list-measurements"),
+            {"since": "2030-01-01T00:00:00Z", "stream": "true", "format": "csv"},
+        )
+
+        content = b"".join(response.streaming_content).decode()
+        assert content.splitlines() == ["id,value,measured_at,sensor"]
+
+    @override_settings(MEASUREMENT_STREAM_CHUNK_SIZE=4)
+    def test_msgpack_stream_request(self):
+        response = self.client.get(
+            reverse("list-measurements"),
+            {"sensor": self.ph_sensor.id, "stream": "true"},
+            headers={"Accept": "application/msgpack"},
+        )
+
+        assert response["Content-Type"] == "application/msgpack"
+        unpacker = msgpack.Unpacker(timestamp=3)
+        unpacker.feed(b"".join(response.streaming_content))
+        chunks = [chunk["columns"] for chunk in unpacker]
+        assert [len(chunk["id"]) for chunk in chunks] == [4, 4, 2]
+        assert chunks[0]["value"][1] == "1.00"
+        assert chunks[0]["measured_at"][1] == datetime(
+            2024, 4, 1, 0, 1, tzinfo=dt_timezone.utc
+        )
+
+    def test_msgpack_page_request(self):
+        response = self.client.get(
+            reverse("list-measurements"),
+            {"limit": 3},
+            headers={"Accept": "application/msgpack"},
+        )
+
+        response_data = msgpack.unpackb(response.content, timestamp=3)
+        assert response_data["next"] is not None
+        assert len(response_data["columns"]["id"]) == 3
+
+    def test_invalid_request_in_compact_format(self):
+        response = self.client.get(
+            reverse("list-measurements"),
+            {"cursor": "abc"},
+            headers={"Accept": "text/csv"},
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response["Content-Type"] == "application/json"
+        assert json.loads(response.content)["error"] == "INVALID_CURSOR"
+
+    def test_invalid_cursor_request(self):
+        response = self.client.get(reverse("list-measurements"), {"cursor": "abc"})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        expected_response = {
+            "error": "INVALID_CURSOR",
+            "errorMessage": "Invalid cursor.",
+        }
+
+        assert response_data == expected_response
+
+
+@pytest.mark.django_db
+class MeasurementExportTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+        self.start = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+        self.create_measurements(0, 10)
+
+    def create_measurements(self, first: int, count: int):
+        Measurement.objects.bulk_create(
+            Measurement(
+                sensor=self.sensor,
+                value=minute % 1000,
+                measured_at=self.start + timedelta(minutes=minute),
+            )
+            for minute in range(first, first + count)
+        )
+
+    def export(self, params: dict | None = None, **kwargs):
+        return self.client.get(reverse("export-measurements"), params, **kwargs)
+
+    def test_ndjson_request(self):
+        response = self.export(
+            {"sensor": self.sensor.id, "since": "2024-04-01T00:05:00Z"}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/x-ndjson"
+        assert "measurements.ndjson" in response["Content-Disposition"]
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        assert [row["value"] for row in rows] == [
+            f"{minute}.00" for minute in range(5, 10)
+        ]
+        assert rows[0]["measured_at"] == "2024-04-01T00:05:00Z"
+        assert rows[0]["sensor"] == self.sensor.id
+
+    def test_csv_request(self):
+        response = self.export(
+            {"system": self.system.id, "until": "2024-04-01T00:02:00Z"},
+            headers={"Accept": "text/csv"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert "measurements.csv" in response["Content-Disposition"]
+        content = b"".join(response.streaming_content).decode()
+        assert [row["value"] for row in csv.DictReader(StringIO(content))] == [
+            "0.00",
+            "1.00",
+        ]
+
+    def test_other_user_request(self):
+        other_user = get_user_model().objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        self.client.force_authenticate(user=other_user)
+
+        response = self.export({"sensor": self.sensor.id})
+
+        assert b"".join(response.streaming_content) == b""
+
+    def test_invalid_request(self):
+        response = self.export({"since": "yesterday"}, headers={"Accept": "text/csv"})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert json.loads(response.content)["error"] == "INVALID_SINCE"
+
+    def test_not_acceptable_request(self):
+        response = self.export(headers={"Accept": "application/json"})
+
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+        assert response["Content-Type"] == "application/json"
+        assert "detail" in json.loads(response.content)
+
+    @override_settings(MEASUREMENT_STREAM_CHUNK_SIZE=500)
+    def test_memory_does_not_grow_with_export_size(self):
+        def export_peak_memory() -> (int, int):
+            tracemalloc.start()
+            try:
+                response = self.export(headers={"Accept": "text/csv"})
+                size = sum(len(part) for part in response.streaming_content)
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        # Warm up, the first request allocates lazily created module state.
+        export_peak_memory()
+        self.create_measurements(10, 1990)
+        small_size, small_peak = export_peak_memory()
+        self.create_measurements(2000, 18000)
+        large_size, large_peak = export_peak_memory()
+
+        assert large_size > 9 * small_size
+        assert large_peak < 1.5 * small_peak
+
+
+@pytest.mark.django_db
+class MeasurementAggregateTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(
+            owner=self.user, name="test_system", description="test_description"
+        )
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.TEMPERATURE
+        )
+        start = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+        Measurement.objects.ingest(
+            [
+                Measurement(
+                    sensor=self.sensor,
+                    value=minute % 7,
+                    measured_at=start + timedelta(minutes=minute),
+                )
+                for minute in range(120)
+            ]
+        )
+
+    def test_buckets_request(self):
+        response = self.client.get(
+            reverse("aggregate-measurements"),
+            {"sensor": self.sensor.id, "interval": "1h"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        expected_response = {
+            "mode": "buckets",
+            "interval": "1h",
+            "source": "rollup_1h",
+            "buckets": [
+                {
+                    "sensor": self.sensor.id,
+                    "bucket": "2024-04-01T00:00:00Z",
+                    "min": "0.00",
+                    "max": "6.00",
+                    "avg": "2.90",
+                    "count": 60,
+                    "last": "3.00",
+                },
+                {
+                    "sensor": self.sensor.id,
+                    "bucket": "2024-04-01T01:00:00Z",
+                    "min": "0.00",
+                    "max": "6.00",
+                    "avg": "3.05",
+                    "count": 60,
+                    "last": "0.00",
+                },
+            ],
+        }
+
+        assert response_data == expected_response
+
+    def test_rollups_match_raw_measurements(self):
+        params = {"sensor": self.sensor.id, "since": "2024-04-01T00:00:00Z"}
+        raw_response = self.client.get(
+            reverse("aggregate-measurements"), {**params, "interval": "5m"}
+        )
+        raw_buckets = json.loads(raw_response.content.decode("utf-8"))["buckets"]
+
+        call_command("rollup_measurements", stdout=StringIO())
+        # Readings arriving after the rollup are merged from raw measurements.
+        late = Measurement(
+            sensor=self.sensor,
+            value=9,
+            measured_at=datetime(2024, 4, 1, 1, 30, 30, tzinfo=dt_timezone.utc),
+        )
+        Measurement.objects.ingest([late])
+
+        response = self.client.get(
+            reverse("aggregate-measurements"), {**params, "interval": "1d"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        assert response_data["source"] == "rollup_1d"
+        assert response_data["buckets"] == [
+            {
+                "sensor": self.sensor.id,
+                "bucket": "2024-04-01T00:00:00Z",
+                "min": "0.00",
+                "max": "9.00",
+                "avg": "3.02",
+                "count": sum(bucket["count"] for bucket in raw_buckets) + 1,
+                "last": "0.00",
+            }
+        ]
+
+    def test_unaligned_range_uses_raw_measurements(self):
+        call_command("rollup_measurements", stdout=StringIO())
+
+        response = self.client.get(
+            reverse("aggregate-measurements"),
+            {"interval": "1h", "since": "2024-04-01T00:30:00Z"},
+        )
+
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert response_data["source"] == "raw"
+        assert [bucket["count"] for bucket in response_data["buckets"]] == [30, 60]
+
+    def test_lttb_request(self):
+        response = self.client.get(
+            reverse("aggregate-measurements"),
+            {"sensor": self.sensor.id, "mode": "lttb", "points": 10},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        points = response_data["points"]
+        assert len(points) == 10
+        assert points[0]["measured_at"] == "2024-04-01T00:00:00Z"
+        assert points[-1]["measured_at"] == "2024-04-01T01:59:00Z"
+
+    def test_invalid_interval_request(self):
+        response = self.client.get(
+            reverse("aggregate-measurements"), {"interval": "7m"}
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert response_data["error"] == "INVALID_INTERVAL"
+
+
+@pytest.mark.django_db
+class MeasurementPartitioningTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.sensor = Sensor.objects.create(system=system, sensor_type=SensorTypes.PH)
+        Measurement.objects.ingest(
+            [
+                Measurement(
+                    sensor=self.sensor,
+                    value=day,
+                    measured_at=datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+                    + timedelta(days=day),
+                )
+                for day in range(60)
+            ]
+        )
+        self.ids = list(Measurement.objects.order_by("id").values_list("id", flat=True))
+        call_command("partition_measurements", "--convert", stdout=StringIO())
+
+    def test_convert_keeps_measurements(self):
+        partitions = get_partitions()
+        assert "sensors_measurement_p2024_04" in partitions
+        assert "sensors_measurement_p2024_05" in partitions
+        ids = Measurement.objects.order_by("id").values_list("id", flat=True)
+        assert list(ids) == self.ids
+
+        # The unique constraint still deduplicates retried uploads.
+        Measurement.objects.ingest(
+            [
+                Measurement(
+                    sensor=self.sensor,
+                    value=0,
+                    measured_at=datetime(2024, 4, 1, tzinfo=dt_timezone.utc),
+                ),
+                Measurement(sensor=self.sensor, value=1),
+            ]
+        )
+        assert Measurement.objects.count() == 61
+        assert Measurement.objects.latest("id").id > self.ids[-1]
+
+    def test_range_query_is_pruned(self):
+        measurements = Measurement.objects.filter(
+            measured_at__gte=datetime(2024, 5, 1, tzinfo=dt_timezone.utc),
+            measured_at__lt=datetime(2024, 5, 10, tzinfo=dt_timezone.utc),
+        )
+
+        plan = measurements.explain()
+        assert "sensors_measurement_p2024_05" in plan
+        assert "sensors_measurement_p2024_04" not in plan
+        assert measurements.count() == 9
+
+    def test_readings_are_moved_from_default_partition(self):
+        measured_at = timezone.now() + timedelta(days=365)
+        Measurement.objects.ingest(
+            [Measurement(sensor=self.sensor, value=1, measured_at=measured_at)]
+        )
+
+        call_command("partition_measurements", "--ahead", "15", stdout=StringIO())
+
+        measurement = Measurement.objects.get(measured_at=measured_at)
+        assert measurement.value == 1
+        assert f"sensors_measurement_p{measured_at:%Y_%m}" in get_partitions()
+
+    def test_drop_old_partitions(self):
+        out = StringIO()
+        call_command(
+            "partition_measurements", "--drop-before", "2024-05-01", stdout=out
+        )
+
+        assert "Dropped partition sensors_measurement_p2024_04." in out.getvalue()
+        assert Measurement.objects.count() == 30
+        assert not Measurement.objects.filter(
+            measured_at__lt=datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        ).exists()
+
+    def test_convert_twice(self):
+        with self.assertRaises(CommandError):
+            call_command("partition_measurements", "--convert", stdout=StringIO())
+
+
+@pytest.mark.django_db
+class MeasurementEventsTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def asgi_get(self, url: str):
+        async def get():
+            return await self.async_client.get(url)
+
+        self.async_client.force_login(self.user)
+        return async_to_sync(get)()
+
+    def subscribe(self, url: str):
+        response = self.asgi_get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "text/event-stream"
+
+        events = aiter(response.streaming_content)
+        self.addCleanup(self.loop.run_until_complete, events.aclose())
+        assert self.next_event(events) == b": connected\n\n"
+        return events
+
+    def next_event(self, events) -> bytes:
+        return self.loop.run_until_complete(anext(events))
+
+    def add_measurement(self, value: float, measured_at="2024-04-01T10:00:00Z"):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("new-measurement", kwargs={"id": self.system.id}),
+                data=json.dumps(
+                    {
+                        "sensor_id": self.sensor.id,
+                        "value": value,
+                        "measured_at": measured_at,
+                    }
+                ),
+                content_type="application/json",
+            )
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_new_measurements_are_pushed(self):
+        system_events = self.subscribe(
+            reverse("system-measurement-events", kwargs={"id": self.system.id})
+        )
+        sensor_events = self.subscribe(
+            reverse("sensor-measurement-events", kwargs={"id": self.sensor.id})
+        )
+
+        self.add_measurement(6.5)
+
+        expected_event = {
+            "sensor": self.sensor.id,
+            "system": self.system.id,
+            "value": "6.50",
+            "measured_at": "2024-04-01T10:00:00Z",
+        }
+        for events in [system_events, sensor_events]:
+            event = self.next_event(events).decode()
+            assert event.startswith("event: measurements\ndata: ")
+            assert json.loads(event.split("data: ")[1]) == [expected_event]
+
+    @override_settings(MEASUREMENT_EVENTS_QUEUE_SIZE=2)
+    def test_slow_consumer_is_dropped(self):
+        events = self.subscribe(
+            reverse("sensor-measurement-events", kwargs={"id": self.sensor.id})
+        )
+
+        for value in range(3):
+            self.add_measurement(value, f"2024-04-01T10:0{value}:00Z")
+
+        assert self.next_event(events) == b"event: dropped\ndata: {}\n\n"
+        with self.assertRaises(StopAsyncIteration):
+            self.next_event(events)
+        assert sensor_topic(self.sensor.id) not in get_broker().subscriptions
+
+    def test_invalid_id_request(self):
+        other_user = get_user_model().objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        other_system = HydroSystem.objects.create(owner=other_user, name="other")
+
+        response = self.asgi_get(
+            reverse("system-measurement-events", kwargs={"id": other_system.id})
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert response_data["error"] == "INVALID_ID"
+
+    def test_wsgi_request(self):
+        response = self.client.get(
+            reverse("sensor-measurement-events", kwargs={"id": self.sensor.id})
+        )
+
+        assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+        response_data = json.loads(response.content.decode("utf-8"))
+        assert response_data["error"] == "ASGI_REQUIRED"
@@ -1,7 +1,11 @@
 from django.urls import path
 
-from .views import (MeasurementCreateView, SensorCreateView, SensorListView,
-                    SensorRemoveView)
+from .views import (MeasurementAggregateView, MeasurementBulkCreateView,
+                    MeasurementCreateView, MeasurementEventsView,
+                    MeasurementExportView, MeasurementListView,
+                    MeasurementQueueStatsView, SensorCreateView,
+                    SensorLatestView, SensorListView, SensorRemoveView,
+                    SystemLatestView)
 
 urlpatterns = [
     path("add/", SensorCreateView.as_view(), name="add-sensor"),
@@ -10,4 +14,41 @@ urlpatterns = [
     path(
         "measurement/<int:id>/", MeasurementCreateView.as_view(), name="new-measurement"
     ),
+    path(
+        "measurement/bulk/",
+        MeasurementBulkCreateView.as_view(),
+        name="new-measurements-bulk",
+    ),
+    path(
+        "measurement/queue/stats/",
+        MeasurementQueueStatsView.as_view(),
+        name="measurement-queue-stats",
+    ),
+    path("measurements/", MeasurementListView.as_view(), name="list-measurements"),
+    path(
+        "measurements/export/",
+        MeasurementExportView.as_view(),
+        name="export-measurements",
+    ),
+    path(
+        "measurements/aggregate/",
+        MeasurementAggregateView.as_view(),
+        name="aggregate-measurements",
+    ),
+    path(
+        "events/system/<int:id>/",
+        MeasurementEventsView.as_view(scope="system"),
+        name="system-measurement-events",
+    ),
+    path(
+        "events/sensor/<int:id>/",
+        MeasurementEventsView.as_view(scope="sensor"),
+        name="sensor-measurement-events",
+    ),
+    path("latest/", SensorLatestView.as_view(), name="latest-measurements"),
+    path(
+        "latest/<int:id>/",
+        SystemLatestView.as_view(),
+        name="system-latest-measurements",
+    ),
 ]
@@ -1,17 +1,59 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator, Iterable, Iterator
+from itertools import groupby, islice
+from operator import itemgetter
+
+import orjson
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from drf_spectacular.utils import extend_schema
-from rest_framework import status
+from rest_framework import serializers, status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from systems.authentication import GatewayKeyAuthentication
+from systems.cache import CachedResponseMixin
+from systems.ownership import OwnershipMixin
 from systems.serializers import ErrorMessageSerializer
+from systems.throttling import IngestRateThrottle, ReadRateThrottle
 from users.serializers import MessageSerializer
 
-from .models import Measurement, Sensor, SensorTypes
-from .serializers import (AddMeasurementSerializer, AddSensorSerializer,
+from .aggregation import (aggregate_measurements, aggregate_rollups, lttb,
+                          merge_buckets, select_rollup)
+from .events import get_broker, sensor_topic, system_topic
+from .models import (Measurement, MeasurementRollup, RollupWatermark, Sensor,
+                     SensorLatest, SensorTypes)
+from .pagination import MeasurementKeysetPagination
+from .queue import get_queue
+from .renderers import (ColumnarJSONRenderer, CSVRenderer, MessagePackRenderer,
+                        NDJSONRenderer, ORJSONRenderer)
+from .rows import (measurement_columns, measurement_dicts, measurement_rows,
+                   sensor_dicts, stream_measurement_columns)
+from .serializers import (AddMeasurementSerializer,
+                          AddMeasurementsResponseSerializer,
+                          AddMeasurementsSerializer, AddSensorSerializer,
+                          MeasurementAggregateQuerySerializer,
+                          MeasurementAggregateSerializer,
+                          MeasurementBucketSerializer,
+                          MeasurementFilterSerializer,
+                          MeasurementPageSerializer,
+                          MeasurementPointSerializer,
+                          MeasurementQuerySerializer,
+                          MeasurementQueueStatsSerializer,
+                          MeasurementSerializer, SensorLatestSerializer,
                           SensorSerializer)
 
+# Parts of a synchronous stream fetched per thread switch under ASGI.
+STREAM_THREAD_BATCH = 100
 
-class SensorCreateView(APIView):
+
+class SensorCreateView(OwnershipMixin, APIView):
     """Add new sensor to existing system."""
 
     serializer_class = AddSensorSerializer
@@ -28,8 +70,7 @@ class SensorCreateView(APIView):
         if error:
             return Response(data, status=error)
 
-        user_systems = request.user.systems.all()
-        system = user_systems.filter(id=data.get("system_id")).first()
+        system = self.get_user_system(request, data.get("system_id"))
 
         if not system:
             response_data = {
@@ -80,7 +121,7 @@ class SensorCreateView(APIView):
         return cleaned_data, None
 
 
-class SensorRemoveView(APIView):
+class SensorRemoveView(OwnershipMixin, APIView):
     """Remove sensor from user's system."""
 
     serializer_class = None
@@ -92,9 +133,7 @@ class SensorRemoveView(APIView):
         },
     )
     def delete(self, request, id):
-        user_systems = request.user.systems.all()
-        sensors = Sensor.objects.filter(system__in=user_systems)
-        target_sensor = sensors.filter(id=id).first()
+        target_sensor = self.get_user_sensor(request, id)
 
         if not target_sensor:
             response_data = {
@@ -109,10 +148,12 @@ class SensorRemoveView(APIView):
         return Response(response_data, status=status.HTTP_200_OK)
 
 
-class SensorListView(APIView):
+class SensorListView(OwnershipMixin, CachedResponseMixin, AsyncAPIView):
     """List all sensors in specified system."""
 
+    throttle_classes = [ReadRateThrottle]
     serializer_class = None
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     @extend_schema(
         responses={
@@ -120,29 +161,45 @@ class SensorListView(APIView):
             400: ErrorMessageSerializer,
         },
     )
-    def get(self, request, id):
-        user_systems = request.user.systems.all()
-        target_system = user_systems.filter(id=id)
-        if not target_system:
+    async def get(self, request, id):
+        return await self.acached_response(
+            request, [("sensors", id)], lambda: self.list(request, id)
+        )
+
+    async def list(self, request, id: int) -> Response:
+        sensors = Sensor.objects.order_by("id")
+        if settings.FAST_SERIALIZATION:
+            sensors = sensor_dicts(sensors)
+        sensors = await self.afilter_user_system(request, sensors, id)
+        if sensors is None:
             response_data = {
                 "error": "INVALID_ID",
                 "errorMessage": "System with this ID doesn't exist or you don't have permission to access it.",
                 "id": id,
             }
             return Response(response_data, status=status.HTTP_404_NOT_FOUND)
-        sensors = Sensor.objects.filter(system__in=target_system)
+        if settings.FAST_SERIALIZATION:
+            return Response(sensors, status=status.HTTP_200_OK)
         serializer = SensorSerializer(sensors, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class MeasurementCreateView(APIView):
+class MeasurementCreateView(OwnershipMixin, APIView):
     """Create new measurement."""
 
+    authentication_classes = [*APIView.authentication_classes, GatewayKeyAuthentication]
+    throttle_classes = [IngestRateThrottle]
     serializer_class = AddMeasurementSerializer
 
+    value_field = serializers.DecimalField(
+        max_digits=9, decimal_places=2, allow_null=True
+    )
+    measured_at_field = serializers.DateTimeField()
+
     @extend_schema(
         responses={
-            200: MessageSerializer,
+            201: MessageSerializer,
+            202: MessageSerializer,
             400: ErrorMessageSerializer,
             404: ErrorMessageSerializer,
         },
@@ -152,9 +209,8 @@ class MeasurementCreateView(APIView):
         if error:
             return Response(data, status=error)
 
-        user_systems = request.user.systems.all()
-        target_system = user_systems.filter(id=id)
-        if not target_system:
+        sensor = self.get_user_sensor(request, data.get("sensor_id"), system_id=id)
+        if not sensor and not self.is_user_system(request, id):
             response_data = {
                 "error": "INVALID_ID",
                 "errorMessage": "System with this ID doesn't exist or you don't have permission to access it.",
@@ -162,9 +218,6 @@ class MeasurementCreateView(APIView):
             }
             return Response(response_data, status=status.HTTP_404_NOT_FOUND)
 
-        sensors = Sensor.objects.filter(system__in=target_system)
-        sensor = sensors.filter(id=data.get("sensor_id")).first()
-
         if not sensor:
             response_data = {
                 "error": "INVALID_SENSOR_ID",
@@ -173,7 +226,15 @@ class MeasurementCreateView(APIView):
             }
             return Response(response_data, status=status.HTTP_404_NOT_FOUND)
 
-        Measurement.objects.create(sensor=sensor, value=data.get("value"))
+        measurement = Measurement(sensor=sensor, value=data.get("value"))
+        if data.get("measured_at"):
+            measurement.measured_at = data["measured_at"]
+        if settings.MEASUREMENT_QUEUE_ENABLED:
+            get_queue().put([measurement])
+            response_data = {"message": "Measurement queued for the database."}
+            return Response(response_data, status=status.HTTP_202_ACCEPTED)
+
+        Measurement.objects.ingest([measurement])
         response_data = {"message": "Measurement added to the database."}
         return Response(response_data, status=status.HTTP_201_CREATED)
 
@@ -186,6 +247,629 @@ class MeasurementCreateView(APIView):
             }
             return error_data, status.HTTP_400_BAD_REQUEST
 
-        value = data.get("value")
-        clean_data = {"sensor_id": sensor_id, "value": value}
+        measured_at = data.get("measured_at")
+        if measured_at:
+            try:
+                measured_at = self.measured_at_field.run_validation(measured_at)
+            except serializers.ValidationError as exc:
+                error_data = {
+                    "error": "INVALID_MEASURED_AT",
+                    "errorMessage": " ".join(exc.detail),
+                }
+                return error_data, status.HTTP_400_BAD_REQUEST
+
+        try:
+            value = self.value_field.run_validation(data.get("value"))
+        except serializers.ValidationError as exc:
+            error_data = {
+                "error": "INVALID_VALUE",
+                "errorMessage": " ".join(exc.detail),
+            }
+            return error_data, status.HTTP_400_BAD_REQUEST
+
+        clean_data = {
+            "sensor_id": sensor_id,
+            "value": value,
+            "measured_at": measured_at,
+        }
         return clean_data, None
+
+
+class MeasurementBulkCreateView(OwnershipMixin, APIView):
+    """Create many measurements for any of the user's sensors at once."""
+
+    authentication_classes = [*APIView.authentication_classes, GatewayKeyAuthentication]
+    throttle_classes = [IngestRateThrottle]
+    serializer_class = AddMeasurementsSerializer
+
+    sensor_id_field = serializers.IntegerField()
+    value_field = serializers.DecimalField(max_digits=9, decimal_places=2)
+    measured_at_field = serializers.DateTimeField()
+
+    @extend_schema(
+        responses={
+            201: AddMeasurementsResponseSerializer,
+            202: AddMeasurementsResponseSerializer,
+            400: AddMeasurementsResponseSerializer,
+        },
+    )
+    def post(self, request):
+        rows, error = self.clean(request.data)
+        if error:
+            return Response(rows, status=error)
+
+        rows, errors = self.clean_rows(rows)
+        sensor_ids = {row["sensor_id"] for row in rows}
+        user_sensors = Sensor.objects.filter(
+            id__in=sensor_ids, system__owner=request.user
+        )
+        user_sensor_ids = set(
+            self.limit_to_gateway(request, user_sensors).values_list("id", flat=True)
+        )
+
+        measurements = []
+        for row in rows:
+            if row["sensor_id"] not in user_sensor_ids:
+                errors.append(
+                    {
+                        "index": row["index"],
+                        "error": "INVALID_SENSOR_ID",
+                        "errorMessage": "Sensor with this ID doesn't exist or you don't have permission to access it.",
+                        "sensor_id": row["sensor_id"],
+                    }
+                )
+                continue
+            measurement = Measurement(sensor_id=row["sensor_id"], value=row["value"])
+            if row["measured_at"]:
+                measurement.measured_at = row["measured_at"]
+            measurements.append(measurement)
+
+        errors.sort(key=lambda row_error: row_error["index"])
+        if not measurements:
+            response_data = {
+                "message": "No measurements added to the database.",
+                "created": 0,
+                "accepted": 0,
+                "errors": errors,
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        if settings.MEASUREMENT_QUEUE_ENABLED:
+            get_queue().put(measurements)
+            response_data = {
+                "message": f"{len(measurements)} measurements queued for the database.",
+                "created": 0,
+                "accepted": len(measurements),
+                "errors": errors,
+            }
+            return Response(response_data, status=status.HTTP_202_ACCEPTED)
+
+        created = Measurement.objects.ingest(measurements)
+        response_data = {
+            "message": f"{len(created)} measurements added to the database.",
+            "created": len(created),
+            "accepted": len(measurements),
+            "errors": errors,
+        }
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+    def clean(self, data: dict) -> (list | dict, int | None):
+        rows = data.get("measurements")
+        if not rows or not isinstance(rows, list):
+            error_data = {
+                "error": "MISSING_MEASUREMENTS",
+                "errorMessage": "Please provide a list of measurements.",
+            }
+            return error_data, status.HTTP_400_BAD_REQUEST
+
+        max_size = settings.MEASUREMENT_BULK_MAX_SIZE
+        if len(rows) > max_size:
+            error_data = {
+                "error": "TOO_MANY_MEASUREMENTS",
+                "errorMessage": f"Please provide at most {max_size} measurements per request.",
+            }
+            return error_data, status.HTTP_400_BAD_REQUEST
+
+        return rows, None
+
+    def clean_rows(self, rows: list) -> (list[dict], list[dict]):
+        cleaned_rows = []
+        errors = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                errors.append(
+                    {
+                        "index": index,
+                        "error": "INVALID_MEASUREMENT",
+                        "errorMessage": "Measurement must be an object with sensor_id and value.",
+                    }
+                )
+                continue
+
+            try:
+                sensor_id = self.sensor_id_field.run_validation(row.get("sensor_id"))
+            except serializers.ValidationError:
+                errors.append(
+                    {
+                        "index": index,
+                        "error": "MISSING_SENSOR_ID",
+                        "errorMessage": "Please provide a valid sensor id.",
+                    }
+                )
+                continue
+
+            try:
+                value = self.value_field.run_validation(row.get("value"))
+            except serializers.ValidationError as exc:
+                errors.append(
+                    {
+                        "index": index,
+                        "error": "INVALID_VALUE",
+                        "errorMessage": " ".join(exc.detail),
+                        "sensor_id": sensor_id,
+                    }
+                )
+                continue
+
+            measured_at = row.get("measured_at")
+            if measured_at:
+                try:
+                    measured_at = self.measured_at_field.run_validation(measured_at)
+                except serializers.ValidationError as exc:
+                    errors.append(
+                        {
+                            "index": index,
+                            "error": "INVALID_MEASURED_AT",
+                            "errorMessage": " ".join(exc.detail),
+                            "sensor_id": sensor_id,
+                        }
+                    )
+                    continue
+
+            cleaned_rows.append(
+                {
+                    "index": index,
+                    "sensor_id": sensor_id,
+                    "value": value,
+                    "measured_at": measured_at,
+                }
+            )
+        return cleaned_rows, errors
+
+
+class MeasurementQueueStatsView(APIView):
+    """Show depth, lag and flush throughput of the ingestion queue, for staff only."""
+
+    serializer_class = None
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses={200: MeasurementQueueStatsSerializer})
+    def get(self, request):
+        stats = get_queue().stats()
+        stats["rows_per_second"] = (
+            stats["flushed"] / stats["flush_seconds"] if stats["flush_seconds"] else 0
+        )
+        return Response(stats, status=status.HTTP_200_OK)
+
+
+class SensorLatestView(APIView):
+    """List the latest reading of every sensor of the user."""
+
+    throttle_classes = [ReadRateThrottle]
+    serializer_class = None
+
+    @extend_schema(responses={200: SensorLatestSerializer(many=True)})
+    def get(self, request):
+        latest = (
+            SensorLatest.objects.select_related("sensor")
+            .filter(system__owner=request.user)
+            .order_by("sensor_id")
+        )
+        serializer = SensorLatestSerializer(latest, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class SystemLatestView(OwnershipMixin, APIView):
+    """List the latest reading of every sensor of one system."""
+
+    throttle_classes = [ReadRateThrottle]
+    serializer_class = None
+
+    @extend_schema(
+        # Both latest views return lists, the generated ids would collide.
+        operation_id="sensors_latest_system_list",
+        responses={
+            200: SensorLatestSerializer(many=True),
+            404: ErrorMessageSerializer,
+        },
+    )
+    def get(self, request, id):
+        latest = SensorLatest.objects.select_related("sensor").order_by("sensor_id")
+        latest = self.filter_user_system(request, latest, id)
+        if latest is None:
+            response_data = {
+                "error": "INVALID_ID",
+                "errorMessage": (
+                    "System with this ID doesn't exist or you don't have "
+                    "permission to access it."
+                ),
+                "id": id,
+            }
+            return Response(response_data, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = SensorLatestSerializer(latest, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class MeasurementEventsView(OwnershipMixin, APIView):
+    """Push new readings of a system or a sensor as Server-Sent Events.
+
+    Needs an ASGI server, WSGI servers would collect the endless stream before
+    sending any of it, so they are answered with 501. A stream ends after
+    MEASUREMENT_EVENTS_MAX_AGE seconds or once the client falls
+    MEASUREMENT_EVENTS_QUEUE_SIZE messages behind, EventSource clients then
+    reconnect on their own.
+    """
+
+    serializer_class = None
+    scope = None
+
+    @extend_schema(
+        responses={
+            (200, "text/event-stream"): str,
+            404: ErrorMessageSerializer,
+            501: ErrorMessageSerializer,
+        },
+    )
+    def get(self, request, id):
+        if not isinstance(request._request, ASGIRequest):
+            response_data = {
+                "error": "ASGI_REQUIRED",
+                "errorMessage": "Live readings are only available from an ASGI server.",
+            }
+            return Response(response_data, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        if self.scope == "system":
+            exists = self.is_user_system(request, id)
+            topic = system_topic(id)
+        else:
+            exists = self.get_user_sensor(request, id) is not None
+            topic = sensor_topic(id)
+
+        if not exists:
+            response_data = {
+                "error": "INVALID_ID",
+                "errorMessage": (
+                    f"{self.scope.capitalize()} with this ID doesn't exist "
+                    "or you don't have permission to access it."
+                ),
+                "id": id,
+            }
+            return Response(response_data, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(
+            self.stream(topic), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, topic: str):
+        broker = get_broker()
+        subscription = broker.subscribe(topic)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.MEASUREMENT_EVENTS_MAX_AGE
+        try:
+            yield ": connected\n\n"
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.queue.get(),
+                        min(settings.MEASUREMENT_EVENTS_KEEPALIVE, remaining),
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if message is None:
+                    yield "event: dropped\ndata: {}\n\n"
+                    return
+                yield f"event: measurements\ndata: {message}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+
+class MeasurementFilterMixin:
+    """Validate query params and filter the user's measurements with them."""
+
+    query_serializer_class = MeasurementQuerySerializer
+
+    def filter_measurements(
+        self, request, data: dict, queryset=None, time_field: str = "measured_at"
+    ):
+        if queryset is None:
+            queryset = Measurement.objects.all()
+        measurements = queryset.filter(sensor__system__owner=request.user)
+        if "sensor" in data:
+            measurements = measurements.filter(sensor_id=data["sensor"])
+        if "system" in data:
+            measurements = measurements.filter(sensor__system_id=data["system"])
+        if "type" in data:
+            measurements = measurements.filter(sensor__sensor_type=data["type"])
+        if "since" in data:
+            measurements = measurements.filter(**{f"{time_field}__gte": data["since"]})
+        if "until" in data:
+            measurements = measurements.filter(**{f"{time_field}__lt": data["until"]})
+        return measurements
+
+    def clean(self, params: dict) -> (dict, int | None):
+        serializer = self.query_serializer_class(data=params)
+        if not serializer.is_valid():
+            param, messages = next(iter(serializer.errors.items()))
+            error_data = {
+                "error": f"INVALID_{param.upper()}",
+                "errorMessage": " ".join(messages),
+            }
+            return error_data, status.HTTP_400_BAD_REQUEST
+
+        return serializer.validated_data, None
+
+
+def streaming_response(
+    request, content: Iterator, content_type: str
+) -> StreamingHttpResponse:
+    """Stream `content` under WSGI and ASGI alike.
+
+    Django reads a synchronous iterator served over ASGI completely before
+    sending anything, so there it is advanced in a worker thread instead,
+    STREAM_THREAD_BATCH parts at a time.
+    """
+    if isinstance(request._request, ASGIRequest):
+        content = iterate_in_thread(content)
+    return StreamingHttpResponse(content, content_type=content_type)
+
+
+async def iterate_in_thread(content: Iterable) -> AsyncIterator:
+    parts = iter(content)
+    next_parts = sync_to_async(lambda: list(islice(parts, STREAM_THREAD_BATCH)))
+    while batch := await next_parts():
+        for part in batch:
+            yield part
+
+
+class ColumnarFormatMixin:
+    """Answer errors in JSON when a columnar renderer was negotiated or none was.
+
+    Compact formats only describe measurements. Without a negotiated renderer,
+    e.g. for 406 Not Acceptable, DRF would fall back to the first one.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        renderer = getattr(request, "accepted_renderer", None)
+        if response.status_code >= 400 and (
+            renderer is None or getattr(renderer, "columnar", False)
+        ):
+            request.accepted_renderer = ORJSONRenderer()
+            request.accepted_media_type = ORJSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class MeasurementListView(ColumnarFormatMixin, MeasurementFilterMixin, AsyncAPIView):
+    """Query measurements of the user's sensors, oldest first.
+
+    Pages are linked with a keyset cursor, ?stream=true returns the whole
+    result as newline delimited JSON instead. Columnar JSON, CSV and
+    MessagePack are returned for their Accept header or ?format=.
+    """
+
+    throttle_classes = [ReadRateThrottle]
+    serializer_class = None
+    renderer_classes = [
+        ORJSONRenderer,
+        ColumnarJSONRenderer,
+        CSVRenderer,
+        MessagePackRenderer,
+        BrowsableAPIRenderer,
+    ]
+
+    @extend_schema(
+        parameters=[MeasurementQuerySerializer],
+        responses={
+            200: MeasurementPageSerializer,
+            400: ErrorMessageSerializer,
+        },
+    )
+    async def get(self, request):
+        data, error = self.clean(request.query_params)
+        if error:
+            return Response(data, status=error)
+
+        measurements = self.filter_measurements(request, data)
+        columnar = getattr(request.accepted_renderer, "columnar", False)
+        if data["stream"] and columnar:
+            return self.stream_columns(request, measurements)
+        if data["stream"]:
+            return self.stream(request, measurements)
+
+        paginator = MeasurementKeysetPagination(page_size=data["limit"])
+        if columnar:
+            page = await paginator.apaginate_queryset(
+                measurement_rows(measurements), request, position=data.get("cursor")
+            )
+            return paginator.get_columnar_response(measurement_columns(page))
+
+        if settings.FAST_SERIALIZATION:
+            page = await paginator.apaginate_queryset(
+                measurement_rows(measurements), request, position=data.get("cursor")
+            )
+            return paginator.get_paginated_response(list(measurement_dicts(page)))
+
+        page = await paginator.apaginate_queryset(
+            measurements, request, position=data.get("cursor")
+        )
+        serializer = MeasurementSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def stream(self, request, measurements) -> StreamingHttpResponse:
+        ordering = MeasurementKeysetPagination.ordering
+        chunk_size = settings.MEASUREMENT_STREAM_CHUNK_SIZE
+        if settings.FAST_SERIALIZATION:
+            rows = measurement_rows(measurements).order_by(*ordering)
+            options = ORJSONRenderer.options | orjson.OPT_APPEND_NEWLINE
+            lines = (
+                orjson.dumps(measurement, option=options)
+                for measurement in measurement_dicts(
+                    rows.iterator(chunk_size=chunk_size)
+                )
+            )
+        else:
+            serializer = MeasurementSerializer()
+            rows = measurements.order_by(*ordering).iterator(chunk_size=chunk_size)
+            lines = (
+                json.dumps(serializer.to_representation(measurement)) + "\n"
+                for measurement in rows
+            )
+        return streaming_response(request, lines, "application/x-ndjson")
+
+    def stream_columns(self, request, measurements) -> StreamingHttpResponse:
+        renderer = request.accepted_renderer
+        chunks = stream_measurement_columns(
+            measurements, settings.MEASUREMENT_STREAM_CHUNK_SIZE
+        )
+        return streaming_response(request, renderer.stream(chunks), renderer.media_type)
+
+
+class MeasurementExportView(ColumnarFormatMixin, MeasurementFilterMixin, APIView):
+    """Download measurements of the user's sensors as NDJSON or CSV, oldest first.
+
+    Rows are read through a server-side cursor and written out chunk by chunk,
+    so exports of any size use the same amount of memory.
+    """
+
+    throttle_classes = [ReadRateThrottle]
+    serializer_class = None
+    query_serializer_class = MeasurementFilterSerializer
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    @extend_schema(
+        parameters=[MeasurementFilterSerializer],
+        responses={
+            (200, "application/x-ndjson"): MeasurementSerializer,
+            (200, "text/csv"): str,
+            400: ErrorMessageSerializer,
+        },
+    )
+    def get(self, request):
+        data, error = self.clean(request.query_params)
+        if error:
+            return Response(data, status=error)
+
+        measurements = self.filter_measurements(request, data)
+        renderer = request.accepted_renderer
+        chunks = stream_measurement_columns(
+            measurements, settings.MEASUREMENT_STREAM_CHUNK_SIZE
+        )
+        response = streaming_response(
+            request, renderer.stream(chunks), renderer.media_type
+        )
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="measurements.{renderer.format}"'
+        return response
+
+
+class MeasurementAggregateView(MeasurementFilterMixin, APIView):
+    """Aggregate measurements of the user's sensors for charts.
+
+    mode=buckets returns min, max, avg, count and last value of every sensor per
+    interval, read from the coarsest fitting rollup when possible. mode=lttb
+    returns at most `points` representative raw readings of every sensor.
+    """
+
+    throttle_classes = [ReadRateThrottle]
+    serializer_class = None
+    query_serializer_class = MeasurementAggregateQuerySerializer
+
+    @extend_schema(
+        parameters=[MeasurementAggregateQuerySerializer],
+        responses={
+            200: MeasurementAggregateSerializer,
+            400: ErrorMessageSerializer,
+        },
+    )
+    def get(self, request):
+        data, error = self.clean(request.query_params)
+        if error:
+            return Response(data, status=error)
+
+        measurements = self.filter_measurements(request, data)
+        if data["mode"] == "lttb":
+            points = self.downsample(measurements, data["points"])
+            serializer = MeasurementPointSerializer(points, many=True)
+            response_data = {"mode": "lttb", "points": serializer.data}
+            return Response(response_data, status=status.HTTP_200_OK)
+
+        max_buckets = settings.MEASUREMENT_AGGREGATE_MAX_BUCKETS
+        interval = data["interval"]
+        resolution = select_rollup(interval, data.get("since"), data.get("until"))
+        if resolution:
+            source = f"rollup_{resolution}"
+            buckets = self.aggregate_with_rollups(
+                request, data, measurements, resolution, max_buckets + 1
+            )
+        else:
+            source = "raw"
+            buckets = aggregate_measurements(measurements, interval)
+            buckets = merge_buckets(buckets[: max_buckets + 1])
+
+        if len(buckets) > max_buckets:
+            response_data = {
+                "error": "TOO_MANY_BUCKETS",
+                "errorMessage": "Please narrow the time range or use a longer interval.",
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = MeasurementBucketSerializer(buckets, many=True)
+        response_data = {
+            "mode": "buckets",
+            "interval": interval,
+            "source": source,
+            "buckets": serializer.data,
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+    def aggregate_with_rollups(
+        self, request, data: dict, measurements, resolution: str, limit: int
+    ) -> list[dict]:
+        """Combine rollup buckets with raw measurements not rolled up yet."""
+        watermark = RollupWatermark.objects.filter(
+            name=RollupWatermark.MEASUREMENTS
+        ).first()
+        rolled_up_id = watermark.measurement_id if watermark else 0
+
+        rollups = self.filter_measurements(
+            request,
+            data,
+            queryset=MeasurementRollup.objects.filter(resolution=resolution),
+            time_field="bucket",
+        )
+        rollup_buckets = aggregate_rollups(rollups, data["interval"])
+        recent_buckets = aggregate_measurements(
+            measurements.filter(id__gt=rolled_up_id), data["interval"]
+        )
+        return merge_buckets(rollup_buckets[:limit], recent_buckets[:limit])
+
+    def downsample(self, measurements, threshold: int) -> list[dict]:
+        rows = (
+            measurements.order_by("sensor_id", "measured_at")
+            .values_list("sensor_id", "measured_at", "value")
+            .iterator(chunk_size=settings.MEASUREMENT_STREAM_CHUNK_SIZE)
+        )
+        points = []
+        for sensor_id, sensor_rows in groupby(rows, key=itemgetter(0)):
+            series = [(measured_at, value) for _, measured_at, value in sensor_rows]
+            points += [
+                {"sensor_id": sensor_id, "measured_at": measured_at, "value": value}
+                for measured_at, value in lttb(series, threshold)
+            ]
+        return points
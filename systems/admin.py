@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import GatewayKey, RetentionPolicy
+
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ["system", "sensor_type", "raw_days", "hourly_days", "daily_days"]
+
+
+@admin.register(GatewayKey)
+class GatewayKeyAdmin(admin.ModelAdmin):
+    list_display = ["prefix", "name", "system", "created_at", "revoked_at"]
+    # Keys are created through the API, which shows their secret once.
+    readonly_fields = ["system", "prefix", "key_hash", "created_at"]
+
+    def has_add_permission(self, request):
+        return False
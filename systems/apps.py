@@ -1,6 +1,28 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class SystemsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "systems"
+
+    def ready(self):
+        from sensors.models import Sensor
+        from sensors.signals import measurements_ingested
+
+        from . import schema  # noqa: F401
+        from .authentication import forget_gateway_key
+        from .cache import (
+            invalidate_deleted_sensor,
+            invalidate_measurements,
+            invalidate_sensor,
+            invalidate_system,
+        )
+        from .models import GatewayKey, HydroSystem
+
+        for signal in [post_save, post_delete]:
+            signal.connect(invalidate_system, sender=HydroSystem)
+            signal.connect(forget_gateway_key, sender=GatewayKey)
+        post_save.connect(invalidate_sensor, sender=Sensor)
+        post_delete.connect(invalidate_deleted_sensor, sender=Sensor)
+        measurements_ingested.connect(invalidate_measurements)
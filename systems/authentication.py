@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import GatewayKey, hash_key
+
+# Verified keys by digest, with the monotonic time they expire at. Revoking or
+# deleting a key evicts it here, other processes notice within the TTL.
+verified_keys: dict[str, tuple[GatewayKey, float]] = {}
+
+
+def get_gateway_key(raw_key: str) -> GatewayKey | None:
+    """Return the active key with its system and owner, None if there is none."""
+    key_hash = hash_key(raw_key)
+    entry = verified_keys.get(key_hash)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+
+    key = (
+        GatewayKey.objects.select_related("system__owner")
+        .filter(key_hash=key_hash, revoked_at__isnull=True)
+        .first()
+    )
+    if key is None:
+        verified_keys.pop(key_hash, None)
+        return None
+    verified_keys[key_hash] = (key, time.monotonic() + settings.GATEWAY_KEY_CACHE_TTL)
+    return key
+
+
+def forget_gateway_key(sender, instance: GatewayKey, **kwargs):
+    verified_keys.pop(instance.key_hash, None)
+
+
+class GatewayKeyAuthentication(BaseAuthentication):
+    """Authenticate sensor gateways sending `Authorization: Gateway <key>`.
+
+    The request acts as the owner of the key's system, with the key as
+    request.auth, so ownership checks can limit it to that system.
+    """
+
+    keyword = "Gateway"
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) != 2:
+            raise AuthenticationFailed("Invalid gateway key header.")
+
+        key = get_gateway_key(header[1].decode("latin-1"))
+        if key is None or not key.system.owner.is_active:
+            raise AuthenticationFailed("Invalid or revoked gateway key.")
+        return key.system.owner, key
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,166 @@
+"""Benchmark scenarios of system reads, serving, authentication and rate limits.
+
+Run by `manage.py benchmark`, which passes itself as `command` with the
+benchmark system, its sensors and the reporting helpers.
+"""
+
+import asyncio
+import base64
+import time
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import GatewayKeyAuthentication
+from .cache import invalidate
+from .management.commands.benchmark import BENCHMARK_PASSWORD, BENCHMARK_USERNAME
+from .models import GatewayKey
+from .throttling import (
+    IngestRateThrottle,
+    LocalBuckets,
+    ReadRateThrottle,
+    RedisBuckets,
+    get_buckets,
+)
+from .views import SystemDetailView
+
+
+def benchmark_detail(command, rows: int, requests: int = 50):
+    view = SystemDetailView.as_view()
+    created = 0
+    for history in [rows // 100, rows // 10, rows]:
+        command.create_history(history - created, start=created)
+        created = history
+
+        for cached in [False, True]:
+            start = time.perf_counter()
+            for _ in range(requests):
+                if not cached:
+                    invalidate(("measurements", command.system.id))
+                command.call_view(
+                    view, "/systems/detail/", {}, method="get", id=command.system.id
+                )
+            elapsed = time.perf_counter() - start
+            command.stdout.write(
+                f"System detail with {history} measurements"
+                f"{' (cached)' if cached else ''}: "
+                f"{elapsed / requests * 1000:.2f}ms per request"
+            )
+
+
+def benchmark_concurrency(command, rows: int):
+    """Load the read endpoints through uvicorn as a WSGI and as an ASGI app."""
+    command.create_history(rows)
+    token = str(AccessToken.for_user(command.user))
+    requests = [
+        command.http_request("GET", path, token)
+        for path in [
+            reverse("system-detail", kwargs={"id": command.system.id}),
+            reverse("list-sensors", kwargs={"id": command.system.id}),
+            f"{reverse('list-measurements')}?system={command.system.id}&limit=100",
+        ]
+    ]
+    for label, application, interface in [
+        ("WSGI", "hydro.wsgi:application", "wsgi"),
+        ("ASGI", "hydro.asgi:application", "asgi3"),
+    ]:
+        with command.server(application, interface) as port:
+            result = asyncio.run(command.load(port, requests))
+        command.report_load(f"{label} with {command.connections} connections", *result)
+
+
+def benchmark_connections(command, rows: int):
+    """POST single readings through uvicorn, with and without reused connections."""
+    token = str(AccessToken.for_user(command.user))
+    path = reverse("new-measurement", kwargs={"id": command.system.id})
+    requests = [
+        command.http_request(
+            "POST", path, token, {"sensor_id": sensor.id, "value": 6.5}
+        )
+        for sensor in command.sensors
+    ]
+    for max_age in ["0", str(settings.DATABASES["default"]["CONN_MAX_AGE"])]:
+        with command.server(
+            "hydro.wsgi:application", "wsgi", DB_CONN_MAX_AGE=max_age
+        ) as port:
+            result = asyncio.run(command.load(port, requests))
+        command.report_load(f"CONN_MAX_AGE={max_age}", *result)
+
+
+def benchmark_auth(command, rows: int):
+    """Authenticate `rows` ingestion requests with each scheme a gateway can use."""
+    _, raw_key = GatewayKey.objects.create_key(command.system, "Benchmark gateway")
+    token = str(AccessToken.for_user(command.user))
+    credentials = f"{BENCHMARK_USERNAME}:{BENCHMARK_PASSWORD}".encode()
+    # Every Basic request hashes the password, a few are enough.
+    for label, authentication, header, count in [
+        (
+            "Basic",
+            BasicAuthentication(),
+            f"Basic {base64.b64encode(credentials).decode()}",
+            max(rows // 100, 10),
+        ),
+        ("JWT", JWTAuthentication(), f"Bearer {token}", rows),
+        ("Gateway key", GatewayKeyAuthentication(), f"Gateway {raw_key}", rows),
+    ]:
+        request = Request(command.factory.post("/", HTTP_AUTHORIZATION=header))
+        start = time.perf_counter()
+        for _ in range(count):
+            authentication.authenticate(request)
+        elapsed = time.perf_counter() - start
+        command.stdout.write(
+            f"{label}: {elapsed / count * 1_000_000:.1f}us per request "
+            f"({count} requests)"
+        )
+
+
+def benchmark_throttle(command, rows: int):
+    """Cost of the rate limit check, alone and for a whole cached request."""
+    with override_settings(
+        RATE_LIMITS={
+            "read": {"user": (rows, rows)},
+            "ingest": {"system": (rows, rows)},
+        }
+    ):
+        request = Request(command.factory.get("/"))
+        request.user = command.user
+        request.auth = GatewayKey(system=command.system)
+        backends = [("in process", LocalBuckets())]
+        if settings.RATE_LIMIT_REDIS_URL:
+            backends.append(("Redis", RedisBuckets(settings.RATE_LIMIT_REDIS_URL)))
+        for label, buckets in backends:
+            with patch("systems.throttling.get_buckets", return_value=buckets):
+                for throttle in [ReadRateThrottle(), IngestRateThrottle()]:
+                    start = time.perf_counter()
+                    for _ in range(rows):
+                        throttle.allow_request(request, None)
+                    elapsed = time.perf_counter() - start
+                    command.stdout.write(
+                        f"{throttle.scope} check {label}: "
+                        f"{elapsed / rows * 1_000_000:.1f}us per request"
+                    )
+
+    view = SystemDetailView.as_view()
+    command.call_view(view, "/systems/detail/", {}, method="get", id=command.system.id)
+    for label, limits in [
+        ("without", {}),
+        ("with", {"read": {"user": (rows, rows)}}),
+    ]:
+        with override_settings(RATE_LIMITS=limits):
+            get_buckets.cache_clear()
+            start = time.perf_counter()
+            for _ in range(rows):
+                command.call_view(
+                    view, "/systems/detail/", {}, method="get", id=command.system.id
+                )
+            elapsed = time.perf_counter() - start
+        command.stdout.write(
+            f"Cached system detail {label} rate limits: "
+            f"{elapsed / rows * 1000:.3f}ms per request"
+        )
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import math
+import time
+from collections.abc import Awaitable, Callable
+from functools import partial
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from sensors.models import Sensor
+
+from .models import HydroSystem
+
+HITS_KEY = "response-cache:hits"
+MISSES_KEY = "response-cache:misses"
+NOT_MODIFIED_KEY = "response-cache:not-modified"
+
+
+def version_key(resource: str, id: int) -> str:
+    return f"version:{resource}:{id}"
+
+
+def new_versions(keys: list[str]) -> dict[str, tuple[str, float]]:
+    modified = time.time()
+    return {key: (uuid4().hex, modified) for key in keys}
+
+
+def get_versions(resources: list[tuple[str, int]]) -> list[tuple[str, float]]:
+    """Return the current (token, modified) of every (resource, id), creating missing ones.
+
+    A missing version is treated as modified now, which at worst makes clients
+    download an unchanged response once more.
+    """
+    keys = [version_key(*resource) for resource in resources]
+    versions = cache.get_many(keys)
+    missing = new_versions([key for key in keys if key not in versions])
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(resources: list[tuple[str, int]]) -> list[tuple[str, float]]:
+    keys = [version_key(*resource) for resource in resources]
+    versions = await cache.aget_many(keys)
+    missing = new_versions([key for key in keys if key not in versions])
+    if missing:
+        await cache.aset_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*resources: tuple[str, int]):
+    """Bump the versions of the resources, cached responses built on them expire."""
+    keys = [version_key(*resource) for resource in resources]
+    cache.set_many(new_versions(keys), timeout=None)
+
+
+def invalidate_on_commit(*resources: tuple[str, int]):
+    transaction.on_commit(partial(invalidate, *resources))
+
+
+def count(key: str):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+async def acount(key: str):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout=None)
+
+
+def get_stats() -> dict:
+    stats = cache.get_many([HITS_KEY, MISSES_KEY, NOT_MODIFIED_KEY])
+    return {
+        "hits": stats.get(HITS_KEY, 0),
+        "misses": stats.get(MISSES_KEY, 0),
+        "not_modified": stats.get(NOT_MODIFIED_KEY, 0),
+    }
+
+
+class CachedResponseMixin:
+    """Serve GET responses from the cache until one of their resources changes.
+
+    Entries are keyed on the view, the user, the full path and the current
+    versions of the resources, so writes only need to bump those versions. The
+    key doubles as the ETag and the newest version as Last-Modified, so
+    conditional requests are answered without touching the database or the
+    serializers.
+    """
+
+    def cached_response(
+        self, request, resources: list[tuple[str, int]], build: Callable[[], Response]
+    ) -> Response:
+        versions = get_versions(resources)
+        entry_key, validators = self.get_validators(request, versions)
+
+        # Only users who were already served the entry get a 304, anybody else
+        # goes through the view and its permission checks.
+        if self.is_conditional(request) and cache.has_key(entry_key):
+            not_modified = self.get_not_modified(request, validators)
+            if not_modified is not None:
+                count(NOT_MODIFIED_KEY)
+                return not_modified
+
+        data = cache.get(entry_key)
+        if data is None:
+            response = build()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(entry_key, data, settings.RESPONSE_CACHE_TIMEOUT)
+            count(MISSES_KEY)
+            return self.get_cached_response(data, validators, "MISS")
+
+        count(HITS_KEY)
+        return self.get_cached_response(data, validators, "HIT")
+
+    async def acached_response(
+        self,
+        request,
+        resources: list[tuple[str, int]],
+        build: Callable[[], Awaitable[Response]],
+    ) -> Response:
+        """cached_response for async views, `build` is awaited."""
+        versions = await aget_versions(resources)
+        entry_key, validators = self.get_validators(request, versions)
+
+        if self.is_conditional(request) and await cache.ahas_key(entry_key):
+            not_modified = self.get_not_modified(request, validators)
+            if not_modified is not None:
+                await acount(NOT_MODIFIED_KEY)
+                return not_modified
+
+        data = await cache.aget(entry_key)
+        if data is None:
+            response = await build()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            await cache.aset(entry_key, data, settings.RESPONSE_CACHE_TIMEOUT)
+            await acount(MISSES_KEY)
+            return self.get_cached_response(data, validators, "MISS")
+
+        await acount(HITS_KEY)
+        return self.get_cached_response(data, validators, "HIT")
+
+    def get_validators(
+        self, request, versions: list[tuple[str, float]]
+    ) -> tuple[str, dict]:
+        """Return the cache key of the response and its ETag and Last-Modified."""
+        key_data = [type(self).__name__, request.user.id, request.get_full_path()]
+        key = hashlib.md5(json.dumps(key_data + versions).encode()).hexdigest()
+        validators = {"ETag": f'"{key}"'}
+        # Last-Modified has whole seconds, rounded up it still covers every
+        # change of that second only once the second is over.
+        last_modified = math.ceil(max(modified for _, modified in versions))
+        if last_modified <= time.time():
+            validators["Last-Modified"] = http_date(last_modified)
+        return f"response:{key}", validators
+
+    def is_conditional(self, request) -> bool:
+        return any(
+            header in request.headers
+            for header in ["If-None-Match", "If-Modified-Since"]
+        )
+
+    def get_not_modified(self, request, validators: dict) -> HttpResponse | None:
+        last_modified = validators.get("Last-Modified")
+        not_modified = get_conditional_response(
+            request,
+            etag=validators["ETag"],
+            last_modified=last_modified and parse_http_date(last_modified),
+        )
+        if not_modified is not None:
+            for header, value in validators.items():
+                not_modified[header] = value
+        return not_modified
+
+    def get_cached_response(
+        self, data, validators: dict, cache_status: str
+    ) -> Response:
+        response = Response(data, status=status.HTTP_200_OK)
+        for header, value in validators.items():
+            response[header] = value
+        response["X-Cache"] = cache_status
+        return response
+
+
+def invalidate_system(sender, instance, **kwargs):
+    invalidate_on_commit(("systems", instance.owner_id), ("system", instance.id))
+
+
+def invalidate_sensor(sender, instance, **kwargs):
+    invalidate_on_commit(
+        ("sensors", instance.system_id), ("measurements", instance.system_id)
+    )
+
+
+def invalidate_deleted_sensor(sender, instance, **kwargs):
+    """Also expire the listings of the owner, the readings of the sensor are gone."""
+    owner_ids = HydroSystem.objects.filter(id=instance.system_id).values_list(
+        "owner_id", flat=True
+    )
+    invalidate_on_commit(
+        ("sensors", instance.system_id),
+        ("measurements", instance.system_id),
+        *[("user-measurements", owner_id) for owner_id in owner_ids],
+    )
+
+
+def invalidate_measurements(sender, measurements: list, **kwargs):
+    systems = (
+        Sensor.objects.filter(
+            id__in={measurement.sensor_id for measurement in measurements}
+        )
+        .values_list("system_id", "system__owner_id")
+        .distinct()
+    )
+    invalidate(
+        *[
+            resource
+            for system_id, owner_id in systems
+            for resource in [
+                ("measurements", system_id),
+                ("user-measurements", owner_id),
+            ]
+        ]
+    )
@@ -0,0 +1,247 @@
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import orjson
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from sensors.models import Measurement, Sensor, SensorTypes
+from systems.models import HydroSystem
+from users.models import User
+
+BENCHMARK_USERNAME = "benchmark_user"
+BENCHMARK_PASSWORD = "benchmarkpassword"
+
+# Scenarios are imported only when they run, each app keeps its own.
+SCENARIOS = {
+    "ingest": "sensors.benchmarks.benchmark_ingest",
+    "queue": "sensors.benchmarks.benchmark_queue",
+    "detail": "systems.benchmarks.benchmark_detail",
+    "rollup": "sensors.benchmarks.benchmark_rollup",
+    "storage": "sensors.benchmarks.benchmark_storage",
+    "events": "sensors.benchmarks.benchmark_events",
+    "serialization": "sensors.benchmarks.benchmark_serialization",
+    "concurrency": "systems.benchmarks.benchmark_concurrency",
+    "connections": "systems.benchmarks.benchmark_connections",
+    "auth": "systems.benchmarks.benchmark_auth",
+    "throttle": "systems.benchmarks.benchmark_throttle",
+}
+
+
+class Command(BaseCommand):
+    help = "Run performance benchmarks against an isolated benchmark dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=SCENARIOS)
+        parser.add_argument(
+            "--rows", type=int, default=1000, help="Number of measurements to use."
+        )
+        parser.add_argument(
+            "--sensors", type=int, default=10, help="Number of benchmark sensors."
+        )
+        parser.add_argument(
+            "--subscribers",
+            type=int,
+            default=200,
+            help="Number of event subscribers, every tenth one never reads.",
+        )
+        parser.add_argument(
+            "--connections",
+            type=int,
+            default=1000,
+            help="Number of concurrent keep-alive connections of the load generator.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds of load per server."
+        )
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(
+            username=BENCHMARK_USERNAME, password=BENCHMARK_PASSWORD
+        )
+        try:
+            self.system = HydroSystem.objects.create(
+                owner=self.user, name="Benchmark system"
+            )
+            self.sensors = Sensor.objects.bulk_create(
+                Sensor(
+                    system=self.system, sensor_type=random.choice(SensorTypes.values)
+                )
+                for _ in range(options["sensors"])
+            )
+            self.subscribers = options["subscribers"]
+            self.connections = options["connections"]
+            self.duration = options["duration"]
+            benchmark = import_string(SCENARIOS[options["scenario"]])
+            # Rate limits would measure the budget of the benchmark user.
+            with override_settings(RATE_LIMITS={}):
+                benchmark(self, options["rows"])
+        finally:
+            self.user.delete()
+
+    def report(self, label: str, rows: int, elapsed: float):
+        self.stdout.write(
+            f"{label}: {rows} rows in {elapsed:.3f}s ({rows / elapsed:.0f} rows/s)"
+        )
+
+    def call_view(self, view, path: str, data: dict, method: str = "post", **kwargs):
+        request = getattr(self.factory, method)(path, data, format="json")
+        force_authenticate(request, user=self.user)
+        response = view(request, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = async_to_sync(await_response)(response)
+        return response
+
+    def create_history(self, rows: int, start: int = 0):
+        now = timezone.now()
+        Measurement.objects.bulk_create(
+            (
+                Measurement(
+                    sensor=self.sensors[index % len(self.sensors)],
+                    value=round(random.uniform(0, 14), 2),
+                    measured_at=now - timedelta(seconds=5 * index),
+                )
+                for index in range(start, start + rows)
+            ),
+            batch_size=10000,
+        )
+
+    def report_load(
+        self, label: str, completed: int, errors: int, latencies: list, elapsed: float
+    ):
+        cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+        p50, p99 = (cuts[49] * 1000, cuts[98] * 1000) if cuts else (0, 0)
+        self.stdout.write(
+            f"{label}: {completed / elapsed:.0f} requests/s, p50 {p50:.0f}ms, "
+            f"p99 {p99:.0f}ms, {errors} errors"
+        )
+
+    @contextmanager
+    def server(self, application: str, interface: str, **environ: str):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                application,
+                "--interface",
+                interface,
+                "--port",
+                str(port),
+                "--backlog",
+                str(self.connections * 2),
+                "--no-access-log",
+                "--log-level",
+                "warning",
+            ],
+            env={**os.environ, "RATE_LIMITS_ENABLED": "0", **environ},
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", port)).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+            yield port
+        finally:
+            process.terminate()
+            process.wait()
+
+    async def load(
+        self, port: int, requests: list[bytes]
+    ) -> tuple[int, int, list[float], float]:
+        """Keep every connection busy sending `requests` in turn for self.duration."""
+        loop = asyncio.get_running_loop()
+        latencies = []
+        errors = 0
+        deadline = loop.time() + self.duration
+
+        async def client(index: int):
+            nonlocal errors
+            writer = None
+            while loop.time() < deadline:
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(
+                            "127.0.0.1", port
+                        )
+                    start = loop.time()
+                    writer.write(requests[index % len(requests)])
+                    index += 1
+                    status_code, keep_alive = await asyncio.wait_for(
+                        self.read_response(reader), timeout=30
+                    )
+                    if status.is_success(status_code):
+                        latencies.append(loop.time() - start)
+                    else:
+                        errors += 1
+                    if not keep_alive:
+                        writer.close()
+                        writer = None
+                except (OSError, ValueError, asyncio.TimeoutError):
+                    errors += 1
+                    if writer is not None:
+                        writer.close()
+                        writer = None
+                    await asyncio.sleep(0.1)
+            if writer is not None:
+                writer.close()
+
+        start = loop.time()
+        await asyncio.gather(*[client(index) for index in range(self.connections)])
+        return len(latencies), errors, latencies, loop.time() - start
+
+    @staticmethod
+    async def read_response(reader: asyncio.StreamReader) -> tuple[int, bool]:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server.")
+        status_code = int(status_line.split()[1])
+        length = None
+        keep_alive = True
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+            elif name.lower() == "connection" and "close" in value.lower():
+                keep_alive = False
+        if length is None:
+            raise ValueError("Responses need a Content-Length.")
+        await reader.readexactly(length)
+        return status_code, keep_alive
+
+    @staticmethod
+    def http_request(
+        method: str, path: str, token: str, data: dict | None = None
+    ) -> bytes:
+        body = orjson.dumps(data) if data is not None else b""
+        return (
+            f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+            f"Authorization: Bearer {token}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        ).encode() + body
+
+
+async def await_response(response):
+    return await response
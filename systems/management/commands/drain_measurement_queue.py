@@ -0,0 +1,79 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sensors.models import Measurement, Sensor
+from sensors.queue import get_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Write readings accepted by the ingestion endpoints in queue mode to the "
+        "database in large batches. Stops after the current batch on SIGTERM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MEASUREMENT_QUEUE_BATCH_SIZE,
+            help="Number of readings written per transaction.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        previous_handler = signal.signal(signal.SIGTERM, self.stop)
+        try:
+            self.drain(options["batch_size"], options["once"])
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    def drain(self, batch_size: int, once: bool):
+        queue = get_queue()
+        while not self.stopping:
+            readings, cursor = queue.read(batch_size)
+            if not readings:
+                if once:
+                    break
+                time.sleep(settings.MEASUREMENT_QUEUE_POLL_INTERVAL)
+                continue
+
+            start = time.perf_counter()
+            written = self.write(readings)
+            elapsed = time.perf_counter() - start
+            queue.ack(cursor, len(readings), elapsed)
+
+            # Only numbers at hand, queue.stats() may read the whole backlog.
+            # The depth is shown by the queue stats endpoint.
+            lag = time.time() - readings[0].enqueued_at
+            self.stdout.write(
+                f"Flushed {written} of {len(readings)} readings in {elapsed:.3f}s "
+                f"({len(readings) / elapsed:.0f} rows/s), lag {lag:.1f}s"
+            )
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def write(self, readings: list) -> int:
+        """Ingest the readings whose sensors still exist, return how many were new."""
+        sensor_ids = set(
+            Sensor.objects.filter(
+                id__in={reading.sensor_id for reading in readings}
+            ).values_list("id", flat=True)
+        )
+        measurements = [
+            Measurement(
+                sensor_id=reading.sensor_id,
+                value=reading.value,
+                measured_at=reading.measured_at,
+            )
+            for reading in readings
+            # Sensors removed after their readings were queued.
+            if reading.sensor_id in sensor_ids
+        ]
+        return len(Measurement.objects.ingest(measurements))
@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import QuerySet, Subquery
+from django.utils import timezone
+
+from sensors.models import Measurement, MeasurementRollup, RollupResolutions, Sensor
+from sensors.partitioning import drop_partitions, is_partitioned
+from systems.models import RetentionPolicy
+
+
+class Command(BaseCommand):
+    help = "Remove raw readings and rollups older than their retention policy allows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MEASUREMENT_RETENTION_BATCH_SIZE,
+            help="Number of rows removed per statement.",
+        )
+
+    def handle(self, *args, **options):
+        # Raw readings are only removed once they are part of the rollups.
+        call_command("rollup_measurements", stdout=self.stdout)
+
+        now = timezone.now()
+        sensors_by_policy = RetentionPolicy.objects.sensors_by_policy()
+        self.drop_old_partitions(sensors_by_policy, now)
+
+        tiers = [
+            ("Raw readings", "raw_days", Measurement.objects.all(), "measured_at"),
+            (
+                "Hourly rollups",
+                "hourly_days",
+                MeasurementRollup.objects.filter(resolution=RollupResolutions.HOUR),
+                "bucket",
+            ),
+            (
+                "Daily rollups",
+                "daily_days",
+                MeasurementRollup.objects.filter(resolution=RollupResolutions.DAY),
+                "bucket",
+            ),
+        ]
+        for label, days_field, queryset, time_field in tiers:
+            deleted = 0
+            start = time.perf_counter()
+            for policy, sensor_ids in sensors_by_policy.items():
+                days = getattr(policy, days_field)
+                if days is None:
+                    continue
+                expired = queryset.filter(
+                    sensor_id__in=sensor_ids,
+                    **{f"{time_field}__lt": now - timedelta(days=days)},
+                )
+                deleted += self.delete_in_batches(expired, options["batch_size"])
+            self.report(label, deleted, time.perf_counter() - start)
+
+    def drop_old_partitions(self, sensors_by_policy: dict, now):
+        """Drop whole partitions older than the longest raw retention of all sensors."""
+        if not is_partitioned() or not sensors_by_policy:
+            return
+        sensor_count = sum(len(sensor_ids) for sensor_ids in sensors_by_policy.values())
+        if sensor_count < Sensor.objects.count():
+            return
+        raw_days = [policy.raw_days for policy in sensors_by_policy]
+        if None in raw_days:
+            return
+
+        for name in drop_partitions(now - timedelta(days=max(raw_days))):
+            self.stdout.write(f"Dropped partition {name}.")
+
+    def delete_in_batches(self, queryset: QuerySet, batch_size: int) -> int:
+        """Delete the rows in short statements, each committed on its own.
+
+        Keeping the outer filter lets Postgres prune partitions and use the
+        (sensor, time) indexes for both the lookup and the delete.
+        """
+        deleted = 0
+        while True:
+            batch = queryset.filter(pk__in=Subquery(queryset.values("pk")[:batch_size]))
+            count, _ = batch.delete()
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+    def report(self, label: str, rows: int, elapsed: float):
+        self.stdout.write(
+            f"{label}: {rows} rows removed in {elapsed:.3f}s "
+            f"({rows / elapsed if elapsed else 0:.0f} rows/s)"
+        )
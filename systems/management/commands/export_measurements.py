@@ -0,0 +1,80 @@
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sensors.models import Measurement
+from sensors.renderers import CSVRenderer, NDJSONRenderer
+from sensors.rows import stream_measurement_columns
+
+RENDERERS = {renderer.format: renderer for renderer in [NDJSONRenderer, CSVRenderer]}
+
+
+class Command(BaseCommand):
+    help = "Export measurements oldest first as NDJSON or CSV with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--system", type=int, help="Only export this system.")
+        parser.add_argument("--sensor", type=int, help="Only export this sensor.")
+        parser.add_argument(
+            "--since",
+            type=datetime.fromisoformat,
+            help="ISO 8601 start, inclusive, in TIME_ZONE without an offset.",
+        )
+        parser.add_argument(
+            "--until",
+            type=datetime.fromisoformat,
+            help="ISO 8601 end, exclusive, in TIME_ZONE without an offset.",
+        )
+        parser.add_argument("--format", choices=list(RENDERERS), default="ndjson")
+        parser.add_argument(
+            "--output", help="File to write to, standard output by default."
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.MEASUREMENT_STREAM_CHUNK_SIZE,
+            help="Number of rows fetched from the database cursor at once.",
+        )
+
+    def handle(self, *args, **options):
+        for bound in ["since", "until"]:
+            if options[bound] and timezone.is_naive(options[bound]):
+                options[bound] = timezone.make_aware(options[bound])
+
+        measurements = Measurement.objects.all()
+        if options["system"]:
+            measurements = measurements.filter(sensor__system_id=options["system"])
+        if options["sensor"]:
+            measurements = measurements.filter(sensor_id=options["sensor"])
+        if options["since"]:
+            measurements = measurements.filter(measured_at__gte=options["since"])
+        if options["until"]:
+            measurements = measurements.filter(measured_at__lt=options["until"])
+
+        exported = 0
+
+        def count(chunks):
+            nonlocal exported
+            for columns in chunks:
+                exported += len(columns["id"])
+                yield columns
+
+        chunks = stream_measurement_columns(measurements, options["chunk_size"])
+        content = RENDERERS[options["format"]]().stream(count(chunks))
+        start = time.perf_counter()
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                output.writelines(content)
+        else:
+            for part in content:
+                self.stdout.write(part.decode(), ending="")
+            self.stdout.flush()
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write(
+            f"{exported} measurements exported in {elapsed:.2f}s "
+            f"({exported / elapsed:.0f} rows/s)"
+        )
@@ -0,0 +1,217 @@
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+from collections.abc import Iterator
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import orjson
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sensors.models import Measurement, Sensor
+from systems.cache import invalidate_measurements
+
+FORMATS = ["csv", "ndjson"]
+MAX_REPORTED_ERRORS = 10
+
+# Everything Measurement.objects.copy needs, much cheaper to build than a model.
+ImportedMeasurement = namedtuple(
+    "ImportedMeasurement", ["sensor_id", "value", "measured_at"]
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import measurements from a CSV or NDJSON file with COPY. Progress is "
+        "saved after every chunk, --resume continues after the last one."
+    )
+
+    value_field = Measurement._meta.get_field("value")
+    max_scaled = 10**value_field.max_digits
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="File with sensor (or sensor_id), value and measured_at of every row.",
+        )
+        parser.add_argument(
+            "--format", choices=FORMATS, help="Defaults to the file extension."
+        )
+        parser.add_argument(
+            "--mapping",
+            help="JSON file mapping the sensor names used in the file to sensor ids.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.MEASUREMENT_IMPORT_CHUNK_SIZE,
+            help="Number of rows loaded per transaction.",
+        )
+        parser.add_argument(
+            "--checkpoint", help="Progress file, defaults to <path>.checkpoint."
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue after the last chunk saved in the checkpoint.",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in FORMATS:
+            raise CommandError("Please provide --format for this file.")
+        checkpoint = Path(options["checkpoint"] or f"{path}.checkpoint")
+
+        self.sensors = self.load_sensors(options["mapping"])
+        progress = {"offset": 0, "line": 0, "imported": 0, "duplicates": 0}
+        if options["resume"] and checkpoint.exists():
+            progress = json.loads(checkpoint.read_text())
+            self.stdout.write(f"Resuming after line {progress['line']}.")
+
+        self.errors = []
+        self.invalid = 0
+        read = 0
+        start = time.perf_counter()
+        with path.open("rb") as file:
+            for chunk, offset, line in self.read_chunks(
+                file, file_format, progress, options["chunk_size"]
+            ):
+                created = Measurement.objects.copy(chunk)
+                invalidate_measurements(Measurement, chunk)
+
+                read += len(chunk)
+                progress.update(offset=offset, line=line)
+                progress["imported"] += created
+                progress["duplicates"] += len(chunk) - created
+                self.save_checkpoint(checkpoint, progress)
+
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"Line {line}: {progress['imported']} rows imported, "
+                    f"{progress['duplicates']} duplicates skipped "
+                    f"({read / elapsed:.0f} rows/s)"
+                )
+
+        checkpoint.unlink(missing_ok=True)
+        for error in self.errors:
+            self.stderr.write(error)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Import finished: {progress['imported']} rows imported, "
+            f"{progress['duplicates']} duplicates and {self.invalid} invalid "
+            f"rows skipped in {elapsed:.2f}s ({read / elapsed:.0f} rows/s)."
+        )
+
+    def load_sensors(self, mapping_path: str | None) -> dict[str, Sensor]:
+        """Resolve every sensor name the file may use before reading any row."""
+        sensors = Sensor.objects.in_bulk()
+        if not mapping_path:
+            return {str(id): sensor for id, sensor in sensors.items()}
+
+        mapping = json.loads(Path(mapping_path).read_text())
+        unknown = sorted({id for id in mapping.values() if id not in sensors})
+        if unknown:
+            raise CommandError(f"Unknown sensor ids in the mapping: {unknown}")
+        return {str(name): sensors[id] for name, id in mapping.items()}
+
+    def read_chunks(
+        self, file, file_format: str, progress: dict, size: int
+    ) -> Iterator[tuple[list[ImportedMeasurement], int, int]]:
+        """Yield chunks of valid measurements with the position after their last line.
+
+        Lines are read in binary so that the offset can be saved and sought to,
+        CSV rows therefore can't span several lines.
+        """
+        header = None
+        if file_format == "csv":
+            header = next(csv.reader([file.readline().decode()]))
+            if not {"value", "measured_at"} <= set(header):
+                raise CommandError("The CSV header needs value and measured_at.")
+        line = progress["line"] or (1 if header else 0)
+        file.seek(max(progress["offset"], file.tell()))
+
+        chunk = []
+        while raw_line := file.readline():
+            line += 1
+            if not raw_line.strip():
+                continue
+            measurement = self.parse(raw_line, header, line)
+            if measurement:
+                chunk.append(measurement)
+            if len(chunk) >= size:
+                yield chunk, file.tell(), line
+                chunk = []
+        if chunk:
+            yield chunk, file.tell(), line
+
+    def parse(
+        self, raw_line: bytes, header: list | None, line: int
+    ) -> ImportedMeasurement | None:
+        try:
+            if header:
+                row = dict(zip(header, next(csv.reader([raw_line.decode()]))))
+            else:
+                row = orjson.loads(raw_line)
+        except (ValueError, UnicodeDecodeError):
+            row = None
+        if not isinstance(row, dict):
+            self.reject(f"Line {line}: not a valid row.")
+            return None
+
+        sensor = self.sensors.get(str(row.get("sensor", row.get("sensor_id"))))
+        if not sensor:
+            self.reject(f"Line {line}: unknown sensor.")
+            return None
+
+        try:
+            value = self.parse_value(row.get("value"))
+            measured_at = self.parse_measured_at(row.get("measured_at"))
+        except ValueError as exc:
+            self.reject(f"Line {line}: {exc}")
+            return None
+        return ImportedMeasurement(sensor.id, value, measured_at)
+
+    def reject(self, error: str):
+        """Count an invalid row, only the first MAX_REPORTED_ERRORS are kept."""
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(error)
+
+    def parse_value(self, value) -> Decimal | None:
+        # Plain parsing instead of DRF fields, which took half of the import time.
+        if value is None or value == "":
+            return None
+        try:
+            value = Decimal(str(value))
+        except InvalidOperation:
+            raise ValueError("A valid number is required.")
+        scaled = value.scaleb(self.value_field.decimal_places)
+        if scaled != scaled.to_integral_value() or abs(scaled) >= self.max_scaled:
+            raise ValueError(
+                f"Value must have at most {self.value_field.max_digits} digits, "
+                f"{self.value_field.decimal_places} of them decimal places."
+            )
+        return value
+
+    def parse_measured_at(self, value) -> datetime:
+        if not isinstance(value, str):
+            raise ValueError("measured_at is required.")
+        try:
+            measured_at = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError("measured_at must be an ISO 8601 datetime.")
+        if timezone.is_naive(measured_at):
+            measured_at = timezone.make_aware(measured_at)
+        return measured_at
+
+    def save_checkpoint(self, checkpoint: Path, progress: dict):
+        # Replaced in one step, an interrupted write never leaves half a file.
+        temporary = checkpoint.with_suffix(".tmp")
+        temporary.write_text(json.dumps(progress))
+        os.replace(temporary, checkpoint)
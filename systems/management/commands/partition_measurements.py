@@ -0,0 +1,56 @@
+from datetime import date, datetime, time
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sensors.partitioning import (
+    convert_to_partitioned,
+    create_partitions,
+    drop_partitions,
+    is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Partition the measurements table by measured_at and maintain its partitions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Rebuild the unpartitioned measurements table. Locks it while copying.",
+        )
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=settings.MEASUREMENT_PARTITIONS_AHEAD,
+            help="Number of future partitions to create.",
+        )
+        parser.add_argument(
+            "--drop-before",
+            type=date.fromisoformat,
+            help="Detach and drop partitions with readings older than this date only.",
+        )
+
+    def handle(self, *args, **options):
+        if options["convert"]:
+            if is_partitioned():
+                raise CommandError("Measurements table is already partitioned.")
+            created = convert_to_partitioned(options["ahead"])
+        elif not is_partitioned():
+            raise CommandError(
+                "Measurements table is not partitioned, run with --convert first."
+            )
+        else:
+            created = create_partitions(options["ahead"])
+
+        for name in created:
+            self.stdout.write(f"Created partition {name}.")
+
+        if options["drop_before"]:
+            before = datetime.combine(options["drop_before"], time(), dt_timezone.utc)
+            for name in drop_partitions(before):
+                self.stdout.write(f"Dropped partition {name}.")
@@ -1,11 +1,30 @@
+import multiprocessing
 import random
+import re
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
 
-from sensors.models import Measurement, Sensor, SensorTypes
+from sensors.models import Measurement, Sensor, SensorLatest, SensorTypes
+from sensors.partitioning import create_partitions, is_partitioned
+from sensors.synthetic import get_generator
+from systems.cache import invalidate
 from systems.models import HydroSystem
 from users.models import User
 
+USERNAME = "test_user"
+PASSWORD = "testpassword"
+SYSTEMS = [
+    ("Important hydro system", "Located in building 4 in area F"),
+    ("Alpha system", "Testing system located in basement."),
+]
 SENSOR_DESCRIPTIONS = [
     "Middle sensor",
     "Right sensor",
@@ -13,75 +32,277 @@ SENSOR_DESCRIPTIONS = [
     "Redundant sensor",
     "Important sensor",
 ]
+SPAN_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 24 * 3600, "w": 7 * 24 * 3600}
+SPAN_RE = re.compile(r"^(\d+)([smhdw])$")
+
+COPY_BUFFER_ROWS = 10000
+LATEST_CHUNK_SIZE = 10000
+
+# The newest reading of a sensor, enough for SensorLatest.objects.refresh.
+LatestReading = namedtuple("LatestReading", ["sensor_id", "value", "measured_at"])
+
+
+def parse_span(value: str) -> timedelta:
+    match = SPAN_RE.match(value)
+    if not match:
+        raise CommandError(
+            f"Invalid span {value!r}, use e.g. 90s, 15m, 12h, 30d or 4w."
+        )
+    amount, unit = match.groups()
+    return timedelta(seconds=int(amount) * SPAN_UNITS[unit])
 
 
 class Command(BaseCommand):
     help = "Populate database with sample data."
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1, help="Number of users.")
+        parser.add_argument(
+            "--systems-per-user",
+            type=int,
+            default=len(SYSTEMS),
+            help="Systems per user.",
+        )
+        parser.add_argument(
+            "--sensors-per-system", type=int, default=5, help="Sensors per system."
+        )
+        parser.add_argument(
+            "--measurements", type=int, default=10, help="Measurements per sensor."
+        )
+        parser.add_argument(
+            "--span",
+            default="1h",
+            help="Time covered by the measurements of every sensor, e.g. 12h or 30d.",
+        )
+        parser.add_argument(
+            "--end",
+            type=datetime.fromisoformat,
+            help="ISO 8601 time of the newest measurements, now by default.",
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Generate the same dataset again with this seed."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1_000_000,
+            help="Approximate number of measurements copied per transaction.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes generating and copying measurements in parallel.",
+        )
+
+    def handle(self, *args, **options):
         self.stdout.write(self.help)
+        span = parse_span(options["span"])
+        seed = options["seed"]
+        if seed is None:
+            seed = random.randrange(2**32)
+        self.stdout.write(f"Using seed {seed}.")
+        self.random = random.Random(seed)
 
-        # Create user
-        user = self.create_superuser()
+        # Create users
+        users = self.create_users(options["users"])
 
         # Populate hydro systems
-        systems = self.populate_systems(user)
+        systems = self.populate_systems(users, options["systems_per_user"])
 
         # Populate sensors
-        sensors = self.populate_sensors(systems)
+        sensors = self.populate_sensors(systems, options["sensors_per_system"], seed)
 
         # Populate measurements
-        self.populate_measurements(sensors)
-
-    def create_superuser(self) -> User:
-        self.stdout.write("Creating test user.")
-        username = "test_user"
-        user = User.objects.filter(username=username).first()
-        if not user:
-            user = User.objects.create_superuser(
-                username=username, password="testpassword"
-            )
+        end = options["end"] or timezone.now()
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        self.populate_measurements(
+            sensors,
+            options["measurements"],
+            span,
+            end,
+            options["batch_size"],
+            options["workers"],
+        )
 
-        self.stdout.write("Test user created successfully.")
-        return user
+        invalidate(
+            *[("systems", user.id) for user in users],
+            *[("user-measurements", user.id) for user in users],
+            *[
+                (resource, system.id)
+                for _, system in systems
+                for resource in ["system", "sensors", "measurements"]
+            ],
+        )
+
+    def create_users(self, count: int) -> list[User]:
+        """Return `count` test users, the first one is the test_user superuser."""
+        self.stdout.write(f"Creating {count} test users.")
+        usernames = [USERNAME] + [f"{USERNAME}_{index}" for index in range(1, count)]
+        existing = User.objects.in_bulk(usernames, field_name="username")
+        if USERNAME not in existing:
+            existing[USERNAME] = User.objects.create_superuser(
+                username=USERNAME, password=PASSWORD
+            )
 
-    def populate_systems(self, user: User) -> list[HydroSystem]:
-        self.stdout.write("Creating 2 test systems.")
-        system_1, created = HydroSystem.objects.get_or_create(
-            owner=user,
-            name="Important hydro system",
-            defaults={"description": "Located in building 4 in area F"},
+        # Hashing is slow on purpose, every generated user shares one hash.
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(username=username, password=password)
+            for username in usernames
+            if username not in existing
         )
-        system_2, created = HydroSystem.objects.get_or_create(
-            owner=user,
-            name="Alpha system",
-            defaults={"description": "Testing system located in basement."},
+        users = User.objects.in_bulk(usernames, field_name="username")
+        self.stdout.write("Test users created successfully.")
+        return [users[username] for username in usernames]
+
+    def populate_systems(
+        self, users: list[User], per_user: int
+    ) -> list[tuple[str, HydroSystem]]:
+        """Return every user's systems with a key that stays the same between runs."""
+        self.stdout.write(f"Creating {per_user} test systems per user.")
+        names = SYSTEMS[:per_user] + [
+            (f"System {index + 1}", "Generated system.")
+            for index in range(len(SYSTEMS), per_user)
+        ]
+        existing = self.get_systems(users, names)
+        HydroSystem.objects.bulk_create(
+            HydroSystem(owner=user, name=name, description=description)
+            for user in users
+            for name, description in names
+            if (user.id, name) not in existing
         )
+        existing = self.get_systems(users, names)
         self.stdout.write("Hydro systems created successfully.")
-        return [system_1, system_2]
+        return [
+            (f"{user_index}:{system_index}", existing[user.id, name])
+            for user_index, user in enumerate(users)
+            for system_index, (name, _) in enumerate(names)
+        ]
 
-    def populate_sensors(self, systems: list[HydroSystem]) -> list[Sensor]:
-        self.stdout.write("Creating 5 sensors per hydro system.")
+    def get_systems(
+        self, users: list[User], names: list[tuple[str, str]]
+    ) -> dict[tuple[int, str], HydroSystem]:
+        systems = HydroSystem.objects.filter(
+            owner__in=users, name__in=[name for name, _ in names]
+        )
+        return {(system.owner_id, system.name): system for system in systems}
+
+    def populate_sensors(
+        self, systems: list[tuple[str, HydroSystem]], per_system: int, seed: int
+    ) -> list[tuple[str, Sensor]]:
+        """Create sensors, each with the seed of its own signal generator."""
+        self.stdout.write(f"Creating {per_system} sensors per hydro system.")
+        seeds = []
         sensors = []
-        for system in systems:
-            for i in range(5):
-                sensor = Sensor.objects.create(
-                    system=system,
-                    sensor_type=random.choice(
-                        [choice[0] for choice in SensorTypes.choices]
-                    ),
-                    description=random.choice(SENSOR_DESCRIPTIONS),
+        for key, system in systems:
+            for index in range(per_system):
+                seeds.append(f"{seed}:{key}:{index}")
+                sensors.append(
+                    Sensor(
+                        system=system,
+                        sensor_type=self.random.choice(SensorTypes.values),
+                        description=self.random.choice(SENSOR_DESCRIPTIONS),
+                    )
                 )
-                sensors.append(sensor)
-
+        sensors = Sensor.objects.bulk_create(sensors)
         self.stdout.write("Sensors created successfully.")
-        return sensors
-
-    def populate_measurements(self, sensors: list[Sensor]):
-        self.stdout.write("Creating 10 measurements per sensor.")
-        for sensor in sensors:
-            for i in range(10):
-                Measurement.objects.create(
-                    sensor=sensor, value=round(random.uniform(-100, 100), 2)
+        return list(zip(seeds, sensors))
+
+    def populate_measurements(
+        self,
+        sensors: list[tuple[str, Sensor]],
+        count: int,
+        span: timedelta,
+        end: datetime,
+        batch_size: int,
+        workers: int,
+    ):
+        total = count * len(sensors)
+        self.stdout.write(
+            f"Creating {count} measurements per sensor, {total} in total."
+        )
+        step = span / max(count - 1, 1)
+        start = end - step * (count - 1)
+        if is_partitioned():
+            create_partitions(settings.MEASUREMENT_PARTITIONS_AHEAD, since=start)
+
+        # Every task copies the readings of whole sensors, about batch_size rows.
+        per_task = max(batch_size // max(count, 1), 1)
+        sensors = [(seed, sensor.id, sensor.sensor_type) for seed, sensor in sensors]
+        tasks = [
+            (sensors[index : index + per_task], count, start, step)
+            for index in range(0, len(sensors), per_task)
+        ]
+
+        latest = []
+        copied = 0
+        started = time.perf_counter()
+        if workers > 1:
+            # Forked workers must not share the connection of this process.
+            connections.close_all()
+            pool = multiprocessing.get_context("fork").Pool(workers)
+            results = pool.imap_unordered(copy_measurements, tasks)
+        else:
+            pool = None
+            results = map(copy_measurements, tasks)
+        try:
+            for rows, task_latest in results:
+                latest += task_latest
+                copied += rows
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{copied} of {total} measurements created "
+                    f"({copied / elapsed:.0f} rows/s)"
                 )
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        # Chunked to stay below the limit of query parameters.
+        for index in range(0, len(latest), LATEST_CHUNK_SIZE):
+            SensorLatest.objects.refresh(latest[index : index + LATEST_CHUNK_SIZE])
         self.stdout.write("Measurements created successfully.")
+
+
+def copy_measurements(task: tuple) -> tuple[int, list[LatestReading]]:
+    """Generate and COPY the readings of some sensors in one transaction.
+
+    Rows are formatted as COPY text right away, creating datetimes and letting
+    psycopg adapt every value took longer than storing them. All sensors of a
+    task share their timestamps, so those are formatted once.
+    Returns the number of rows and the newest reading of every sensor.
+    """
+    sensors, count, start, step = task
+    places = Measurement._meta.get_field("value").decimal_places
+    stamps = [(start + step * index).isoformat() for index in range(count)]
+
+    latest = []
+    table = Measurement._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        with cursor.copy(
+            f"COPY {table} (sensor_id, value, measured_at) FROM STDIN"
+        ) as copy:
+            for seed, sensor_id, sensor_type in sensors:
+                generator = get_generator(sensor_type, seed)
+                values = generator.values(
+                    start.timestamp(), step.total_seconds(), count
+                )
+                buffer = []
+                text = None
+                for value, stamp in zip(values, stamps):
+                    text = f"{value:.{places}f}"
+                    buffer.append(f"{sensor_id}\t{text}\t{stamp}\n")
+                    if len(buffer) == COPY_BUFFER_ROWS:
+                        copy.write("".join(buffer))
+                        buffer.clear()
+                copy.write("".join(buffer))
+                if text is not None:
+                    latest.append(
+                        LatestReading(
+                            sensor_id, Decimal(text), start + step * (count - 1)
+                        )
+                    )
+    return len(sensors) * count, latest
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from sensors.models import Measurement, MeasurementRollup, RollupWatermark
+from systems.models import RetentionPolicy
+
+
+class Command(BaseCommand):
+    help = "Update hourly and daily measurement rollups with new measurements."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MEASUREMENT_ROLLUP_BATCH_SIZE,
+            help="Number of measurement ids processed per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        watermark, _ = RollupWatermark.objects.get_or_create(
+            name=RollupWatermark.MEASUREMENTS
+        )
+        newest_id = Measurement.objects.aggregate(Max("id"))["id__max"] or 0
+        now = timezone.now()
+        raw_cutoffs = RetentionPolicy.objects.cutoffs("raw_days", now)
+        hourly_cutoffs = RetentionPolicy.objects.cutoffs("hourly_days", now)
+
+        # Rows with lower ids may commit after rows with higher ones, so the
+        # first batch looks back a little behind the watermark.
+        start_id = max(
+            watermark.measurement_id - settings.MEASUREMENT_ROLLUP_OVERLAP, 0
+        )
+        processed = 0
+        start = time.perf_counter()
+        while watermark.measurement_id < newest_id:
+            end_id = min(watermark.measurement_id + options["batch_size"], newest_id)
+            with transaction.atomic():
+                MeasurementRollup.objects.refresh(
+                    start_id, end_id, raw_cutoffs, hourly_cutoffs
+                )
+                watermark.measurement_id = end_id
+                watermark.save()
+
+            processed += end_id - start_id
+            start_id = end_id
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Rollups updated up to measurement {watermark.measurement_id}, "
+            f"{processed} ids processed in {elapsed:.2f}s."
+        )
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("systems", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RetentionPolicy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "sensor_type",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("ph", "Ph"),
+                            ("temperature", "Temperature"),
+                            ("tds", "Tds"),
+                        ],
+                        max_length=11,
+                        null=True,
+                    ),
+                ),
+                ("raw_days", models.PositiveIntegerField(blank=True, null=True)),
+                ("hourly_days", models.PositiveIntegerField(blank=True, null=True)),
+                ("daily_days", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "system",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="retention_policies",
+                        to="systems.hydrosystem",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "retention policies",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="retentionpolicy",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.comparison.Coalesce("system", 0),
+                django.db.models.functions.comparison.Coalesce(
+                    "sensor_type", models.Value("")
+                ),
+                name="unique_retention_policy_scope",
+            ),
+        ),
+    ]
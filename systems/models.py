@@ -1,6 +1,11 @@
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+
 from django.db import models
+from django.db.models.functions import Coalesce
 
-from sensors.models import Measurement, Sensor
+from sensors.models import Sensor, SensorTypes
 from users.models import User
 
 
@@ -12,15 +17,123 @@ class HydroSystem(models.Model):
     description = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
-    def get_last_ten_measurements(self) -> list[Measurement]:
-        sensors = Sensor.objects.filter(system=self)
-        measurements = Measurement.objects.filter(sensor__in=sensors).order_by(
-            "measured_at"
-        )
-        return measurements[:10]
-
     def __str__(self):
         return f"System with ID {self.id} owned by {self.owner}"
 
     class Meta:
         unique_together = ["owner", "name"]
+
+
+class RetentionPolicyManager(models.Manager):
+    def sensors_by_policy(self) -> dict["RetentionPolicy", list[int]]:
+        """Group sensor ids by the policy applying to them.
+
+        The most specific policy wins: system and sensor type, then system, then
+        sensor type, then the policy without either. Sensors without any policy
+        are left out, their readings are kept forever.
+        """
+        policies = {
+            (policy.system_id, policy.sensor_type): policy for policy in self.all()
+        }
+        if not policies:
+            return {}
+
+        sensors = {}
+        for sensor_id, system_id, sensor_type in Sensor.objects.values_list(
+            "id", "system_id", "sensor_type"
+        ):
+            for scope in [
+                (system_id, sensor_type),
+                (system_id, None),
+                (None, sensor_type),
+                (None, None),
+            ]:
+                if scope in policies:
+                    sensors.setdefault(policies[scope], []).append(sensor_id)
+                    break
+        return sensors
+
+    def cutoffs(self, days_field: str, now: datetime) -> dict[int, datetime]:
+        """Map sensor ids to the time before which their `days_field` data is removed."""
+        return {
+            sensor_id: now - timedelta(days=getattr(policy, days_field))
+            for policy, sensor_ids in self.sensors_by_policy().items()
+            if getattr(policy, days_field) is not None
+            for sensor_id in sensor_ids
+        }
+
+
+class RetentionPolicy(models.Model):
+    """How many days of raw readings, hourly and daily rollups are kept.
+
+    Empty system or sensor type makes the policy apply to all of them, an empty
+    number of days keeps that data forever.
+    """
+
+    system = models.ForeignKey(
+        "systems.HydroSystem",
+        on_delete=models.CASCADE,
+        related_name="retention_policies",
+        null=True,
+        blank=True,
+    )
+    sensor_type = models.CharField(
+        max_length=11, choices=SensorTypes.choices, null=True, blank=True
+    )
+    raw_days = models.PositiveIntegerField(null=True, blank=True)
+    hourly_days = models.PositiveIntegerField(null=True, blank=True)
+    daily_days = models.PositiveIntegerField(null=True, blank=True)
+
+    objects = RetentionPolicyManager()
+
+    def __str__(self):
+        system = f"system {self.system_id}" if self.system_id else "all systems"
+        return f"Retention of {self.sensor_type or 'all'} sensors in {system}"
+
+    class Meta:
+        verbose_name_plural = "retention policies"
+        constraints = [
+            models.UniqueConstraint(
+                Coalesce("system", 0),
+                Coalesce("sensor_type", models.Value("")),
+                name="unique_retention_policy_scope",
+            )
+        ]
+
+
+class GatewayKeyManager(models.Manager):
+    def create_key(self, system: HydroSystem, name: str) -> tuple["GatewayKey", str]:
+        """Create a key for `system`, return it with the only copy of the secret."""
+        prefix = secrets.token_hex(4)
+        raw_key = f"{prefix}.{secrets.token_urlsafe(32)}"
+        key = self.create(
+            system=system, name=name, prefix=prefix, key_hash=hash_key(raw_key)
+        )
+        return key, raw_key
+
+
+class GatewayKey(models.Model):
+    """API key of a sensor gateway, only accepted for readings of its system.
+
+    Only a digest of the key is stored. Keys are random, so a plain SHA-256
+    is enough and can be looked up directly by its unique index.
+    """
+
+    system = models.ForeignKey(
+        "systems.HydroSystem", on_delete=models.CASCADE, related_name="gateway_keys"
+    )
+    name = models.CharField(max_length=100)
+    # Shown in listings to tell keys apart.
+    prefix = models.CharField(max_length=8)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    objects = GatewayKeyManager()
+
+    def __str__(self):
+        return f"Gateway key {self.prefix} of system {self.system_id}"
+
+
+def hash_key(raw_key: str) -> str:
+    return hashlib.sha256(raw_key.encode()).hexdigest()
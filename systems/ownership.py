@@ -0,0 +1,76 @@
+from django.db import models
+
+from sensors.models import Sensor
+
+from .models import GatewayKey, HydroSystem
+
+
+class OwnershipMixin:
+    """Resolve the systems and sensors of the authenticated user.
+
+    Every lookup is a single query that checks ownership in the same WHERE
+    clause, instead of loading the user's systems first and filtering again.
+    Methods prefixed with `a` are their counterparts for async views.
+    """
+
+    def limit_to_gateway(
+        self, request, queryset: models.QuerySet, system_field: str | None = "system"
+    ) -> models.QuerySet:
+        """Limit requests authenticated with a gateway key to the key's system."""
+        if not isinstance(request.auth, GatewayKey):
+            return queryset
+        field = f"{system_field}_id" if system_field else "id"
+        return queryset.filter(**{field: request.auth.system_id})
+
+    def get_user_system(self, request, id: int) -> HydroSystem | None:
+        return HydroSystem.objects.filter(id=id, owner=request.user).first()
+
+    def get_user_sensor(
+        self, request, id: int, system_id: int | None = None
+    ) -> Sensor | None:
+        """Return the user's sensor, optionally only if it belongs to `system_id`."""
+        sensors = Sensor.objects.select_related("system").filter(
+            id=id, system__owner=request.user
+        )
+        if system_id is not None:
+            sensors = sensors.filter(system_id=system_id)
+        return self.limit_to_gateway(request, sensors).first()
+
+    async def aget_user_system(self, request, id: int) -> HydroSystem | None:
+        return await HydroSystem.objects.filter(id=id, owner=request.user).afirst()
+
+    def is_user_system(self, request, id: int) -> bool:
+        systems = HydroSystem.objects.filter(id=id, owner=request.user)
+        return self.limit_to_gateway(request, systems, system_field=None).exists()
+
+    async def ais_user_system(self, request, id: int) -> bool:
+        return await HydroSystem.objects.filter(id=id, owner=request.user).aexists()
+
+    def filter_user_system(
+        self, request, queryset: models.QuerySet, id: int, system_field: str = "system"
+    ) -> list | None:
+        """Evaluate the queryset limited to the user's system `id`, None if not theirs.
+
+        Ownership is only checked separately when no rows come back.
+        """
+        rows = list(
+            queryset.filter(
+                **{f"{system_field}_id": id, f"{system_field}__owner": request.user}
+            )
+        )
+        if not rows and not self.is_user_system(request, id):
+            return None
+        return rows
+
+    async def afilter_user_system(
+        self, request, queryset: models.QuerySet, id: int, system_field: str = "system"
+    ) -> list | None:
+        rows = [
+            row
+            async for row in queryset.filter(
+                **{f"{system_field}_id": id, f"{system_field}__owner": request.user}
+            )
+        ]
+        if not rows and not await self.ais_user_system(request, id):
+            return None
+        return rows
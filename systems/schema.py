@@ -0,0 +1,16 @@
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+
+
+class GatewayKeyScheme(OpenApiAuthenticationExtension):
+    """Document gateway keys, registered by importing this module."""
+
+    target_class = "systems.authentication.GatewayKeyAuthentication"
+    name = "gatewayKey"
+
+    def get_security_definition(self, auto_schema) -> dict:
+        return {
+            "type": "apiKey",
+            "in": "header",
+            "name": "Authorization",
+            "description": "Gateway key of a system, sent as `Gateway <key>`.",
+        }
@@ -1,16 +1,20 @@
 from rest_framework import serializers
 
+from sensors.models import Measurement
 from sensors.serializers import MeasurementSerializer
 
-from .models import HydroSystem
+from .models import GatewayKey, HydroSystem
 
 
 class HydroMeasurementsSerializer(serializers.ModelSerializer):
     newest_measurements = serializers.SerializerMethodField()
 
     def get_newest_measurements(self, obj) -> MeasurementSerializer(many=True):
-        measurements = obj.get_last_ten_measurements()
-        serializer = MeasurementSerializer(measurements, many=True)
+        # Views fetch the readings of all their systems in one query up front.
+        newest_measurements = self.context.get("newest_measurements")
+        if newest_measurements is None:
+            newest_measurements = Measurement.objects.newest_per_system([obj.id])
+        serializer = MeasurementSerializer(newest_measurements[obj.id], many=True)
         return serializer.data
 
     class Meta:
@@ -36,6 +40,33 @@ class CreateSystemSerializer(serializers.Serializer):
     description = serializers.CharField()
 
 
+class GatewayKeySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GatewayKey
+        fields = ["id", "system", "name", "prefix", "created_at", "revoked_at"]
+
+
+class NewGatewayKeySerializer(GatewayKeySerializer):
+    key = serializers.SerializerMethodField()
+
+    def get_key(self, obj) -> str:
+        # Only stored hashed, the response creating the key is the one chance to read it.
+        return self.context["key"]
+
+    class Meta(GatewayKeySerializer.Meta):
+        fields = GatewayKeySerializer.Meta.fields + ["key"]
+
+
+class CreateGatewayKeySerializer(serializers.Serializer):
+    name = serializers.CharField()
+
+
+class CacheStatsSerializer(serializers.Serializer):
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    not_modified = serializers.IntegerField()
+
+
 class ErrorMessageSerializer(serializers.Serializer):
     error = serializers.CharField()
     errorMessage = serializers.CharField()
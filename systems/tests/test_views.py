@@ -1,12 +1,32 @@
 import json
+import time
+import warnings
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from drf_spectacular.generators import SchemaGenerator
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
-from systems.models import HydroSystem
+from sensors.models import Measurement, Sensor, SensorTypes
+from systems.authentication import verified_keys
+from systems.cache import invalidate
+from systems.models import GatewayKey, HydroSystem, RetentionPolicy, hash_key
+from systems.throttling import LocalBuckets, RedisBuckets, get_buckets
 
 
 @pytest.mark.django_db
@@ -53,6 +73,92 @@ class SystemDetailTest(APITestCase):
 
         assert response_data == expected_response
 
+    def create_measurements(self, system: HydroSystem, count: int) -> list[Sensor]:
+        sensors = [
+            Sensor.objects.create(system=system, sensor_type=sensor_type)
+            for sensor_type in [SensorTypes.PH, SensorTypes.TDS]
+        ]
+        start = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+        Measurement.objects.bulk_create(
+            Measurement(
+                sensor=sensor,
+                value=minute,
+                measured_at=start + timedelta(minutes=minute),
+            )
+            for sensor in sensors
+            for minute in range(count)
+        )
+        return sensors
+
+    def test_newest_measurements_request(self):
+        system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.create_measurements(system, 20)
+
+        response = self.client.get(
+            reverse("system-detail", kwargs={"id": system.id}), {"limit": 3}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        measured_at = [
+            measurement["measured_at"]
+            for measurement in response_data["newest_measurements"]
+        ]
+        assert measured_at == [
+            "2024-04-01T00:19:00Z",
+            "2024-04-01T00:19:00Z",
+            "2024-04-01T00:18:00Z",
+        ]
+
+    def test_newest_measurements_per_sensor_request(self):
+        system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        ph_sensor, tds_sensor = self.create_measurements(system, 20)
+
+        response = self.client.get(
+            reverse("system-detail", kwargs={"id": system.id}), {"per_sensor": 2}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        newest = [
+            (measurement["sensor"], measurement["value"])
+            for measurement in response_data["newest_measurements"]
+        ]
+        assert sorted(newest) == [
+            (ph_sensor.id, "18.00"),
+            (ph_sensor.id, "19.00"),
+            (tds_sensor.id, "18.00"),
+            (tds_sensor.id, "19.00"),
+        ]
+
+    def test_query_count_does_not_depend_on_history(self):
+        system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.create_measurements(system, 50)
+
+        # System lookup and one LATERAL query over the system's sensors.
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("system-detail", kwargs={"id": system.id})
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_invalid_limit_request(self):
+        system = HydroSystem.objects.create(owner=self.user, name="test_system")
+
+        response = self.client.get(
+            reverse("system-detail", kwargs={"id": system.id}), {"limit": "all"}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response_data = json.loads(response.content.decode("utf-8"))
+
+        expected_response = {
+            "error": "INVALID_LIMIT",
+            "errorMessage": "limit must be a number between 1 and 100.",
+        }
+
+        assert response_data == expected_response
+
 
 @pytest.mark.django_db
 class SystemCreateTest(APITestCase):
@@ -122,6 +228,93 @@ class SystemListTest(APITestCase):
 
         assert response_data == expected_response
 
+    def create_systems(self, count: int, readings: int) -> list[HydroSystem]:
+        systems = []
+        start = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+        for index in range(count):
+            system = HydroSystem.objects.create(owner=self.user, name=f"system_{index}")
+            sensors = [
+                Sensor.objects.create(system=system, sensor_type=sensor_type)
+                for sensor_type in [SensorTypes.PH, SensorTypes.TDS]
+            ]
+            Measurement.objects.bulk_create(
+                Measurement(
+                    sensor=sensor,
+                    value=minute,
+                    measured_at=start + timedelta(minutes=minute),
+                )
+                for sensor in sensors
+                for minute in range(readings)
+            )
+            systems.append(system)
+        return systems
+
+    def test_include_measurements_request(self):
+        systems = self.create_systems(2, 20)
+        HydroSystem.objects.create(owner=self.user, name="empty_system")
+
+        response = self.client.get(
+            reverse("system-list"), {"include": "measurements", "limit": 3}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        response_data = {system["name"]: system for system in response.data}
+        assert response_data["empty_system"]["newest_measurements"] == []
+        for system in systems:
+            measurements = response_data[system.name]["newest_measurements"]
+            expected = Measurement.objects.filter(sensor__system=system).order_by(
+                "-measured_at", "-id"
+            )[:3]
+            assert [measurement["id"] for measurement in measurements] == [
+                measurement.id for measurement in expected
+            ]
+            assert measurements[0]["value"] == "19.00"
+
+    def test_include_measurements_per_sensor_request(self):
+        (system,) = self.create_systems(1, 20)
+
+        response = self.client.get(
+            reverse("system-list"), {"include": "measurements", "per_sensor": 2}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        measurements = response.data[0]["newest_measurements"]
+        # Both sensors read at the same minutes, their newest two are the newest four.
+        expected = Measurement.objects.filter(sensor__system=system).order_by(
+            "-measured_at", "-id"
+        )[:4]
+        assert [measurement["id"] for measurement in measurements] == [
+            measurement.id for measurement in expected
+        ]
+
+    def test_include_measurements_query_count(self):
+        self.create_systems(10, 5)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("system-list"), {"include": "measurements"}
+            )
+
+        assert len(response.data) == 10
+
+    def test_include_measurements_is_invalidated(self):
+        (system,) = self.create_systems(1, 1)
+        sensor = system.sensor.first()
+        params = {"include": "measurements"}
+        self.client.get(reverse("system-list"), params)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Measurement.objects.ingest([Measurement(sensor=sensor, value=7)])
+
+        response = self.client.get(reverse("system-list"), params)
+        assert response["X-Cache"] == "MISS"
+        assert response.data[0]["newest_measurements"][0]["value"] == "7.00"
+
+    def test_invalid_include_request(self):
+        response = self.client.get(reverse("system-list"), {"include": "sensors"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["error"] == "INVALID_INCLUDE"
+
 
 @pytest.mark.django_db
 class SystemDeleteTest(APITestCase):
@@ -160,3 +353,805 @@ class SystemDeleteTest(APITestCase):
         }
 
         assert response_data == expected_response
+
+
+@pytest.mark.django_db
+class ExportMeasurementsTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.ph_sensor, self.tds_sensor = [
+            Sensor.objects.create(system=self.system, sensor_type=sensor_type)
+            for sensor_type in [SensorTypes.PH, SensorTypes.TDS]
+        ]
+        start = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+        Measurement.objects.bulk_create(
+            Measurement(
+                sensor=sensor, value=hour, measured_at=start + timedelta(hours=hour)
+            )
+            for sensor in [self.ph_sensor, self.tds_sensor]
+            for hour in range(24)
+        )
+
+    def test_export_to_stdout(self):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "export_measurements",
+            "--sensor",
+            str(self.ph_sensor.id),
+            "--since",
+            "2024-04-01T12:00:00+00:00",
+            "--chunk-size",
+            "5",
+            stdout=out,
+            stderr=err,
+        )
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [row["value"] for row in rows] == [
+            f"{hour}.00" for hour in range(12, 24)
+        ]
+        assert "12 measurements exported" in err.getvalue()
+
+    def test_export_naive_range(self):
+        out = StringIO()
+        with warnings.catch_warnings():
+            # Naive datetimes in queries only warn.
+            warnings.simplefilter("error", RuntimeWarning)
+            call_command(
+                "export_measurements",
+                "--sensor",
+                str(self.ph_sensor.id),
+                "--since",
+                "2024-04-01T10:00:00",
+                "--until",
+                "2024-04-01T12:00:00",
+                stdout=out,
+                stderr=StringIO(),
+            )
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [row["measured_at"] for row in rows] == [
+            "2024-04-01T10:00:00Z",
+            "2024-04-01T11:00:00Z",
+        ]
+
+    def test_export_csv_to_file(self):
+        path = Path(self.enterContext(TemporaryDirectory())) / "measurements.csv"
+        call_command(
+            "export_measurements",
+            "--system",
+            str(self.system.id),
+            "--format",
+            "csv",
+            "--output",
+            str(path),
+            stderr=StringIO(),
+        )
+
+        lines = path.read_text().splitlines()
+        assert lines[0] == "id,value,measured_at,sensor"
+        assert len(lines) == 1 + 48
+
+
+@pytest.mark.django_db
+class ImportMeasurementsTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+        self.directory = Path(self.enterContext(TemporaryDirectory()))
+
+    def write(self, name: str, lines: list[str]) -> str:
+        path = self.directory / name
+        path.write_text("\n".join(lines) + "\n")
+        return str(path)
+
+    def import_measurements(self, *args) -> (str, str):
+        out, err = StringIO(), StringIO()
+        call_command("import_measurements", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import(self):
+        Measurement.objects.create(
+            sensor=self.sensor,
+            value=1,
+            measured_at=datetime(2024, 4, 1, 0, 1, tzinfo=dt_timezone.utc),
+        )
+        path = self.write(
+            "history.csv",
+            ["sensor,value,measured_at"]
+            + [
+                f"{self.sensor.id},{minute}.5,2024-04-01T00:0{minute}:00Z"
+                for minute in range(4)
+            ]
+            + [
+                f"{self.sensor.id},abc,2024-04-01T00:05:00Z",
+                "999999,1,2024-04-01T00:06:00Z",
+            ],
+        )
+
+        out, err = self.import_measurements(path, "--chunk-size", "2")
+
+        assert "3 rows imported, 1 duplicates and 2 invalid rows skipped" in out
+        assert "Line 6: A valid number is required." in err
+        assert "Line 7: unknown sensor." in err
+        values = Measurement.objects.order_by("measured_at").values_list(
+            "value", flat=True
+        )
+        assert list(values) == [Decimal("0.5"), 1, Decimal("2.5"), Decimal("3.5")]
+        assert self.sensor.latest.value == Decimal("3.5")
+        assert not Path(f"{path}.checkpoint").exists()
+
+    def test_only_first_errors_are_kept(self):
+        path = self.write(
+            "history.csv",
+            ["sensor,value,measured_at"]
+            + [f"999999,1,2024-04-01T00:{minute:02d}:00Z" for minute in range(15)],
+        )
+
+        out, err = self.import_measurements(path)
+
+        assert "0 rows imported, 0 duplicates and 15 invalid rows skipped" in out
+        assert err.splitlines() == [
+            f"Line {line}: unknown sensor." for line in range(2, 12)
+        ]
+
+    def test_ndjson_import_with_mapping(self):
+        mapping = self.write("mapping.json", [json.dumps({"tank-ph": self.sensor.id})])
+        path = self.write(
+            "history.ndjson",
+            [
+                json.dumps(
+                    {
+                        "sensor": "tank-ph",
+                        "value": 0,
+                        "measured_at": "2024-04-01T00:00:00Z",
+                    }
+                ),
+                json.dumps(
+                    {
+                        "sensor": "tank-ph",
+                        "value": None,
+                        "measured_at": "2024-04-01T00:01:00Z",
+                    }
+                ),
+            ],
+        )
+
+        self.import_measurements(path, "--mapping", mapping)
+
+        assert list(
+            Measurement.objects.order_by("measured_at").values_list("value", flat=True)
+        ) == [0, None]
+
+    def test_unknown_sensor_in_mapping(self):
+        mapping = self.write("mapping.json", [json.dumps({"tank-ph": 999999})])
+        path = self.write("history.ndjson", [])
+
+        with self.assertRaisesMessage(CommandError, "[999999]"):
+            self.import_measurements(path, "--mapping", mapping)
+
+    def test_resume_after_failure(self):
+        path = self.write(
+            "history.csv",
+            ["sensor,value,measured_at"]
+            + [
+                f"{self.sensor.id},{minute},2024-04-01T00:{minute:02d}:00Z"
+                for minute in range(10)
+            ],
+        )
+        copy = Measurement.objects.copy
+        calls = []
+
+        def copy_once(chunk):
+            if calls:
+                raise RuntimeError("connection lost")
+            calls.append(chunk)
+            return copy(chunk)
+
+        with patch.object(Measurement.objects, "copy", side_effect=copy_once):
+            with self.assertRaises(RuntimeError):
+                self.import_measurements(path, "--chunk-size", "4")
+        assert Measurement.objects.count() == 4
+
+        out, _ = self.import_measurements(path, "--chunk-size", "4", "--resume")
+
+        assert "Resuming after line 5." in out
+        assert "10 rows imported" in out
+        assert Measurement.objects.count() == 10
+
+
+@pytest.mark.django_db
+class PopulateDBTest(APITestCase):
+    end = datetime(2024, 4, 1, 12, tzinfo=dt_timezone.utc)
+
+    def populate(self, *args):
+        call_command(
+            "populatedb", "--end", self.end.isoformat(), *args, stdout=StringIO()
+        )
+
+    def readings(self, sensors) -> list:
+        return [
+            (
+                sensor.system.name,
+                sensor.sensor_type,
+                list(
+                    sensor.measurement.order_by("measured_at").values_list(
+                        "value", flat=True
+                    )
+                ),
+            )
+            for sensor in sensors
+        ]
+
+    def test_dataset_size(self):
+        self.populate(
+            "--users=2",
+            "--systems-per-user=3",
+            "--sensors-per-system=2",
+            "--measurements=5",
+            "--span=4h",
+            "--seed=1",
+        )
+
+        User = get_user_model()
+        self.assertTrue(User.objects.get(username="test_user").is_superuser)
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(HydroSystem.objects.count(), 6)
+        self.assertEqual(Sensor.objects.count(), 12)
+        self.assertEqual(Measurement.objects.count(), 60)
+        sensor = Sensor.objects.first()
+        self.assertEqual(
+            list(sensor.measurement.values_list("measured_at", flat=True)),
+            [self.end - timedelta(hours=hours) for hours in range(4, -1, -1)],
+        )
+        self.assertEqual(sensor.latest.measured_at, self.end)
+
+    def test_same_seed_same_dataset(self):
+        self.populate("--measurements=50", "--span=2d", "--seed=5")
+        first = list(Sensor.objects.order_by("id"))
+        self.populate("--measurements=50", "--span=2d", "--seed=5")
+
+        # Existing users and systems are reused, the sensors are added again.
+        self.assertEqual(get_user_model().objects.count(), 1)
+        self.assertEqual(HydroSystem.objects.count(), 2)
+        second = list(Sensor.objects.exclude(id__in=[s.id for s in first]))
+        self.assertEqual(len(second), 10)
+        self.assertEqual(self.readings(second), self.readings(first))
+
+        self.populate("--measurements=50", "--span=2d", "--seed=6")
+        third = list(Sensor.objects.order_by("-id")[:10])[::-1]
+        self.assertNotEqual(self.readings(third), self.readings(first))
+
+        ranges = {
+            SensorTypes.PH: (Decimal(4), Decimal(8)),
+            SensorTypes.TEMPERATURE: (Decimal(10), Decimal(30)),
+            SensorTypes.TDS: (Decimal(500), Decimal(1500)),
+        }
+        for _, sensor_type, values in self.readings(first + third):
+            low, high = ranges[sensor_type]
+            self.assertTrue(low <= min(values) <= max(values) <= high)
+
+    def test_invalid_span(self):
+        with self.assertRaises(CommandError):
+            self.populate("--span=2 days")
+
+
+@pytest.mark.django_db
+class EnforceRetentionTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.ph_sensor, self.tds_sensor = [
+            Sensor.objects.create(system=self.system, sensor_type=sensor_type)
+            for sensor_type in [SensorTypes.PH, SensorTypes.TDS]
+        ]
+        now = timezone.now()
+        Measurement.objects.ingest(
+            [
+                Measurement(
+                    sensor=sensor, value=day, measured_at=now - timedelta(days=day)
+                )
+                for sensor in [self.ph_sensor, self.tds_sensor]
+                for day in range(100)
+            ]
+        )
+
+    def enforce_retention(self) -> str:
+        out = StringIO()
+        call_command("enforce_retention", "--batch-size", "7", stdout=out)
+        return out.getvalue()
+
+    def test_most_specific_policy_applies(self):
+        RetentionPolicy.objects.create(raw_days=30, hourly_days=60)
+        RetentionPolicy.objects.create(system=self.system, sensor_type=SensorTypes.TDS)
+
+        output = self.enforce_retention()
+
+        assert "Raw readings: 70 rows removed" in output
+        assert "Hourly rollups: 40 rows removed" in output
+        assert "Daily rollups: 0 rows removed" in output
+        assert self.ph_sensor.measurement.count() == 30
+        assert self.tds_sensor.measurement.count() == 100
+        assert self.ph_sensor.rollups.filter(resolution="1h").count() == 60
+        assert self.ph_sensor.rollups.filter(resolution="1d").count() == 100
+
+    def test_late_reading_keeps_expired_buckets(self):
+        RetentionPolicy.objects.create(raw_days=30, hourly_days=60)
+        self.enforce_retention()
+        hourly = self.ph_sensor.rollups.filter(resolution="1h").order_by("bucket")
+        daily = self.ph_sensor.rollups.filter(resolution="1d").order_by("bucket")
+        before = [list(hourly.values()), list(daily.values())]
+
+        late = Measurement(
+            sensor=self.ph_sensor,
+            value=99,
+            measured_at=timezone.now() - timedelta(days=40),
+        )
+        Measurement.objects.ingest([late])
+        call_command("rollup_measurements", stdout=StringIO())
+
+        assert [list(hourly.values()), list(daily.values())] == before
+
+    def test_old_partitions_are_dropped(self):
+        Measurement.objects.ingest(
+            [
+                Measurement(
+                    sensor=self.ph_sensor,
+                    value=1,
+                    measured_at=datetime(2024, 4, 1, tzinfo=dt_timezone.utc),
+                )
+            ]
+        )
+        call_command("partition_measurements", "--convert", stdout=StringIO())
+        RetentionPolicy.objects.create(raw_days=200)
+
+        output = self.enforce_retention()
+
+        assert "Dropped partition sensors_measurement_p2024_04." in output
+        assert "Raw readings: 0 rows removed" in output
+        assert Measurement.objects.count() == 200
+
+
+@pytest.mark.django_db
+class SystemQueryCountTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        Sensor.objects.create(system=self.system, sensor_type=SensorTypes.PH)
+
+    def test_detail_request(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("system-detail", kwargs={"id": self.system.id})
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_detail_request_of_other_user(self):
+        other_user = get_user_model().objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        self.client.force_authenticate(user=other_user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("system-detail", kwargs={"id": self.system.id})
+            )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_update_request(self):
+        with self.assertNumQueries(3):
+            response = self.client.patch(
+                reverse("system-update", kwargs={"id": self.system.id}),
+                {"name": "renamed_system"},
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_list_request(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("system-list"))
+
+        assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class ResponseCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.system = HydroSystem.objects.create(
+                owner=self.user, name="test_system"
+            )
+            self.sensor = Sensor.objects.create(
+                system=self.system, sensor_type=SensorTypes.PH
+            )
+
+    def get_detail(self, headers=None):
+        return self.client.get(
+            reverse("system-detail", kwargs={"id": self.system.id}), headers=headers
+        )
+
+    def test_detail_is_served_from_cache(self):
+        assert self.get_detail()["X-Cache"] == "MISS"
+
+        with self.assertNumQueries(0):
+            response = self.get_detail()
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["X-Cache"] == "HIT"
+        assert response.data["name"] == "test_system"
+
+    def test_update_invalidates_detail_and_list(self):
+        self.get_detail()
+        self.client.get(reverse("system-list"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse("system-update", kwargs={"id": self.system.id}),
+                {"name": "renamed_system"},
+            )
+
+        response = self.get_detail()
+        assert response["X-Cache"] == "MISS"
+        assert response.data["name"] == "renamed_system"
+        response = self.client.get(reverse("system-list"))
+        assert response["X-Cache"] == "MISS"
+        assert response.data[0]["name"] == "renamed_system"
+
+    def test_new_measurement_invalidates_detail(self):
+        self.get_detail()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("new-measurement", kwargs={"id": self.system.id}),
+                data=json.dumps({"sensor_id": self.sensor.id, "value": 6.5}),
+                content_type="application/json",
+            )
+
+        response = self.get_detail()
+        assert response["X-Cache"] == "MISS"
+        assert response.data["newest_measurements"][0]["value"] == "6.50"
+
+    def test_other_systems_stay_cached(self):
+        other_system = HydroSystem.objects.create(owner=self.user, name="other")
+        self.get_detail()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sensor.objects.create(system=other_system, sensor_type=SensorTypes.PH)
+
+        assert self.get_detail()["X-Cache"] == "HIT"
+
+    def test_not_modified_request(self):
+        etag = self.get_detail()["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.get_detail(headers={"If-None-Match": etag})
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response["ETag"] == etag
+        assert not response.content
+
+    def test_not_modified_since_request(self):
+        with patch("systems.cache.time.time", return_value=time.time() + 1):
+            last_modified = self.get_detail()["Last-Modified"]
+
+            with self.assertNumQueries(0):
+                response = self.get_detail(headers={"If-Modified-Since": last_modified})
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response["Last-Modified"] == last_modified
+
+    def test_last_modified_waits_for_end_of_second(self):
+        with patch("systems.cache.time.time", return_value=2000000000.25):
+            invalidate(("system", self.system.id))
+            assert "Last-Modified" not in self.get_detail()
+
+        with patch("systems.cache.time.time", return_value=2000000001):
+            response = self.get_detail()
+        assert response["Last-Modified"] == "Wed, 18 May 2033 03:33:21 GMT"
+
+    def test_modified_request(self):
+        with patch("systems.cache.time.time", return_value=time.time() + 1):
+            response = self.get_detail()
+        headers = {
+            "If-None-Match": response["ETag"],
+            "If-Modified-Since": response["Last-Modified"],
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse("system-update", kwargs={"id": self.system.id}),
+                {"name": "renamed_system"},
+            )
+
+        response = self.get_detail(headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"] != headers["If-None-Match"]
+        assert response.data["name"] == "renamed_system"
+
+    def test_not_modified_request_of_other_user(self):
+        with patch("systems.cache.time.time", return_value=time.time() + 1):
+            headers = {"If-Modified-Since": self.get_detail()["Last-Modified"]}
+        User = get_user_model()
+        other_user = User.objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        self.client.force_authenticate(user=other_user)
+
+        response = self.get_detail(headers=headers)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_stats_request(self):
+        self.get_detail()
+        self.get_detail()
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.get(reverse("cache-stats"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {"hits": 1, "misses": 1, "not_modified": 0}
+
+
+@pytest.mark.django_db
+class GatewayKeyTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+        self.other_system = HydroSystem.objects.create(
+            owner=self.user, name="other_system"
+        )
+        self.other_sensor = Sensor.objects.create(
+            system=self.other_system, sensor_type=SensorTypes.PH
+        )
+
+        response = self.client.post(
+            reverse("key-create", kwargs={"id": self.system.id}), {"name": "gateway"}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        self.key = json.loads(response.content)
+        self.gateway = APIClient()
+        self.gateway.credentials(HTTP_AUTHORIZATION=f"Gateway {self.key['key']}")
+        self.addCleanup(verified_keys.clear)
+
+    def add_measurement(self, system_id: int, sensor_id: int):
+        return self.gateway.post(
+            reverse("new-measurement", kwargs={"id": system_id}),
+            {"sensor_id": sensor_id, "value": 6.5},
+            format="json",
+        )
+
+    def test_create_request(self):
+        assert self.key["name"] == "gateway"
+        assert self.key["system"] == self.system.id
+        assert self.key["key"].startswith(f"{self.key['prefix']}.")
+        key = GatewayKey.objects.get(id=self.key["id"])
+        assert key.key_hash == hash_key(self.key["key"])
+
+        response = self.client.get(reverse("key-list", kwargs={"id": self.system.id}))
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.content)
+        assert [key["id"] for key in response_data] == [self.key["id"]]
+        assert "key" not in response_data[0]
+
+    def test_missing_name_request(self):
+        response = self.client.post(
+            reverse("key-create", kwargs={"id": self.system.id}), {}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert json.loads(response.content)["error"] == "MISSING_NAME"
+
+    def test_other_users_system_request(self):
+        other_user = get_user_model().objects.create_user(
+            username="other_user", password="testpassword123"
+        )
+        self.client.force_authenticate(user=other_user)
+
+        for response in [
+            self.client.post(
+                reverse("key-create", kwargs={"id": self.system.id}),
+                {"name": "gateway"},
+            ),
+            self.client.get(reverse("key-list", kwargs={"id": self.system.id})),
+            self.client.post(reverse("key-revoke", kwargs={"id": self.key["id"]})),
+        ]:
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+            assert json.loads(response.content)["error"] == "INVALID_ID"
+
+    def test_key_adds_measurements(self):
+        response = self.add_measurement(self.system.id, self.sensor.id)
+        assert response.status_code == status.HTTP_201_CREATED
+
+        response = self.gateway.post(
+            reverse("new-measurements-bulk"),
+            {"measurements": [{"sensor_id": self.sensor.id, "value": 6.6}]},
+            format="json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Measurement.objects.filter(sensor=self.sensor).count() == 2
+
+    def test_key_is_limited_to_its_system(self):
+        response = self.add_measurement(self.other_system.id, self.other_sensor.id)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert json.loads(response.content)["error"] == "INVALID_ID"
+
+        response = self.gateway.post(
+            reverse("new-measurements-bulk"),
+            {"measurements": [{"sensor_id": self.other_sensor.id, "value": 6.6}]},
+            format="json",
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert json.loads(response.content)["errors"][0]["error"] == "INVALID_SENSOR_ID"
+        assert not Measurement.objects.exists()
+
+    def test_key_is_limited_to_ingestion(self):
+        response = self.gateway.get(
+            reverse("system-detail", kwargs={"id": self.system.id})
+        )
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_verified_key_is_cached(self):
+        with CaptureQueriesContext(connection) as first:
+            self.add_measurement(self.system.id, self.sensor.id)
+        with CaptureQueriesContext(connection) as second:
+            self.add_measurement(self.system.id, self.sensor.id)
+
+        assert len(second) == len(first) - 1
+
+    def test_invalid_key_request(self):
+        self.gateway.credentials(HTTP_AUTHORIZATION="Gateway invalid")
+        response = self.add_measurement(self.system.id, self.sensor.id)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response["WWW-Authenticate"] == 'Bearer realm="api"'
+
+    def test_revoked_key_request(self):
+        assert self.add_measurement(self.system.id, self.sensor.id).status_code == (
+            status.HTTP_201_CREATED
+        )
+
+        response = self.client.post(
+            reverse("key-revoke", kwargs={"id": self.key["id"]})
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert GatewayKey.objects.get(id=self.key["id"]).revoked_at is not None
+
+        # The key was verified and cached before, revoking it evicts it.
+        response = self.add_measurement(self.system.id, self.sensor.id)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        response = self.client.post(
+            reverse("key-revoke", kwargs={"id": self.key["id"]})
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_schema_documents_gateway_keys(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+
+        assert schema["components"]["securitySchemes"]["gatewayKey"] == {
+            "type": "apiKey",
+            "in": "header",
+            "name": "Authorization",
+            "description": "Gateway key of a system, sent as `Gateway <key>`.",
+        }
+        bulk_create = schema["paths"]["/sensors/measurement/bulk/"]["post"]
+        assert {"gatewayKey": []} in bulk_create["security"]
+
+
+@pytest.mark.django_db
+class RateLimitTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="test_user", password="testpassword123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.system = HydroSystem.objects.create(owner=self.user, name="test_system")
+        self.sensor = Sensor.objects.create(
+            system=self.system, sensor_type=SensorTypes.PH
+        )
+        get_buckets.cache_clear()
+        self.addCleanup(get_buckets.cache_clear)
+        self.addCleanup(verified_keys.clear)
+
+    def add_measurement(self, client: APIClient):
+        return client.post(
+            reverse("new-measurement", kwargs={"id": self.system.id}),
+            {"sensor_id": self.sensor.id, "value": 6.5},
+            format="json",
+        )
+
+    def get_gateway(self) -> APIClient:
+        _, raw_key = GatewayKey.objects.create_key(self.system, "gateway")
+        gateway = APIClient()
+        gateway.credentials(HTTP_AUTHORIZATION=f"Gateway {raw_key}")
+        return gateway
+
+    @override_settings(RATE_LIMITS={"read": {"user": (1, 2)}})
+    def test_read_budget_request(self):
+        url = reverse("system-detail", kwargs={"id": self.system.id})
+        for _ in range(2):
+            assert self.client.get(url).status_code == status.HTTP_200_OK
+
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response["Retry-After"] == "1"
+
+        # Ingestion has a budget of its own.
+        assert self.add_measurement(self.client).status_code == (
+            status.HTTP_201_CREATED
+        )
+
+    @override_settings(RATE_LIMITS={"ingest": {"system": (0.1, 1)}})
+    def test_system_budget_is_shared_by_gateways(self):
+        assert self.add_measurement(self.get_gateway()).status_code == (
+            status.HTTP_201_CREATED
+        )
+
+        response = self.add_measurement(self.get_gateway())
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response["Retry-After"] == "10"
+
+        # Users only draw from their own budget.
+        assert self.add_measurement(self.client).status_code == (
+            status.HTTP_201_CREATED
+        )
+
+    def test_bucket_refills(self):
+        buckets = LocalBuckets()
+        budgets = [("user:1", 2, 2)]
+        with patch("systems.throttling.time.monotonic", return_value=100):
+            assert buckets.take(budgets) == 0
+            assert buckets.take(budgets) == 0
+            assert buckets.take(budgets) == 0.5
+        with patch("systems.throttling.time.monotonic", return_value=100.5):
+            assert buckets.take(budgets) == 0
+            assert buckets.take(budgets) == 0.5
+
+    def test_unavailable_redis_falls_back_to_local_buckets(self):
+        buckets = RedisBuckets("redis://localhost:1/0")
+        budgets = [("user:1", 1, 1)]
+
+        assert buckets.take(budgets) == 0
+        assert buckets.retry_at > 0
+        assert buckets.take(budgets) > 0
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from functools import cache
+
+import redis
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .models import GatewayKey
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "hydro:rate-limit:"
+REDIS_TIMEOUT = 0.5
+# Seconds the buckets of the process stand in after Redis failed.
+REDIS_RETRY_INTERVAL = 5
+
+# Refills every bucket in KEYS at the rate and up to the burst given in ARGV,
+# then takes a token from all of them or from none. Returns the seconds until
+# every bucket has a token again, 0 when they were taken.
+TAKE_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local levels = {}
+local wait = 0
+for index, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[index * 2 - 1])
+    local burst = tonumber(ARGV[index * 2])
+    local bucket = redis.call("HMGET", key, "tokens", "updated")
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+    levels[index] = tokens
+end
+for index, key in ipairs(KEYS) do
+    local tokens = levels[index]
+    if wait == 0 then
+        tokens = tokens - 1
+    end
+    redis.call("HSET", key, "tokens", tostring(tokens), "updated", tostring(now))
+    -- A bucket left alone until it is full again is the same as no bucket.
+    local full_after = tonumber(ARGV[index * 2]) / tonumber(ARGV[index * 2 - 1])
+    redis.call("EXPIRE", key, math.ceil(full_after) + 1)
+end
+return tostring(wait)
+"""
+
+# A bucket key with its refill rate in tokens per second and its size.
+Budget = tuple[str, float, float]
+
+
+class LocalBuckets:
+    """Token buckets in the memory of this process.
+
+    Every process keeps its own, so a budget is multiplied by the number of
+    processes serving the API.
+    """
+
+    def __init__(self):
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.lock = threading.Lock()
+
+    def take(self, budgets: list[Budget]) -> float:
+        """Take a token from every bucket or from none, return seconds to wait."""
+        now = time.monotonic()
+        with self.lock:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in budgets:
+                tokens, updated = self.buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                levels.append(tokens)
+            for (key, _, _), tokens in zip(budgets, levels):
+                self.buckets[key] = (tokens if wait else tokens - 1, now)
+        return wait
+
+
+class RedisBuckets:
+    """Token buckets shared by all processes, updated by one script call.
+
+    While Redis is unavailable requests are limited by the buckets of the
+    process instead of failing.
+    """
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT
+        )
+        self.script = self.client.register_script(TAKE_SCRIPT)
+        self.fallback = LocalBuckets()
+        self.retry_at = 0.0
+
+    def take(self, budgets: list[Budget]) -> float:
+        if time.monotonic() < self.retry_at:
+            return self.fallback.take(budgets)
+        try:
+            wait = self.script(
+                keys=[REDIS_PREFIX + key for key, _, _ in budgets],
+                args=[value for _, rate, burst in budgets for value in (rate, burst)],
+            )
+        except redis.RedisError:
+            logger.warning("Redis is unavailable, rate limiting in process.")
+            self.retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+            return self.fallback.take(budgets)
+        return float(wait)
+
+
+@cache
+def get_buckets() -> LocalBuckets | RedisBuckets:
+    if settings.RATE_LIMIT_REDIS_URL:
+        return RedisBuckets(settings.RATE_LIMIT_REDIS_URL)
+    return LocalBuckets()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Limit requests by the RATE_LIMITS budgets of `scope`.
+
+    Every user has a budget, and the gateway keys of a system share one more.
+    The system in the URL of a user's request is not checked for ownership
+    before throttling, charging it would let anyone use up the budget of
+    someone else's system.
+    """
+
+    scope = None
+
+    def allow_request(self, request, view) -> bool:
+        limits = settings.RATE_LIMITS.get(self.scope, {})
+        budgets = []
+        if limits.get("user") and request.user.is_authenticated:
+            budgets.append((f"{self.scope}:user:{request.user.id}", *limits["user"]))
+        if limits.get("system") and isinstance(request.auth, GatewayKey):
+            budgets.append(
+                (f"{self.scope}:system:{request.auth.system_id}", *limits["system"])
+            )
+        self.wait_time = get_buckets().take(budgets) if budgets else 0.0
+        return not self.wait_time
+
+    def wait(self) -> float:
+        return self.wait_time
+
+
+class IngestRateThrottle(TokenBucketThrottle):
+    scope = "ingest"
+
+
+class ReadRateThrottle(TokenBucketThrottle):
+    scope = "read"
@@ -1,7 +1,8 @@
 from django.urls import path
 
-from .views import (SystemCreateView, SystemDeleteView, SystemDetailView,
-                    SystemListView, SystemUpdateView)
+from .views import (CacheStatsView, GatewayKeyCreateView, GatewayKeyListView,
+                    GatewayKeyRevokeView, SystemCreateView, SystemDeleteView,
+                    SystemDetailView, SystemListView, SystemUpdateView)
 
 urlpatterns = [
     path("create/", SystemCreateView.as_view(), name="system-create"),
@@ -9,4 +10,8 @@ urlpatterns = [
     path("update/<int:id>/", SystemUpdateView.as_view(), name="system-update"),
     path("delete/<int:id>/", SystemDeleteView.as_view(), name="system-delete"),
     path("list/", SystemListView.as_view(), name="system-list"),
+    path("keys/create/<int:id>/", GatewayKeyCreateView.as_view(), name="key-create"),
+    path("keys/list/<int:id>/", GatewayKeyListView.as_view(), name="key-list"),
+    path("keys/revoke/<int:id>/", GatewayKeyRevokeView.as_view(), name="key-revoke"),
+    path("cache/stats/", CacheStatsView.as_view(), name="cache-stats"),
 ]
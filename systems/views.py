@@ -1,13 +1,23 @@
-from drf_spectacular.utils import extend_schema
+from adrf.views import APIView as AsyncAPIView
+from django.conf import settings
+from django.utils import timezone
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from sensors.models import Measurement
 from users.serializers import MessageSerializer
 
-from .models import HydroSystem
-from .serializers import (CreateSystemSerializer, ErrorMessageSerializer,
-                          HydroMeasurementsSerializer, HydroSystemSerializer)
+from .cache import CachedResponseMixin, get_stats
+from .models import GatewayKey, HydroSystem
+from .ownership import OwnershipMixin
+from .serializers import (CacheStatsSerializer, CreateGatewayKeySerializer,
+                          CreateSystemSerializer, ErrorMessageSerializer,
+                          GatewayKeySerializer, HydroMeasurementsSerializer,
+                          HydroSystemSerializer, NewGatewayKeySerializer)
+from .throttling import ReadRateThrottle
 
 
 class SystemCreateView(APIView):
@@ -55,21 +65,62 @@ class SystemCreateView(APIView):
         return cleaned_data, None
 
 
-class SystemDetailView(APIView):
+class NewestMeasurementsMixin:
+    """Validate the params selecting the newest readings of systems."""
+
+    def clean_limits(self, params: dict) -> (dict, int | None):
+        cleaned_data = {"limit": 10, "per_sensor": None}
+        max_value = settings.SYSTEM_DETAIL_MAX_MEASUREMENTS
+        for param in cleaned_data:
+            value = params.get(param)
+            if value is None:
+                continue
+
+            if not value.isdigit() or not 0 < int(value) <= max_value:
+                error_data = {
+                    "error": f"INVALID_{param.upper()}",
+                    "errorMessage": f"{param} must be a number between 1 and {max_value}.",
+                }
+                return error_data, status.HTTP_400_BAD_REQUEST
+            cleaned_data[param] = int(value)
+
+        return cleaned_data, None
+
+
+class SystemDetailView(
+    NewestMeasurementsMixin, OwnershipMixin, CachedResponseMixin, AsyncAPIView
+):
     """Get system's details for specified system id."""
 
+    throttle_classes = [ReadRateThrottle]
     serializer_class = None
 
     @extend_schema(
+        parameters=[
+            OpenApiParameter("limit", int, description="Number of newest readings."),
+            OpenApiParameter(
+                "per_sensor", int, description="Number of newest readings per sensor."
+            ),
+        ],
         responses={
             200: HydroMeasurementsSerializer,
             400: ErrorMessageSerializer,
             404: ErrorMessageSerializer,
         },
     )
-    def get(self, request, id):
-        user_systems = request.user.systems.all()
-        system = user_systems.filter(id=id).first()
+    async def get(self, request, id):
+        data, error = self.clean_limits(request.query_params)
+        if error:
+            return Response(data, status=error)
+
+        return await self.acached_response(
+            request,
+            [("system", id), ("measurements", id)],
+            lambda: self.detail(request, id, data),
+        )
+
+    async def detail(self, request, id: int, data: dict) -> Response:
+        system = await self.aget_user_system(request, id)
 
         if not system:
             response_data = {
@@ -78,11 +129,16 @@ class SystemDetailView(APIView):
                 "id": id,
             }
             return Response(response_data, status=status.HTTP_404_NOT_FOUND)
-        serializer = HydroMeasurementsSerializer(system)
+        newest_measurements = await Measurement.objects.anewest_per_system(
+            [system.id], limit=data["limit"], per_sensor=data["per_sensor"]
+        )
+        serializer = HydroMeasurementsSerializer(
+            system, context={"newest_measurements": newest_measurements}
+        )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class SystemUpdateView(APIView):
+class SystemUpdateView(OwnershipMixin, APIView):
     """Update an existing system's data."""
 
     serializer_class = None
@@ -95,8 +151,7 @@ class SystemUpdateView(APIView):
         },
     )
     def patch(self, request, id):
-        user_systems = request.user.systems.all()
-        system = user_systems.filter(id=id).first()
+        system = self.get_user_system(request, id)
 
         if not system:
             response_data = {
@@ -108,7 +163,7 @@ class SystemUpdateView(APIView):
 
         name = request.data.get("name")
         if name:
-            if user_systems.filter(name=name):
+            if request.user.systems.filter(name=name).exists():
                 response_data = {
                     "error": "INVALID_NAME",
                     "errorMessage": "System with this name already exists.",
@@ -126,7 +181,7 @@ class SystemUpdateView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class SystemDeleteView(APIView):
+class SystemDeleteView(OwnershipMixin, APIView):
     """Delete an existing user's system."""
 
     serializer_class = None
@@ -139,8 +194,7 @@ class SystemDeleteView(APIView):
         },
     )
     def delete(self, request, id):
-        user_systems = request.user.systems.all()
-        system = user_systems.filter(id=id).first()
+        system = self.get_user_system(request, id)
 
         if not system:
             response_data = {
@@ -154,17 +208,171 @@ class SystemDeleteView(APIView):
         return Response(response_data, status=status.HTTP_200_OK)
 
 
-class SystemListView(APIView):
+class SystemListView(NewestMeasurementsMixin, CachedResponseMixin, AsyncAPIView):
     """List all systems that belong to the authenticated user."""
 
+    throttle_classes = [ReadRateThrottle]
     serializer_class = None
 
     @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "include",
+                str,
+                enum=["measurements"],
+                description="Add the newest readings of every system.",
+            ),
+            OpenApiParameter(
+                "limit", int, description="Number of newest readings per system."
+            ),
+            OpenApiParameter(
+                "per_sensor", int, description="Number of newest readings per sensor."
+            ),
+        ],
         responses={
-            200: HydroSystemSerializer(many=True),
+            200: HydroMeasurementsSerializer(many=True),
+            400: ErrorMessageSerializer,
         },
     )
-    def get(self, request):
-        user_systems = request.user.systems.all()
-        serializer = HydroSystemSerializer(user_systems, many=True)
+    async def get(self, request):
+        data, error = self.clean(request.query_params)
+        if error:
+            return Response(data, status=error)
+
+        resources = [("systems", request.user.id)]
+        if data["include_measurements"]:
+            resources.append(("user-measurements", request.user.id))
+        return await self.acached_response(
+            request, resources, lambda: self.list(request, data)
+        )
+
+    async def list(self, request, data: dict) -> Response:
+        user_systems = [system async for system in request.user.systems.all()]
+        if not data["include_measurements"]:
+            serializer = HydroSystemSerializer(user_systems, many=True)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        newest_measurements = await Measurement.objects.anewest_per_system(
+            [system.id for system in user_systems],
+            limit=data["limit"],
+            per_sensor=data["per_sensor"],
+        )
+        serializer = HydroMeasurementsSerializer(
+            user_systems,
+            many=True,
+            context={"newest_measurements": newest_measurements},
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def clean(self, params: dict) -> (dict, int | None):
+        include = params.get("include")
+        if include not in (None, "measurements"):
+            error_data = {
+                "error": "INVALID_INCLUDE",
+                "errorMessage": "include must be measurements.",
+            }
+            return error_data, status.HTTP_400_BAD_REQUEST
+
+        cleaned_data, error = self.clean_limits(params)
+        if error:
+            return cleaned_data, error
+        cleaned_data["include_measurements"] = include == "measurements"
+        return cleaned_data, None
+
+
+class GatewayKeyCreateView(OwnershipMixin, APIView):
+    """Create an API key for a sensor gateway of the user's system."""
+
+    serializer_class = CreateGatewayKeySerializer
+
+    @extend_schema(
+        responses={
+            201: NewGatewayKeySerializer,
+            400: ErrorMessageSerializer,
+            404: ErrorMessageSerializer,
+        },
+    )
+    def post(self, request, id):
+        name = request.data.get("name")
+        if not name:
+            response_data = {
+                "error": "MISSING_NAME",
+                "errorMessage": "Please provide a name for the gateway key.",
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        system = self.get_user_system(request, id)
+        if not system:
+            response_data = {
+                "error": "INVALID_ID",
+                "errorMessage": "System with this ID doesn't exist or you don't have permission to access it.",
+                "id": id,
+            }
+            return Response(response_data, status=status.HTTP_404_NOT_FOUND)
+
+        key, raw_key = GatewayKey.objects.create_key(system, name)
+        serializer = NewGatewayKeySerializer(key, context={"key": raw_key})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class GatewayKeyListView(OwnershipMixin, APIView):
+    """List the gateway keys of the user's system."""
+
+    serializer_class = None
+
+    @extend_schema(
+        responses={200: GatewayKeySerializer(many=True), 404: ErrorMessageSerializer},
+    )
+    def get(self, request, id):
+        keys = self.filter_user_system(request, GatewayKey.objects.order_by("id"), id)
+        if keys is None:
+            response_data = {
+                "error": "INVALID_ID",
+                "errorMessage": "System with this ID doesn't exist or you don't have permission to access it.",
+                "id": id,
+            }
+            return Response(response_data, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = GatewayKeySerializer(keys, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class GatewayKeyRevokeView(APIView):
+    """Revoke a gateway key, requests with it are refused from then on."""
+
+    serializer_class = None
+
+    @extend_schema(
+        request=None,
+        responses={200: MessageSerializer, 404: ErrorMessageSerializer},
+    )
+    def post(self, request, id):
+        key = GatewayKey.objects.filter(
+            id=id, system__owner=request.user, revoked_at__isnull=True
+        ).first()
+        if not key:
+            response_data = {
+                "error": "INVALID_ID",
+                "errorMessage": (
+                    "Active gateway key with this ID doesn't exist or you don't "
+                    "have permission to access it."
+                ),
+                "id": id,
+            }
+            return Response(response_data, status=status.HTTP_404_NOT_FOUND)
+
+        key.revoked_at = timezone.now()
+        key.save(update_fields=["revoked_at"])
+        response_data = {"message": f"Gateway key with id {id} has been revoked."}
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+class CacheStatsView(APIView):
+    """Show hit and miss counts of the response cache, for staff only."""
+
+    serializer_class = None
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses={200: CacheStatsSerializer})
+    def get(self, request):
+        return Response(get_stats(), status=status.HTTP_200_OK)